@@ -1,3 +1,4 @@
+from ducks.compiled import Param  # noqa: F401
 from ducks.concurrent.main import ConcurrentDex  # noqa: F401
 from ducks.concurrent.main import FAIR  # noqa: F401
 from ducks.concurrent.main import READERS  # noqa: F401
@@ -5,6 +6,12 @@ from ducks.concurrent.main import WRITERS  # noqa: F401
 from ducks.constants import ANY  # noqa: F401
 from ducks.exceptions import MissingAttribute  # noqa: F401
 from ducks.frozen.main import FrozenDex  # noqa: F401
+from ducks.frozen.mmap_io import load_mmap  # noqa: F401
+from ducks.frozen.mmap_io import save_mmap  # noqa: F401
+from ducks.journal import load_journal  # noqa: F401
+from ducks.journal import start_journal  # noqa: F401
+from ducks.lazy import LazyResult  # noqa: F401
 from ducks.mutable.main import Dex  # noqa: F401
+from ducks.mutable.observable import Observable  # noqa: F401
 from ducks.pickling import load  # noqa: F401
 from ducks.pickling import save  # noqa: F401
@@ -0,0 +1,80 @@
+"""
+Numeric aggregates, such as sum and percentiles, over the attribute values of query results.
+"""
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Union
+
+import numpy as np
+
+AGGREGATES = ["count", "sum", "min", "max", "mean"]
+
+
+def parse_aggregates(aggs: Dict[Any, Union[str, List[str]]]) -> Dict[Any, List[str]]:
+    """Check the aggregates requested for each attribute, and put each attribute's aggregates in a list.
+
+    Valid aggregates are 'count', 'sum', 'min', 'max', 'mean', and percentiles written like 'p50' or 'p99.9'.
+    """
+    if not isinstance(aggs, dict):
+        raise TypeError(f"Got {type(aggs)}; expected a dict.")
+    parsed = {}
+    for attr, ops in aggs.items():
+        ops = [ops] if isinstance(ops, str) else list(ops)
+        for op in ops:
+            if op not in AGGREGATES and _percentile(op) is None:
+                raise ValueError(
+                    f"Invalid aggregate: {op}. Must be one of {AGGREGATES}, or a percentile such as 'p99'."
+                )
+        parsed[attr] = ops
+    return parsed
+
+
+def compute_aggregates(values: np.ndarray, ops: List[str]) -> Dict[str, Any]:
+    """Compute each aggregate over a numeric array. On an empty array, 'sum' is 0, and the others except 'count'
+    are None."""
+    if values.dtype.kind not in "biuf":
+        raise TypeError(
+            f"Can only aggregate numbers; got values of type {values.dtype}."
+        )
+    percentiles = {op: _percentile(op) for op in ops if op not in AGGREGATES}
+    if percentiles and len(values):
+        # sorts once for all the percentiles
+        qs = np.percentile(values, list(percentiles.values())).tolist()
+        percentiles = dict(zip(percentiles, qs))
+    result = {}
+    for op in ops:
+        if op == "count":
+            result[op] = len(values)
+        elif len(values) == 0:
+            result[op] = 0 if op == "sum" else None
+        elif op == "sum":
+            result[op] = values.sum().item()
+        elif op == "min":
+            result[op] = values.min().item()
+        elif op == "max":
+            result[op] = values.max().item()
+        elif op == "mean":
+            result[op] = values.mean().item()
+        else:
+            result[op] = percentiles[op]
+    return result
+
+
+def values_from_counts(counts: Dict[Any, int]) -> np.ndarray:
+    """Make an array holding each value as many times as it is counted. Values of None are left out."""
+    counts = {val: n for val, n in counts.items() if val is not None}
+    vals = np.array(list(counts), dtype=None if counts else "float64")
+    return np.repeat(vals, list(counts.values()))
+
+
+def _percentile(op: Any) -> Optional[float]:
+    """Get q from a percentile aggregate 'pq', or None if op is not one."""
+    if not isinstance(op, str) or not op.startswith("p"):
+        return None
+    try:
+        q = float(op[1:])
+    except ValueError:
+        return None
+    return q if 0 <= q <= 100 else None
@@ -1,9 +1,14 @@
+from bisect import bisect_left
+from bisect import bisect_right
 from typing import Any
 from typing import Dict
+from typing import Iterator
 from typing import List
 from typing import Tuple
 
 from BTrees.OOBTree import OOBTree
+from ducks.constants import DESCENDING_CHUNK_MIN
+from ducks.constants import DESCENDING_STALE_MAX
 
 
 class BTree:
@@ -15,6 +20,11 @@ class BTree:
      - Provide a nice interface for using >, >=, <, <= to get value ranges.
     """
 
+    # Sorted list of the keys, which get_range_descending walks down by. It may be missing recent changes to the
+    # keys; it's remade once there have been DESCENDING_STALE_MAX of them per key.
+    _sorted_keys = None
+    _key_changes = 0
+
     def __init__(self, d: Dict[Any, Any] = None):
         if d:
             if None in d:
@@ -56,6 +66,64 @@ class BTree:
             min_key, max_key, excludemin=excludemin, excludemax=excludemax
         )
 
+    def get_range_items(
+        self,
+        min_key=None,
+        max_key=None,
+        include_min: bool = True,
+        include_max: bool = True,
+    ) -> List:
+        """Get (key, value) pairs in the range of [min_key, max_key]. Same arguments as get_range."""
+        if len(self) == 0:
+            return []
+        return self.tree.items(
+            min_key, max_key, excludemin=not include_min, excludemax=not include_max
+        )
+
+    def get_range_descending(
+        self,
+        min_key=None,
+        max_key=None,
+        include_min: bool = True,
+        include_max: bool = True,
+    ) -> Iterator:
+        """Get values in the range of [min_key, max_key], like get_range, but starting from the largest key.
+
+        OOBTree only iterates upward, and indexing a range from its end walks every bucket (as of BTrees 6.5). So
+        the range is read from the top down in chunks, each one an upward get_range. The chunks double in size, so
+        a walk that stops early costs about as much as the values it got. Chunk bounds are taken from the sorted
+        list of keys; the values come from the tree, so they're current even when the list isn't.
+        """
+        if len(self) == 0:
+            return iter(())
+        keys = self._sorted_keys
+        if keys is None or self._key_changes > DESCENDING_STALE_MAX * len(keys):
+            keys = list(self.tree.keys())
+            self._sorted_keys = keys
+            self._key_changes = 0
+        return self._descending_chunks(keys, min_key, max_key, include_min, include_max)
+
+    def _descending_chunks(
+        self, keys: List, min_key, max_key, include_min: bool, include_max: bool
+    ) -> Iterator:
+        pos = len(keys)
+        if max_key is not None:
+            pos = (bisect_right if include_max else bisect_left)(keys, max_key)
+        size = DESCENDING_CHUNK_MIN
+        while True:
+            pos -= size
+            size *= 2
+            last = pos <= 0 or (min_key is not None and keys[pos] <= min_key)
+            if last:
+                lower, include_lower = min_key, include_min
+            else:
+                lower, include_lower = keys[pos], True
+            chunk = list(self.get_range(lower, max_key, include_lower, include_max))
+            yield from reversed(chunk)
+            if last:
+                return
+            max_key, include_max = lower, False
+
     def get(self, key, default=None):
         return self.tree.get(key, default)
 
@@ -83,6 +151,7 @@ class BTree:
             key > key
         if key not in self.tree:
             self.length += 1
+            self._key_changes += 1
         self.tree[key] = value
 
     def __getitem__(self, key):
@@ -90,11 +159,19 @@ class BTree:
 
     def __delitem__(self, key):
         self.length -= 1
+        self._key_changes += 1
         del self.tree[key]
 
     def __contains__(self, item):
         return item in self.tree
 
+    def __getstate__(self):
+        # the sorted keys are only a cache, so they aren't saved
+        state = self.__dict__.copy()
+        state.pop("_sorted_keys", None)
+        state.pop("_key_changes", None)
+        return state
+
 
 def range_expr_to_args(expr: Dict[str, Any]) -> Tuple[Any, Any, bool, bool]:
     """
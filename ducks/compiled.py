@@ -0,0 +1,116 @@
+"""
+Compiled queries, which are parsed and validated once and then run many times with different parameter values.
+"""
+from collections import OrderedDict
+from threading import Lock
+from typing import Any
+from typing import Dict
+from typing import Hashable
+from typing import Tuple
+
+from ducks.constants import PLAN_CACHE_SIZE
+from ducks.utils import freeze_query
+from ducks.utils import parse_query
+
+
+class Param:
+    """A placeholder for a value in a query template. Its value is given by name when the compiled query is run.
+
+    Example::
+
+        by_user = dex.compile({'user': Param('user'), 'ts': {'>=': Param('since')}})
+        by_user(user='alice', since=yesterday)
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __eq__(self, other):
+        return type(other) is Param and other.name == self.name
+
+    def __hash__(self):
+        return hash((Param, self.name))
+
+    def __repr__(self):
+        return f"Param({self.name!r})"
+
+
+class QueryPlan:
+    """A query template, standardized and split into match and exclude terms, with the location of each Param."""
+
+    def __init__(self, template: Dict):
+        self.match, self.exclude = parse_query(template)
+        # each slot is (is_match, attr, operator, param name)
+        self.slots = []
+        for is_match, terms in [(True, self.match), (False, self.exclude)]:
+            for attr, expr in terms.items():
+                for op, val in expr.items():
+                    if isinstance(val, Param):
+                        self.slots.append((is_match, attr, op, val.name))
+                    elif isinstance(val, list) and any(
+                        isinstance(v, Param) for v in val
+                    ):
+                        raise ValueError(
+                            f"A Param must stand for a whole value, not a list item. Use {{'in': Param(...)}} instead "
+                            f"of {val}."
+                        )
+        self.param_names = {slot[3] for slot in self.slots}
+
+    def bind(self, params: Dict[str, Any]) -> Tuple[Dict, Dict]:
+        """Get the match and exclude terms, with each Param replaced by its value in params."""
+        if params.keys() != self.param_names:
+            missing = self.param_names.difference(params)
+            extra = set(params).difference(self.param_names)
+            raise TypeError(
+                f"Query parameters do not match. Missing: {sorted(missing)}. Unexpected: {sorted(extra)}."
+            )
+        if not self.slots:
+            return self.match, self.exclude
+        match = {attr: dict(expr) for attr, expr in self.match.items()}
+        exclude = {attr: dict(expr) for attr, expr in self.exclude.items()}
+        for is_match, attr, op, name in self.slots:
+            terms = match if is_match else exclude
+            terms[attr][op] = params[name]
+        return match, exclude
+
+
+class CompiledQuery:
+    """A query made by ``compile()`` on a Dex, FrozenDex, or ConcurrentDex.
+
+    Call it with a keyword argument for each Param in the template to get the matching objects, same as
+    ``dex[query]`` would.
+    """
+
+    def __init__(self, box: Any, plan: QueryPlan):
+        self.box = box
+        self.plan = plan
+
+    def __call__(self, **params: Any) -> Any:
+        match, exclude = self.plan.bind(params)
+        return self.box._find(match, exclude)
+
+
+_plan_cache: "OrderedDict[Hashable, QueryPlan]" = OrderedDict()
+_plan_cache_lock = Lock()
+
+
+def get_plan(template: Dict) -> QueryPlan:
+    """Get the QueryPlan for this template. The most recently used plans are kept in an LRU cache, keyed by the
+    template's structure, so that compiling the same template again skips the parsing."""
+    try:
+        key = freeze_query(template)
+        hash(key)
+    except TypeError:
+        # template contains an unhashable value; can't be cached
+        return QueryPlan(template)
+    with _plan_cache_lock:
+        plan = _plan_cache.get(key)
+        if plan is not None:
+            _plan_cache.move_to_end(key)
+            return plan
+    plan = QueryPlan(template)
+    with _plan_cache_lock:
+        _plan_cache[key] = plan
+        if len(_plan_cache) > PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+    return plan
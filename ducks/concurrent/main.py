@@ -9,7 +9,15 @@ from typing import List
 from typing import Optional
 from typing import Union
 
+from ducks.compiled import CompiledQuery
+from ducks.compiled import get_plan
+from ducks.lazy import LazyResult
+from ducks.mutable.backends import IdSetBackend
 from ducks.mutable.main import Dex
+from ducks.mutable.main import load as m_load
+from ducks.mutable.main import to_saved
+from ducks.utils import use_composites
+from ducks.utils import validate_query
 from readerwriterlock.rwlock import RWLockFair
 from readerwriterlock.rwlock import RWLockRead
 from readerwriterlock.rwlock import RWLockWrite
@@ -27,6 +35,10 @@ class ConcurrentDex:
         objs: Optional[Iterable[Any]] = None,
         on: Iterable[Union[str, Callable]] = None,
         priority: str = READERS,
+        workers: Optional[int] = None,
+        cache_size: Optional[int] = None,
+        backend: Union[str, IdSetBackend, Dict] = "hybrid",
+        reverse_map: Union[bool, Iterable[Union[str, Callable]]] = False,
     ):
         """Contains a Dex instance and a readerwriterlock. Wraps each Dex method in a read or write lock.
 
@@ -34,9 +46,13 @@ class ConcurrentDex:
             objs: see Dex API
             on: see Dex API
             priority: 'readers', 'writers', or 'fair'. Default 'readers'. Change this according to your usage pattern.
+            workers: see Dex API
+            cache_size: see Dex API. Readers share the cache.
+            backend: see Dex API
+            reverse_map: see Dex API
         """
         self.priority = priority
-        self.box = Dex(objs, on)
+        self.box = Dex(objs, on, workers, cache_size, backend, reverse_map)
         if priority == READERS:
             self.lock = RWLockRead()
         elif priority == WRITERS:
@@ -63,7 +79,8 @@ class ConcurrentDex:
                     cfb.box.add(item)  # calls add() on the underlying Dex.
 
         This performs locking only once, versus calling cfb.add() which locks for each item.
-        The same pattern works for update() and remove().
+        The same pattern works for update() and remove(). To add, remove, or update a batch of objects,
+        add_many(), remove_many(), and update_many() lock only once too.
         """
         with self.lock.gen_wlock():
             yield
@@ -77,16 +94,50 @@ class ConcurrentDex:
         """Get a write lock and perform Dex.remove()."""
         with self.write_lock():
             self.box.remove(obj)
+        self._compact_if_due()
 
     def add(self, obj: Any):
         """Get a write lock and perform Dex.add()."""
         with self.write_lock():
             self.box.add(obj)
+        self._compact_if_due()
 
-    def update(self, obj: Any):
+    def update(self, obj: Any, attrs: Optional[Iterable[Union[str, Callable]]] = None):
         """Get a write lock and perform Dex.update()."""
         with self.write_lock():
-            self.box.update(obj)
+            self.box.update(obj, attrs)
+        self._compact_if_due()
+
+    def add_many(self, objs: Iterable[Any]):
+        """Get a write lock and perform Dex.add_many()."""
+        objs = list(objs)
+        with self.write_lock():
+            self.box.add_many(objs)
+        self._compact_if_due()
+
+    def remove_many(self, objs: Iterable[Any]):
+        """Get a write lock and perform Dex.remove_many()."""
+        objs = list(objs)
+        with self.write_lock():
+            self.box.remove_many(objs)
+        self._compact_if_due()
+
+    def update_many(
+        self,
+        objs: Iterable[Any],
+        attrs: Optional[Iterable[Union[str, Callable]]] = None,
+    ):
+        """Get a write lock and perform Dex.update_many()."""
+        objs = list(objs)
+        with self.write_lock():
+            self.box.update_many(objs, attrs)
+        self._compact_if_due()
+
+    def _compact_if_due(self):
+        """Compact the journal, if there is one and its log has outgrown the snapshot. Done after each change, once
+        the write lock is released, so queries go on during compaction."""
+        if self.box.journal is not None:
+            self.box.journal.compact_if_due()
 
     def __len__(self) -> int:
         """Get a read lock and get length of Dex."""
@@ -108,18 +159,85 @@ class ConcurrentDex:
         with self.read_lock():
             return self.box[query]
 
+    def find(
+        self,
+        query: Dict,
+        lazy: bool = False,
+        order_by: Optional[Union[str, Callable]] = None,
+        descending: bool = False,
+        limit: Optional[int] = None,
+    ) -> Union[List[Any], LazyResult]:
+        """Get a read lock and perform Dex.find().
+
+        If lazy, the matching object IDs are found under this read lock, and each chunk of objects is looked up
+        later under its own read lock. Objects that were removed in between are skipped, so the LazyResult may
+        yield fewer objects than its ``len()``.
+        """
+        with self.read_lock():
+            result = self.box.find(query, lazy, order_by, descending, limit)
+        if lazy:
+            return LazyResult(result.obj_ids, self._obj_ids_to_present_objs)
+        return result
+
+    def find_many(self, queries: Iterable[Dict]) -> List[List[Any]]:
+        """Get a read lock once and perform Dex.find_many()."""
+        with self.read_lock():
+            return self.box.find_many(queries)
+
+    def compile(self, query: Dict) -> CompiledQuery:
+        """Perform Dex.compile(). Running the CompiledQuery gets a read lock."""
+        plan = get_plan(query)
+        validate_query(
+            self._indexes, use_composites(self._indexes, plan.match), plan.exclude
+        )
+        return CompiledQuery(self, plan)
+
+    def _find(self, match: Dict, exclude: Dict) -> List[Any]:
+        """Get a read lock and perform Dex._find(). Used by CompiledQuery."""
+        with self.read_lock():
+            return self.box._find(match, exclude)
+
+    def count(self, query: Dict) -> int:
+        """Get a read lock and perform Dex.count()."""
+        with self.read_lock():
+            return self.box.count(query)
+
+    def exists(self, query: Dict) -> bool:
+        """Get a read lock and perform Dex.exists()."""
+        with self.read_lock():
+            return self.box.exists(query)
+
+    def group_counts(self, query: Dict, by: Union[str, Callable]) -> Dict[Any, int]:
+        """Get a read lock and perform Dex.group_counts()."""
+        with self.read_lock():
+            return self.box.group_counts(query, by)
+
+    def aggregate(
+        self, query: Dict, aggs: Dict[Union[str, Callable], Union[str, List[str]]]
+    ) -> Dict[Union[str, Callable], Dict[str, Any]]:
+        """Get a read lock and perform Dex.aggregate()."""
+        with self.read_lock():
+            return self.box.aggregate(query, aggs)
+
+    def _obj_ids_to_present_objs(self, obj_ids: Iterable[int]) -> List[Any]:
+        """Get a read lock and look up the objects that are still in the Dex."""
+        with self.read_lock():
+            obj_map = self.box.obj_map
+            return [obj_map[ptr] for ptr in obj_ids if ptr in obj_map]
+
 
 def save(c_box: ConcurrentDex, filepath: str):
     """Saves a ConcurrentDex to a pickle file."""
-    saved = {
-        "objs": list(c_box.box.obj_map.values()),
-        "on": list(c_box.box._indexes.keys()),
-        "priority": c_box.priority,
-    }
+    with c_box.read_lock():
+        saved = to_saved(c_box.box)
+    saved["priority"] = c_box.priority
     with open(filepath, "wb") as fh:
         pickle.dump(saved, fh)
 
 
 def load(saved: Dict) -> ConcurrentDex:
     """Creates a ConcurrentDex from the pickle file contents."""
-    return ConcurrentDex(saved["objs"], saved["on"], saved["priority"])
+    c_box = ConcurrentDex(on=saved["on"], priority=saved["priority"])
+    c_box.box = m_load(saved)
+    c_box._indexes = c_box.box._indexes
+    return c_box
@@ -3,6 +3,28 @@ SIZE_THRESH = 100
 ARR_TYPE = "q"  # python array type meaning "int64": https://docs.python.org/3/library/array.html
 SET_SIZE_MIN = 10
 ARRAY_SIZE_MAX = 20
+SORTED_BUFFER_MIN = 64  # min number of changes buffered before a SortedBackend merges
+WIDE_RANGE_MIN_VALS = 1000  # min number of values in a Dex index before wide ranges are found by complement
+WIDE_RANGE_OUTSIDE_MAX = 0.25  # most of an index's values that can be outside a range for it to count as wide
+PLAN_CACHE_SIZE = 256  # number of compiled query plans kept in the LRU cache
+LAZY_CHUNK_SIZE = (
+    1000  # number of objects looked up at a time when iterating a LazyResult
+)
+ORDER_BLOCK_SIZE = (
+    1024  # min number of object ids checked at a time when walking an index in order
+)
+STR_WIDTH_MAX = (
+    32  # strings up to this long always go in a fixed-width numpy array in a FrozenDex
+)
+STR_WIDTH_SKEW_MAX = (
+    2  # longer ones only if the longest is at most this many times the mean length
+)
+DESCENDING_CHUNK_MIN = (
+    16  # keys in the first chunk a BTree reads, walking down from the top
+)
+DESCENDING_STALE_MAX = (
+    1 / 16
+)  # key changes per key before a BTree remakes its sorted key list
 
 
 class MatchAnything(set):
@@ -51,3 +73,5 @@ OPERATOR_MAP = {
 }
 
 EXCLUDE_OPERATORS = {"not in": "in", "!=": "=="}
+
+RANGE_OPERATORS = ["<", "<=", ">", ">="]
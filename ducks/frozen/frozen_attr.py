@@ -3,18 +3,42 @@ Performs object lookup for a single attribute in a FrozenDex.
 """
 from bisect import bisect_left
 from bisect import bisect_right
+from datetime import date
+from datetime import datetime
+from typing import Any
 from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
 from typing import Set
+from typing import Tuple
 from typing import Union
 
 import numpy as np
 from ducks.btree import BTree
+from ducks.btree import range_expr_to_args
 from ducks.constants import ANY
+from ducks.constants import RANGE_OPERATORS
 from ducks.constants import SIZE_THRESH
-from ducks.frozen.init_helpers import get_vals
+from ducks.frozen.init_helpers import fits_fixed_width
+from ducks.frozen.init_helpers import make_val_arr
 from ducks.frozen.init_helpers import run_length_encode
+from ducks.frozen.postings import compress_postings
+from ducks.frozen.postings import Postings
+from ducks.frozen.postings import postings_contains
+from ducks.frozen.postings import postings_to_array
 from ducks.utils import make_empty_array
 
+# The ints that each numeric dtype kind holds exactly, as (lowest, highest). Past 2**53, floats skip some ints.
+_EXACT_INT_RANGES = {
+    "b": (-(2**63), 2**63 - 1),
+    "i": (-(2**63), 2**63 - 1),
+    "u": (0, 2**64 - 1),
+    "f": (-(2**53), 2**53),
+}
+
 
 class FrozenAttrIndex:
     """
@@ -24,9 +48,22 @@ class FrozenAttrIndex:
      - none_ids stores all indexes for with the attribute value None
      - val_to_obj_ids stores object ids for attribute values that have many objects
      - val_arr + obj_id_arr store all the rest.
+
+    On creation, ``vals`` holds the attribute value of each object in ``obj_id_arr``. It is either a list, or
+    a typed numpy array when it comes from a column of values that can't contain None.
+
+    If ``n_objs``, the total number of objects in the FrozenDex, is given, then the object ids in val_to_obj_ids
+    are compressed into a bitmap or runs wherever that is smaller than an array.
     """
 
-    def __init__(self, attr: Union[str, Callable], objs: np.ndarray, dtype: str):
+    def __init__(
+        self,
+        attr: Union[str, Callable],
+        obj_id_arr: np.ndarray,
+        vals: Union[List[Any], np.ndarray],
+        dtype: str,
+        n_objs: Optional[int] = None,
+    ):
         # sort the objects by attribute value, using their hashes and handling collisions
         self.dtype = dtype
         self.attr = attr
@@ -38,43 +75,54 @@ class FrozenAttrIndex:
         # Saves memory, and makes object lookups *way* faster.
         self.val_to_obj_ids = BTree()
 
-        obj_id_arr = np.arange(len(objs), dtype=self.dtype)
-        for i in range(len(objs)):
-            obj_id_arr[i] = i
-        obj_id_arr, val_arr = get_vals(objs, obj_id_arr, self.attr)
+        if isinstance(vals, np.ndarray):
+            # a typed column; no Nones possible
+            val_arr = vals
+            if vals.dtype.kind == "U" and not fits_fixed_width(vals.tolist()):
+                # the index keeps a sorted copy, which would be as wide as the longest string for its whole life
+                val_arr = vals.astype("O")
+        else:
+            # extract Nones. These will make the array unsortable if left in.
+            val_types = set(map(type, vals))
+            if type(None) in val_types:
+                none_flag = np.array([v is None for v in vals], dtype="bool")
+                # obj_id_arr is in ascending order, so none_ids will be sorted
+                self.none_ids = obj_id_arr[none_flag]
+                obj_id_arr = obj_id_arr[~none_flag]
+                vals = [v for v in vals if v is not None]
+                val_types.discard(type(None))
+            val_arr = make_val_arr(vals, val_types)
 
-        # extract Nones. These will make the array unsortable if left in.
-        none_idx = np.array(
-            [i for i in range(len(val_arr)) if val_arr[i] is None], dtype=self.dtype
-        )
-        if len(none_idx):
-            none_flag = np.zeros_like(val_arr, dtype="bool")
-            none_flag[none_idx] = True
-            self.none_ids = np.sort(obj_id_arr[none_flag])
-            obj_id_arr = obj_id_arr[~none_flag]
-            val_arr = val_arr[~none_flag]
-
-        # Attempt to sort the values.
-        sort_order = np.argsort(val_arr)  # Throws TypeError if unsortable.
+        # Attempt to sort the values. Throws TypeError if unsortable.
+        # Stable sort keeps each value's obj_ids in ascending order.
+        sort_order = np.argsort(val_arr, kind="stable")
         val_arr = val_arr[sort_order]
         obj_id_arr = obj_id_arr[sort_order]
 
         val_starts, val_run_lengths, unique_vals = run_length_encode(val_arr)
         unused = np.ones_like(obj_id_arr, dtype="bool")
-        n_unused = len(unused)
-        for i, val in enumerate(unique_vals):
-            if val_run_lengths[i] > SIZE_THRESH:
-                # extract these
-                start = val_starts[i]
-                end = start + val_run_lengths[i]
-                unused[start:end] = False
-                n_unused -= val_run_lengths[i]
-                self.val_to_obj_ids[val] = np.sort(obj_id_arr[start:end])
+        big = np.flatnonzero(val_run_lengths > SIZE_THRESH)
+        for i, val in zip(big, unique_vals[big].tolist()):
+            # extract these
+            start = val_starts[i]
+            end = start + val_run_lengths[i]
+            unused[start:end] = False
+            obj_ids = obj_id_arr[start:end]
+            if n_objs is not None:
+                obj_ids = compress_postings(obj_ids, n_objs)
+            self.val_to_obj_ids[val] = obj_ids
         self.val_arr = val_arr[unused]
         self.obj_id_arr = obj_id_arr[unused]
+        self.obj_id_to_rank = None  # built when a query first needs it
+        self.value_codes = None  # built when value_counts first needs it
+        self.value_column = None  # built when aggregate first needs it
 
     def get(self, val) -> np.ndarray:
         """Get indexes of objects whose attribute is val."""
+        return postings_to_array(self.get_postings(val))
+
+    def get_postings(self, val) -> Postings:
+        """Get indexes of objects whose attribute is val. May be a compressed posting list rather than an array."""
         if val is ANY:
             return self.get_all()
         if val is None:
@@ -82,61 +130,212 @@ class FrozenAttrIndex:
         if val in self.val_to_obj_ids:
             return self.val_to_obj_ids[val]
         # find by bisection
-        left = bisect_left(self.val_arr, val)
-        if left == len(self.val_arr) or self.val_arr[left] != val:
+        if val != val:
+            # NaN is not equal to anything, including itself
+            return make_empty_array(self.dtype)
+        left = self._bisect(val, "left")
+        right = self._bisect(val, "right")
+        if left == right:
             return make_empty_array(self.dtype)
-        right = bisect_right(self.val_arr, val)
-        return np.sort(self.obj_id_arr[left:right])
+        # values were stably sorted, so each value's obj_ids are already in order
+        return self.obj_id_arr[left:right]
+
+    def get_many(self, values: Iterable[Any]) -> np.ndarray:
+        """Get indexes of objects whose attribute is any of the values, as one sorted array."""
+        lefts, rights, big, has_none, has_any = self._locate_many(values)
+        if has_any:
+            return self.get_all()
+        # gather the val_arr runs of all the values at once
+        lengths = rights - lefts
+        starts = np.cumsum(lengths) - lengths
+        positions = np.repeat(lefts - starts, lengths) + np.arange(lengths.sum())
+        arrs = [self.obj_id_arr[positions]]
+        arrs.extend(postings_to_array(postings) for postings in big)
+        if has_none:
+            arrs.append(self.none_ids)
+        # each array is sorted, and a stable sort merges sorted runs
+        return np.sort(np.concatenate(arrs), kind="stable")
+
+    def get_each(self, values: List[Any]) -> List[np.ndarray]:
+        """Get indexes of objects whose attribute is each of the values. Same as ``[self.get(v) for v in values]``,
+        but the values of each type are searched for in val_arr in one vectorized pass."""
+        result = [None] * len(values)
+        native_groups = {}
+        for i, val in enumerate(values):
+            if val is None or val is ANY or val in self.val_to_obj_ids:
+                native_val = None
+            else:
+                native_val = self._native_query_val(val)
+            if native_val is None:
+                result[i] = self.get(val)
+            else:
+                positions, group = native_groups.setdefault(type(native_val), ([], []))
+                positions.append(i)
+                group.append(native_val)
+        for positions, group in native_groups.values():
+            query_arr, fits = self._native_query_arr(group)
+            lefts = self.val_arr.searchsorted(query_arr, "left").tolist()
+            rights = self.val_arr.searchsorted(query_arr, "right").tolist()
+            runs = iter(zip(lefts, rights))
+            for i, fit in zip(positions, fits.tolist()):
+                if fit:
+                    left, right = next(runs)
+                    result[i] = self.obj_id_arr[left:right]
+                else:
+                    result[i] = make_empty_array(self.dtype)
+        return result
+
+    def count_many(self, values: Iterable[Any]) -> int:
+        """Get the number of objects whose attribute is any of the values."""
+        lefts, rights, big, has_none, has_any = self._locate_many(values)
+        if has_any:
+            return self.count(ANY)
+        n = int((rights - lefts).sum()) + sum(len(postings) for postings in big)
+        return n + len(self.none_ids) if has_none else n
+
+    def count(self, val) -> int:
+        """Get the number of objects whose attribute is val, without building an array of their indexes."""
+        if val is ANY:
+            n_big = sum(len(v) for v in self.val_to_obj_ids.values())
+            return len(self.obj_id_arr) + n_big + len(self.none_ids)
+        return len(self.get_postings(val))
 
     def get_all(self) -> np.ndarray:
         """Get indexes of every object with this attribute. Used when matching ANY."""
         arrs = [self.obj_id_arr]
         for v in self.val_to_obj_ids.values():
-            arrs.append(v)
+            arrs.append(postings_to_array(v))
         arrs.append(self.none_ids)
         return np.sort(np.concatenate(arrs))
 
     def get_values(self) -> Set:
         """Get each value we have objects for."""
         vals = set(self.val_to_obj_ids.keys())
-        vals = vals.union(self.val_arr)
+        vals = vals.union(self.val_arr.tolist())
         if len(self.none_ids):
             vals.add(None)
         return vals
 
-    def _get_val_arr_matches(self, lo, hi, include_lo=False, include_hi=False):
-        """Get the matches for this range query from the parallel arrays"""
-        if len(self.val_arr) == 0:
-            return make_empty_array(self.dtype)
+    def _bisect(self, val, side: str) -> int:
+        """Find the insertion point of val in val_arr. Uses np.searchsorted when val can be compared to val_arr
+        natively, and falls back to Python comparisons otherwise."""
+        native_val = self._native_query_val(val)
+        if native_val is None:
+            arr = (
+                self.val_arr if self.val_arr.dtype == "O" else PyValueView(self.val_arr)
+            )
+            if side == "left":
+                return bisect_left(arr, val)
+            return bisect_right(arr, val)
+        return int(self.val_arr.searchsorted(native_val, side))
 
-        if lo is None:
-            left = 0
-            lo = self.val_arr[0]
-            include_lo = True
-        else:
-            left = bisect_left(self.val_arr, lo)
+    def _native_query_val(self, val) -> Any:
+        """Convert a query value to something np.searchsorted can compare against val_arr with the same result
+        as a Python comparison. Returns None if that can't be done safely."""
+        kind = self.val_arr.dtype.kind
+        if kind in _EXACT_INT_RANGES:
+            return _native_number(val, kind)
+        if kind == "U":
+            return _native_str(val)
+        if kind == "M":
+            return _native_datetime(val, self.val_arr.dtype)
+        return None
 
-        if hi is None:
-            right = len(self.val_arr)
-            hi = self.val_arr[right - 1]
-            include_hi = True
+    def _native_query_arr(
+        self, native_vals: List[Any]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Make an array of query values of one type, as returned by _native_query_val, to search for in val_arr.
+        Also returns a bool array that is False for the values that were left out because they can't be in val_arr.
+        """
+        kind = self.val_arr.dtype.kind
+        val_type = type(native_vals[0])
+        fits = np.ones(len(native_vals), dtype="bool")
+        dtype = None
+        if val_type is int and kind in "iu":
+            # ints that don't fit the dtype can't match, and would wrap around if cast
+            info = np.iinfo(self.val_arr.dtype)
+            lo, hi = int(info.min), int(info.max)
+            fits = np.array([lo <= v <= hi for v in native_vals], dtype="bool")
+            native_vals = [v for v in native_vals if lo <= v <= hi]
+            dtype = self.val_arr.dtype
+        elif val_type is int and kind == "f":
+            dtype = "float64"
+        elif kind == "M":
+            dtype = self.val_arr.dtype
+        return np.array(native_vals, dtype=dtype), fits
+
+    def _locate_many(
+        self, values: Iterable[Any]
+    ) -> Tuple[np.ndarray, np.ndarray, List[Postings], bool, bool]:
+        """Find where the objects having any of the values are stored. Returns:
+         - the [left, right) bounds of the values' runs in val_arr, sorted, without repeats or empty runs
+         - the postings of the values that are in val_to_obj_ids
+         - whether None is one of the values
+         - whether ANY is one of the values
+        Values that np.searchsorted can compare natively are looked up in one vectorized pass per type.
+        """
+        values = list(values)
+        has_any = any(v is ANY for v in values)
+        has_none = any(v is None for v in values)
+        values = [v for v in values if v is not None and v is not ANY]
+
+        try:
+            value_set = set(values)
+        except TypeError:
+            value_set = None
+        if value_set is not None and len(self.val_to_obj_ids) < len(value_set):
+            big = [p for val, p in self.val_to_obj_ids.items() if val in value_set]
         else:
-            right = bisect_right(self.val_arr, hi)
+            big_vals = {}
+            for val in values:
+                if val in self.val_to_obj_ids:
+                    big_vals[id(self.val_to_obj_ids[val])] = self.val_to_obj_ids[val]
+            big = list(big_vals.values())
 
-        # move left pointer up to fit > constraint
-        if not include_lo:
-            while left < len(self.val_arr) and self.val_arr[left] == lo:
-                left += 1
-        if left == len(self.val_arr):
-            return make_empty_array(self.dtype)
+        native_groups = {}
+        bounds = [(make_empty_array("int64"), make_empty_array("int64"))]
+        for val in values:
+            native_val = self._native_query_val(val)
+            if native_val is not None:
+                native_groups.setdefault(type(native_val), []).append(native_val)
+            elif val == val:
+                # NaN is not equal to anything, so it has no run
+                left, right = self._bisect(val, "left"), self._bisect(val, "right")
+                bounds.append((np.array([left]), np.array([right])))
+        for group in native_groups.values():
+            query_arr, _ = self._native_query_arr(group)
+            query_arr = np.unique(query_arr)
+            bounds.append(
+                (
+                    self.val_arr.searchsorted(query_arr, "left"),
+                    self.val_arr.searchsorted(query_arr, "right"),
+                )
+            )
 
-        # move right pointer down to fit < constraint
-        if not include_hi:
-            while right > left and self.val_arr[right - 1] == hi:
-                right -= 1
+        lefts = np.concatenate([b[0] for b in bounds]).astype("int64")
+        rights = np.concatenate([b[1] for b in bounds]).astype("int64")
+        nonempty = lefts < rights
+        lefts, rights = lefts[nonempty], rights[nonempty]
+        # equal values have the same run, and different values have separate runs; so drop repeated lefts
+        lefts, first = np.unique(lefts, return_index=True)
+        return lefts, rights[first], big, has_none, has_any
 
-        small_matches = self.obj_id_arr[left:right]
-        return small_matches
+    def _val_arr_bounds(self, lo, hi, include_lo=False, include_hi=False):
+        """Get the [left, right) slice of val_arr that holds the values in this range."""
+        left = 0 if lo is None else self._bisect(lo, "left" if include_lo else "right")
+        right = (
+            len(self.val_arr)
+            if hi is None
+            else self._bisect(hi, "right" if include_hi else "left")
+        )
+        return left, max(left, right)
+
+    def _get_val_arr_matches(self, lo, hi, include_lo=False, include_hi=False):
+        """Get the matches for this range query from the parallel arrays"""
+        left, right = self._val_arr_bounds(lo, hi, include_lo, include_hi)
+        if left == right:
+            return make_empty_array(self.dtype)
+        return self.obj_id_arr[left:right]
 
     def get_ids_by_range(
         self, lo, hi, include_lo=False, include_hi=False
@@ -146,9 +345,10 @@ class FrozenAttrIndex:
             return make_empty_array(self.dtype)
 
         # Get matches from the val_to_obj_ids BTree
-        big_matches_list = list(
-            self.val_to_obj_ids.get_range(lo, hi, include_lo, include_hi)
-        )
+        big_matches_list = [
+            postings_to_array(v)
+            for v in self.val_to_obj_ids.get_range(lo, hi, include_lo, include_hi)
+        ]
 
         # Get matches from the parallel arrays
         small_matches = self._get_val_arr_matches(lo, hi, include_lo, include_hi)
@@ -162,5 +362,242 @@ class FrozenAttrIndex:
         matches = np.sort(np.concatenate([small_matches] + big_matches_list))
         return matches
 
+    def value_counts(self, obj_ids: Optional[np.ndarray] = None) -> Dict[Any, int]:
+        """Get the number of objects having each value. If obj_ids is given, only those objects are counted.
+        Values with no objects counted are left out."""
+        if obj_ids is None:
+            _, run_lengths, vals = run_length_encode(self.val_arr)
+            counts = dict(zip(vals.tolist(), run_lengths.tolist()))
+            counts.update(
+                (val, len(postings)) for val, postings in self.val_to_obj_ids.items()
+            )
+            if len(self.none_ids):
+                counts[None] = len(self.none_ids)
+            return counts
+        codes, code_vals = self._value_codes()
+        obj_codes = codes[obj_ids[obj_ids < len(codes)]]
+        n_per_code = np.bincount(obj_codes[obj_codes >= 0], minlength=len(code_vals))
+        return {val: n for val, n in zip(code_vals, n_per_code.tolist()) if n}
+
+    def numeric_values(self, obj_ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """Get the values of the objects as a numeric array, in order of obj_ids. Objects without a value, or with
+        None, are left out. If obj_ids is not given, gets the values of all objects.
+        Raises TypeError if the values aren't all numbers."""
+        column, has_value = self._value_column()
+        if obj_ids is None:
+            return column[has_value]
+        obj_ids = obj_ids[obj_ids < len(column)]
+        return column[obj_ids][has_value[obj_ids]]
+
+    def _value_column(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Get a typed array of each obj_id's value, and a bool array that is True where the obj_id has a value
+        that is not None. Built on first use, then kept."""
+        if self.value_column is None:
+            codes, code_vals = self._value_codes()
+            vals = np.array(code_vals[:-1])  # the last code is for None
+            if len(vals) == 0:
+                vals = vals.astype("float64")
+            if vals.dtype.kind not in "biuf":
+                raise TypeError(
+                    f"Can only aggregate numbers; {self.attr} has values of type {vals.dtype}."
+                )
+            has_value = (codes >= 0) & (codes < len(vals))
+            column = np.zeros(len(codes), dtype=vals.dtype)
+            column[has_value] = vals[codes[has_value]]
+            self.value_column = column, has_value
+        return self.value_column
+
+    def ordered_ids(
+        self, expr: Dict[str, Any], descending: bool = False
+    ) -> Iterator[np.ndarray]:
+        """Yield arrays of object ids in order of their values. Only values in the range expr are included, or all
+        values if expr has no range. None values are not included. Objects with equal values are in ascending order
+        of object id, or descending if ``descending``."""
+        lo, hi, include_lo, include_hi = range_expr_to_args(expr)
+        left, right = self._val_arr_bounds(lo, hi, include_lo, include_hi)
+        # The big values are not in val_arr; each one goes between the val_arr values around it.
+        # Their postings are decoded only when reached, since the caller may stop before then.
+        segments = []
+        for val, postings in self.val_to_obj_ids.get_range_items(
+            lo, hi, include_lo, include_hi
+        ):
+            pos = min(max(self._bisect(val, "left"), left), right)
+            segments.append(self.obj_id_arr[left:pos])
+            segments.append(postings)
+            left = pos
+        segments.append(self.obj_id_arr[left:right])
+        if descending:
+            segments.reverse()
+        for seg in segments:
+            if len(seg):
+                seg = postings_to_array(seg)
+                yield seg[::-1] if descending else seg
+
+    def estimate(self, expr: Dict[str, Any]) -> int:
+        """Get the number of objects that match expr, without finding them. Used to plan queries.
+        Exact, except when expr has several operators; then it's the smallest of their counts."""
+        counts = []
+        if "==" in expr:
+            counts.append(self.count(expr["=="]))
+        if "in" in expr:
+            counts.append(self.count_many(expr["in"]))
+        if any(op in expr for op in RANGE_OPERATORS):
+            lo, hi, include_lo, include_hi = range_expr_to_args(expr)
+            left, right = self._val_arr_bounds(lo, hi, include_lo, include_hi)
+            big = self.val_to_obj_ids.get_range(lo, hi, include_lo, include_hi)
+            counts.append(right - left + sum(len(v) for v in big))
+        return min(counts, default=0)
+
+    def match_mask(self, expr: Dict[str, Any], obj_ids: np.ndarray) -> np.ndarray:
+        """Get a bool array that is True where obj_ids match expr. Checks each obj_id by membership, so the cost
+        depends on len(obj_ids) rather than on how many objects match expr."""
+        mask = np.ones(len(obj_ids), dtype="bool")
+        if "==" in expr:
+            mask &= self._val_mask(expr["=="], obj_ids)
+        if "in" in expr:
+            mask &= self._val_mask_many(expr["in"], obj_ids)
+        if any(op in expr for op in RANGE_OPERATORS):
+            lo, hi, include_lo, include_hi = range_expr_to_args(expr)
+            left, right = self._val_arr_bounds(lo, hi, include_lo, include_hi)
+            range_mask = self._rank_mask(obj_ids, left, right)
+            for postings in self.val_to_obj_ids.get_range(
+                lo, hi, include_lo, include_hi
+            ):
+                range_mask |= postings_contains(postings, obj_ids)
+            mask &= range_mask
+        return mask
+
+    def _val_mask(self, val, obj_ids: np.ndarray) -> np.ndarray:
+        """Get a bool array that is True where obj_ids have the attribute value val."""
+        if val is ANY:
+            mask = self._rank_mask(obj_ids, 0, len(self.val_arr))
+            mask |= postings_contains(self.none_ids, obj_ids)
+            for postings in self.val_to_obj_ids.values():
+                mask |= postings_contains(postings, obj_ids)
+            return mask
+        if val is None:
+            return postings_contains(self.none_ids, obj_ids)
+        if val in self.val_to_obj_ids:
+            return postings_contains(self.val_to_obj_ids[val], obj_ids)
+        if val != val:
+            return np.zeros(len(obj_ids), dtype="bool")
+        left = self._bisect(val, "left")
+        right = self._bisect(val, "right")
+        return self._rank_mask(obj_ids, left, right)
+
+    def _val_mask_many(self, values: Iterable[Any], obj_ids: np.ndarray) -> np.ndarray:
+        """Get a bool array that is True where obj_ids have any of the values."""
+        lefts, rights, big, has_none, has_any = self._locate_many(values)
+        if has_any:
+            return self._val_mask(ANY, obj_ids)
+        mask = np.zeros(len(obj_ids), dtype="bool")
+        if len(lefts):
+            # find the run that each obj_id's rank would be in, and check that it's inside it
+            ranks = self._ranks(obj_ids)
+            run = np.searchsorted(lefts, ranks, "right") - 1
+            mask = (run >= 0) & (ranks < rights[run])
+        for postings in big:
+            mask |= postings_contains(postings, obj_ids)
+        if has_none:
+            mask |= postings_contains(self.none_ids, obj_ids)
+        return mask
+
+    def _rank_mask(self, obj_ids: np.ndarray, left: int, right: int) -> np.ndarray:
+        """Get a bool array that is True where obj_ids are in obj_id_arr[left:right]."""
+        if left >= right:
+            return np.zeros(len(obj_ids), dtype="bool")
+        ranks = self._ranks(obj_ids)
+        return (left <= ranks) & (ranks < right)
+
+    def _ranks(self, obj_ids: np.ndarray) -> np.ndarray:
+        """Get where each of obj_ids is in obj_id_arr, or -1 where it's not there."""
+        if self.obj_id_to_rank is None:
+            # built on first use, then kept
+            size = int(self.obj_id_arr.max()) + 1 if len(self.obj_id_arr) else 0
+            obj_id_to_rank = np.full(size, -1, dtype="int64")
+            obj_id_to_rank[self.obj_id_arr] = np.arange(len(self.obj_id_arr))
+            # assigned only once filled in, so other threads never see it half-built
+            self.obj_id_to_rank = obj_id_to_rank
+        obj_id_to_rank = self.obj_id_to_rank
+        in_bounds = obj_ids < len(obj_id_to_rank)
+        ranks = np.full(len(obj_ids), -1, dtype="int64")
+        ranks[in_bounds] = obj_id_to_rank[obj_ids[in_bounds]]
+        return ranks
+
+    def _value_codes(self) -> Tuple[np.ndarray, List[Any]]:
+        """Get an array giving each obj_id's value as a code, or -1 for obj_ids without a value; and the value of
+        each code. Built on first use, then kept."""
+        if self.value_codes is None:
+            _, run_lengths, vals = run_length_encode(self.val_arr)
+            code_vals = vals.tolist()
+            parts = [
+                (self.obj_id_arr, np.repeat(np.arange(len(code_vals)), run_lengths))
+            ]
+            for val, postings in self.val_to_obj_ids.items():
+                parts.append((postings_to_array(postings), len(code_vals)))
+                code_vals.append(val)
+            parts.append((self.none_ids, len(code_vals)))
+            code_vals.append(None)
+            size = max((int(ids.max()) + 1 for ids, _ in parts if len(ids)), default=0)
+            codes = np.full(size, -1, dtype="int64")
+            for ids, code in parts:
+                codes[ids] = code
+            self.value_codes = codes, code_vals
+        return self.value_codes
+
     def __len__(self):
         return len(self.val_arr) + len(self.val_to_obj_ids) + len(self.none_ids)
+
+
+class PyValueView:
+    """Read-only view of a typed numpy array that gives its elements as Python objects, so that bisect can compare
+    them to query values using Python semantics."""
+
+    def __init__(self, arr: np.ndarray):
+        self.arr = arr
+
+    def __getitem__(self, i: int) -> Any:
+        return self.arr[i].item()
+
+    def __len__(self):
+        return len(self.arr)
+
+
+def _native_number(val, kind: str) -> Any:
+    """Query value for a numeric val_arr of this dtype kind, if val is a bool, an int the kind holds exactly, or a
+    float that compares exactly."""
+    val_type = type(val)
+    if val_type is float:
+        if kind == "f":
+            return (
+                None if val != val else val
+            )  # NaN compares false to everything in Python
+        # numpy compares ints to a float as float64, which rounds those past 2**53, so compare to an int instead.
+        # A fractional float isn't any int; it's bisected with Python comparisons.
+        if not val.is_integer():
+            return None
+        val, val_type = int(val), int
+    if val_type is bool:
+        return val
+    lo, hi = _EXACT_INT_RANGES[kind]
+    if val_type is int and lo <= val <= hi:
+        return val
+    return None
+
+
+def _native_str(val) -> Any:
+    """Query value for a str val_arr. numpy drops trailing null characters, so those strs can't be compared."""
+    if type(val) is str and not val.endswith("\x00"):
+        return val
+    return None
+
+
+def _native_datetime(val, dtype: np.dtype) -> Any:
+    """Query value for a datetime64 val_arr, if val is a naive datetime or a date of the same unit."""
+    unit = np.datetime_data(dtype)[0]
+    val_type = type(val)
+    if (val_type is datetime and unit == "us" and val.tzinfo is None) or (
+        val_type is date and unit == "D"
+    ):
+        return np.datetime64(val, unit)
+    return None
@@ -1,21 +1,133 @@
+from datetime import date
+from datetime import datetime
+from typing import Any
 from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Set
+from typing import Tuple
 from typing import Union
 
 import numpy as np
+from ducks.constants import STR_WIDTH_MAX
+from ducks.constants import STR_WIDTH_SKEW_MAX
 from ducks.utils import get_attribute
 from ducks.utils import make_empty_array
 
 
-def get_vals(objs: np.ndarray, obj_id_arr: np.ndarray, attr: Union[Callable, str]):
-    """Gets vals by attribute. Returned arrays will be shorter than input if objects are missing attributes."""
-    val_arr = np.empty(len(objs), dtype="O")
-    success = np.empty(len(objs), dtype=bool)
+def get_vals_multi(
+    objs: np.ndarray, attrs: Iterable[Union[Callable, str]], dtype: str
+) -> Dict[Union[Callable, str], Tuple[np.ndarray, List]]:
+    """Gets vals for every attribute in a single pass over the objects.
+
+    Returns a dict of ``{attr: (obj_id_arr, vals)}``, where ``vals`` is a list of attribute values and
+    ``obj_id_arr`` holds the position of the object each value came from. Objects that are missing an attribute
+    are left out of that attribute's entry.
+    """
+    n = len(objs)
+    columns = {attr: [None] * n for attr in attrs}
+    missing = {attr: [] for attr in attrs}
+    str_attrs = [
+        (attr, columns[attr], missing[attr]) for attr in columns if type(attr) is str
+    ]
+    other_attrs = [
+        (attr, columns[attr], missing[attr])
+        for attr in columns
+        if type(attr) is not str
+    ]
     for i, obj in enumerate(objs):
-        val_arr[i], success[i] = get_attribute(obj, attr)
+        if type(obj) is dict:
+            _get_dict_vals(obj, i, str_attrs)
+        else:
+            _get_attr_vals(obj, i, str_attrs)
+        _get_attr_vals(obj, i, other_attrs)
+    return {
+        attr: _drop_missing(col, missing[attr], dtype) for attr, col in columns.items()
+    }
+
+
+def _get_dict_vals(obj: Dict, i: int, attrs: List[Tuple[str, List, List]]):
+    """Fill in the values of a dict's keys at position i of each attribute's column, or note they're missing.
+    Faster than get_attribute, which is only needed for other types."""
+    for attr, col, miss in attrs:
+        try:
+            col[i] = obj[attr]
+        except KeyError:
+            miss.append(i)
+
+
+def _get_attr_vals(
+    obj: Any, i: int, attrs: List[Tuple[Union[Callable, str], List, List]]
+):
+    """Fill in the values of obj's attributes at position i of each attribute's column, or note they're missing."""
+    for attr, col, miss in attrs:
+        col[i], success = get_attribute(obj, attr)
+        if not success:
+            miss.append(i)
+
+
+def _drop_missing(col: List, missing: List[int], dtype: str) -> Tuple[np.ndarray, List]:
+    """Get (obj_id_arr, vals) of a column, leaving out the positions in missing."""
+    obj_id_arr = np.arange(len(col), dtype=dtype)
+    if missing:
+        success = np.ones(len(col), dtype=bool)
+        success[missing] = False
+        obj_id_arr = obj_id_arr[success]
+        col = [col[i] for i in obj_id_arr.tolist()]
+    return obj_id_arr, col
+
+
+def column_to_vals(col: Any) -> Union[List[Any], np.ndarray]:
+    """Convert a column of attribute values (numpy array, pandas Series, list, etc.) to the vals that
+    FrozenAttrIndex takes. Numeric, bool, and string columns stay typed; other columns become a list of values."""
+    if isinstance(col, (list, tuple)):
+        # don't let numpy turn sequence values into extra dimensions
+        return list(col)
+    col = np.asarray(col)
+    if col.ndim != 1:
+        raise ValueError(f"Columns must be 1-dimensional, got shape {col.shape}.")
+    if col.dtype.kind in "biufU":
+        return col
+    return list(col)
+
+
+def make_val_arr(vals: List[Any], val_types: Set[type]) -> np.ndarray:
+    """Put vals into a numpy array. If the vals are all ints, all floats, all strings, all dates, or all
+    timezone-naive datetimes, the array will have a native dtype, so sorting and comparisons don't need to go through
+    Python objects. Otherwise it's an object array.
+    """
+    if len(val_types) == 1:
+        val_type = next(iter(val_types))
+        try:
+            if val_type is int:
+                return np.array(vals, dtype="int64")
+            if val_type is float:
+                return np.array(vals, dtype="float64")
+        except OverflowError:
+            pass  # ints too big for int64; store as objects
+        if val_type is str and fits_fixed_width(vals):
+            return np.array(vals, dtype="U")
+        if val_type is date:
+            return np.array(vals, dtype="datetime64[D]")
+        if val_type is datetime and all(v.tzinfo is None for v in vals):
+            return np.array(vals, dtype="datetime64[us]")
+    val_arr = np.empty(len(vals), dtype="O")
+    for i, val in enumerate(vals):
+        val_arr[i] = val
+    return val_arr
+
 
-    val_arr = val_arr[success]
-    obj_id_arr = obj_id_arr[success]
-    return obj_id_arr, val_arr
+def fits_fixed_width(vals: List[str]) -> bool:
+    """Check if the strings can go in a fixed-width "U" array. Each element there is as wide as the longest string,
+    so a few long strings among many short ones would take far more memory than string objects do."""
+    joined = "".join(vals)
+    if "\x00" in joined:
+        # numpy strips trailing null characters from strings, so those must stay as objects
+        return False
+    longest = max(map(len, vals))
+    mean = len(joined) / len(vals)
+    return longest <= STR_WIDTH_MAX or longest <= STR_WIDTH_SKEW_MAX * mean
 
 
 def run_length_encode(arr: np.ndarray):
@@ -4,24 +4,48 @@ from typing import Any
 from typing import Callable
 from typing import Dict
 from typing import Iterable
+from typing import List
 from typing import Optional
 from typing import Set
+from typing import Tuple
 from typing import Union
 
 import numpy as np
 import sortednp as snp
+from ducks.aggregate import compute_aggregates
+from ducks.aggregate import parse_aggregates
 from ducks.btree import range_expr_to_args
+from ducks.compiled import CompiledQuery
+from ducks.compiled import get_plan
+from ducks.constants import ORDER_BLOCK_SIZE
 from ducks.frozen.frozen_attr import FrozenAttrIndex
+from ducks.frozen.init_helpers import column_to_vals
+from ducks.frozen.init_helpers import get_vals_multi
+from ducks.frozen.postings import Postings
+from ducks.frozen.postings import postings_contains
+from ducks.frozen.postings import postings_to_array
 from ducks.frozen.utils import snp_difference
+from ducks.lazy import LazyResult
+from ducks.utils import build_indexes
 from ducks.utils import make_empty_array
-from ducks.utils import split_query
-from ducks.utils import standardize_expr
-from ducks.utils import validate_and_standardize_operators
+from ducks.utils import make_query_key
+from ducks.utils import make_term_key
+from ducks.utils import parse_query
+from ducks.utils import split_order_range
+from ducks.utils import use_composites
+from ducks.utils import validate_attr
+from ducks.utils import validate_order
 from ducks.utils import validate_query
 
 
 class FrozenDex:
-    def __init__(self, objs: Iterable[Any], on: Iterable[Union[str, Callable]]):
+    def __init__(
+        self,
+        objs: Iterable[Any],
+        on: Iterable[Union[str, Callable]],
+        workers: Optional[int] = None,
+        compress: bool = False,
+    ):
         """Create a FrozenDex containing the ``objs``, queryable by the ``on`` attributes.
 
         Args:
@@ -29,6 +53,15 @@ class FrozenDex:
 
             on: The attributes that will be used for finding objects.
                 Must contain at least one.
+                A tuple of attributes, such as ``('region', 'tier')``, builds a composite index on their values,
+                which is used for queries having '==' on each of them but the last, and '==' or a range on the last.
+
+            workers: Number of threads used to build the attribute indexes concurrently. Optional.
+                Index building is mostly numpy sorting, which runs in parallel well.
+
+            compress: If True, the object lists of attribute values that many objects share are stored
+                as bitmaps or runs, wherever that's smaller than an array. Saves memory on low-cardinality
+                attributes, and makes ``!=`` and ``not in`` queries on them faster.
 
         It's OK if the objects in ``objs`` are missing some or all of the attributes in ``on``.
 
@@ -46,14 +79,81 @@ class FrozenDex:
         for i, obj in enumerate(objs):
             self.obj_arr[i] = obj
 
-        self._indexes = {}
-        for attr in on:
-            self._indexes[attr] = FrozenAttrIndex(attr, self.obj_arr, self.dtype)
+        # Pull out the values of every attribute in one pass over the objects
+        attr_vals = get_vals_multi(self.obj_arr, on, self.dtype)
+
+        n_objs = len(self.obj_arr) if compress else None
+
+        def make_index(attr):
+            obj_id_arr, vals = attr_vals[attr]
+            return FrozenAttrIndex(attr, obj_id_arr, vals, self.dtype, n_objs)
+
+        self._indexes = build_indexes(make_index, on, workers)
+
+        # only used during contains() checks; built on the first one
+        self.sorted_obj_ids = None
+
+    @classmethod
+    def from_columns(
+        cls,
+        columns: Dict[str, Any],
+        objs: Optional[Iterable[Any]] = None,
+        workers: Optional[int] = None,
+        compress: bool = False,
+    ) -> "FrozenDex":
+        """Create a FrozenDex from columns of attribute values, without evaluating attributes on any objects.
+
+        Args:
+            columns: Dict of ``{attribute: column}``, where each column holds one value per row. Columns may be
+                numpy arrays, pandas Series, lists, or anything else numpy can turn into a 1-d array.
+                A pandas DataFrame works here too.
+
+            objs: The objects that FrozenDex will contain, one per row. Optional.
+                If ``None``, the FrozenDex contains the row positions ``0, 1, ..., n-1``, and queries return
+                a numpy array of matching row positions.
 
-        # only used during contains() checks
-        self.sorted_obj_ids = np.sort([id(obj) for obj in self.obj_arr])
+            workers: Number of threads used to build the attribute indexes concurrently. Optional.
 
-    def _find(  # noqa: C901
+            compress: If True, store large object lists compressed. See the ``FrozenDex`` constructor.
+
+        Numeric, bool, and string columns are indexed using their native numpy dtype.
+        Columns of other types are indexed by their values, with the same rules as the ``FrozenDex`` constructor.
+
+        Returns:
+            A FrozenDex, queryable on the column names.
+        """
+        vals = {attr: column_to_vals(col) for attr, col in columns.items()}
+        if not vals:
+            raise ValueError("Need at least one attribute.")
+        lengths = {len(v) for v in vals.values()}
+        if len(lengths) > 1:
+            raise ValueError("All columns must be the same length.")
+        n_rows = lengths.pop()
+
+        box = cls.__new__(cls)
+        box.dtype = "uint32" if n_rows < 2**32 else "uint64"
+        if objs is None:
+            box.obj_arr = np.arange(n_rows, dtype=box.dtype)
+        else:
+            if len(objs) != n_rows:
+                raise ValueError(
+                    f"Got {len(objs)} objs for {n_rows} rows; these must be the same."
+                )
+            box.obj_arr = np.empty(n_rows, dtype="O")
+            for i, obj in enumerate(objs):
+                box.obj_arr[i] = obj
+
+        obj_id_arr = np.arange(n_rows, dtype=box.dtype)
+        n_objs = n_rows if compress else None
+
+        def make_index(attr):
+            return FrozenAttrIndex(attr, obj_id_arr, vals[attr], box.dtype, n_objs)
+
+        box._indexes = build_indexes(make_index, vals, workers)
+        box.sorted_obj_ids = None
+        return box
+
+    def _find(
         self,
         match: Optional[Dict[Union[str, Callable], Any]] = None,
         exclude: Optional[Dict[Union[str, Callable], Any]] = None,
@@ -85,49 +185,141 @@ class FrozenDex:
         Returns:
             Numpy array of objects matching the constraints. Array will be in the same order as the original objects.
         """
-        # validate input and convert expressions to dict
+        match = use_composites(self._indexes, match)
         validate_query(self._indexes, match, exclude)
-        for arg in [match, exclude]:
-            if arg:
-                for key in arg:
-                    arg[key] = standardize_expr(arg[key])
+        return self.obj_arr[self._find_ids(match, exclude)]
+
+    def find_many(self, queries: Iterable[Dict]) -> List[np.ndarray]:
+        """Find the objects matching each of several queries. Same as ``[dex[q] for q in queries]``, but faster
+        when the queries overlap: a term that appears in several queries is looked up once, and a repeated query
+        is run once.
 
+        Args:
+            queries: Iterable of queries. Each is a dict of ``{attribute: expression}``, same as in ``dex[query]``.
+
+        Returns:
+            List of results, one for each query, in the same order as the queries.
+        """
+        parsed = []
+        for query in queries:
+            match, exclude = parse_query(query)
+            match = use_composites(self._indexes, match)
+            validate_query(self._indexes, match, exclude)
+            parsed.append((match, exclude))
+        results = self._find_single_values(parsed)
+        memo = dict()
+        done = dict()
+        for i, (match, exclude) in enumerate(parsed):
+            if results[i] is not None:
+                continue
+            key = make_query_key(match, exclude)
+            if key in done:
+                results[i] = done[key].copy()
+                continue
+            results[i] = self.obj_arr[self._find_ids(match, exclude, memo)]
+            if key is not None:
+                done[key] = results[i]
+        return results
+
+    def _find_single_values(
+        self, parsed: List[Tuple[Dict, Dict]]
+    ) -> List[Optional[np.ndarray]]:
+        """Run the parsed queries that are for one value of one attribute. Queries of that shape are grouped by
+        attribute, and each attribute's values are looked up at once. Returns a result for each query, or None
+        for those of any other shape."""
+        results = [None] * len(parsed)
+        lookups = dict()
+        for i, (match, exclude) in enumerate(parsed):
+            if len(match) == 1 and not exclude:
+                attr, expr = next(iter(match.items()))
+                if list(expr) == ["=="]:
+                    lookups.setdefault(attr, []).append(i)
+        for attr, positions in lookups.items():
+            values = [parsed[i][0][attr]["=="] for i in positions]
+            for i, obj_ids in zip(positions, self._indexes[attr].get_each(values)):
+                results[i] = self.obj_arr[obj_ids]
+        return results
+
+    def _find_ids(
+        self,
+        match: Optional[Dict[Union[str, Callable], Any]] = None,
+        exclude: Optional[Dict[Union[str, Callable], Any]] = None,
+        memo: Optional[Dict] = None,
+    ) -> np.ndarray:
+        """Perform lookup based on given constraints. Return a sorted array of object positions.
+        The expressions must already be standardized, as done by ``parse_query``.
+        If memo is given, term matches are looked up in it, and stored there."""
         # perform 'match' query
         if match:
-            hit_arrays = []
-            for attr, expr in match.items():
-                hit_array = self._match_attr_expr(attr, expr)
-                if len(hit_array) == 0:
-                    # this attr had no matches, therefore the intersection will be empty. We can stop here.
-                    return make_empty_array("O")
-                hit_arrays.append(hit_array)
-
-            # intersect all the hit_arrays, starting with the smallest
-            for i, hit_array in enumerate(sorted(hit_arrays, key=len)):
-                if i == 0:
-                    hits = hit_array
-                else:
-                    hits = snp.intersect(hits, hit_array)
+            # Find the hits for the term that matches the fewest objects, then apply the other terms to those hits.
+            estimates = {
+                attr: self._indexes[attr].estimate(expr) for attr, expr in match.items()
+            }
+            attrs = sorted(match, key=estimates.get)
+            if estimates[attrs[0]] == 0:
+                # the intersection will be empty. We can stop here.
+                return make_empty_array(self.dtype)
+            hits = postings_to_array(self._match_term(attrs[0], match[attrs[0]], memo))
+            for attr in attrs[1:]:
+                hits = self._apply_term(
+                    attr, match[attr], hits, estimates[attr], memo=memo
+                )
+                if len(hits) == 0:
+                    return hits
         else:
             hits = np.arange(len(self.obj_arr), dtype=self.dtype)
 
         # perform 'exclude' query
         if exclude:
-            exc_arrays = []
             for attr, expr in exclude.items():
-                exc_arrays.append(self._match_attr_expr(attr, expr))
-
-            # subtract each of the exc_arrays, starting with the largest
-            for exc_array in sorted(exc_arrays, key=len, reverse=True):
-                hits = snp_difference(hits, exc_array)
+                estimate = self._indexes[attr].estimate(expr)
+                hits = self._apply_term(
+                    attr, expr, hits, estimate, exclude=True, memo=memo
+                )
                 if len(hits) == 0:
                     break
 
-        return self.obj_arr[hits]
+        return hits
 
-    def _match_attr_expr(self, attr: Union[str, Callable], expr: dict) -> np.ndarray:
-        """Look at an attr, handle its expr appropriately"""
-        validate_and_standardize_operators(expr)
+    def _apply_term(
+        self,
+        attr: Union[str, Callable],
+        expr: dict,
+        hits: np.ndarray,
+        estimate: int,
+        exclude: bool = False,
+        memo: Optional[Dict] = None,
+    ) -> np.ndarray:
+        """Keep the hits that match this term, or if exclude, the hits that don't.
+        When there are fewer hits than objects matching the term, each hit is checked by membership. Otherwise,
+        the term's matches are found and intersected with the hits."""
+        if len(hits) < estimate:
+            mask = self._indexes[attr].match_mask(expr, hits)
+        else:
+            matches = self._match_term(attr, expr, memo)
+            if isinstance(matches, np.ndarray):
+                if exclude:
+                    return snp_difference(hits, matches)
+                return snp.intersect(hits, matches)
+            mask = matches.contains(hits)
+        return hits[~mask] if exclude else hits[mask]
+
+    def _match_term(
+        self, attr: Union[str, Callable], expr: dict, memo: Optional[Dict]
+    ) -> Postings:
+        """Get the matches of one term, reusing them from memo if an earlier query had the same term."""
+        key = None if memo is None else make_term_key(attr, expr)
+        if key is None:
+            return self._match_attr_expr(attr, expr)
+        if key not in memo:
+            memo[key] = self._match_attr_expr(attr, expr)
+        return memo[key]
+
+    def _match_attr_expr(self, attr: Union[str, Callable], expr: dict) -> Postings:
+        """Look at an attr, handle its expr appropriately.
+        A lone '==' may return a compressed posting list; everything else returns a sorted array."""
+        if len(expr) == 1 and "==" in expr:
+            return self._indexes[attr].get_postings(expr["=="])
         matches = None
         # handle 'in' and '=='
         eq_expr = {op: val for op, val in expr.items() if op in ["==", "in"]}
@@ -156,6 +348,103 @@ class FrozenDex:
             )
         return matches
 
+    def compile(self, query: Dict) -> CompiledQuery:
+        """Parse and validate a query template once, so it can be run many times with different values.
+
+        Args:
+            query: Dict of ``{attribute: expression}``, same as in ``dex[query]``. Any value may be a
+                ``ducks.Param``, which is filled in when the query is run.
+
+        Returns:
+            A CompiledQuery. Call it with a keyword argument for each Param to get the matching objects.
+
+        Example::
+
+            q = dex.compile({'x': Param('x'), 'y': {'>': Param('min_y')}})
+            q(x=1, min_y=5)  # same as dex[{'x': 1, 'y': {'>': 5}}]
+        """
+        plan = get_plan(query)
+        validate_query(
+            self._indexes, use_composites(self._indexes, plan.match), plan.exclude
+        )
+        return CompiledQuery(self, plan)
+
+    def count(self, query: Dict) -> int:
+        """Count the objects that satisfy the query. Same as ``len(dex[query])``, but the objects are not looked up.
+
+        Args:
+            query: Dict of ``{attribute: expression}``, same as in ``dex[query]``.
+        """
+        match, exclude = parse_query(query)
+        match = use_composites(self._indexes, match)
+        validate_query(self._indexes, match, exclude)
+        if len(match) == 1 and not exclude:
+            attr, expr = next(iter(match.items()))
+            if list(expr) == ["=="]:
+                # count straight from the size of the posting list
+                return self._indexes[attr].count(expr["=="])
+        return len(self._find_ids(match, exclude))
+
+    def exists(self, query: Dict) -> bool:
+        """Check if any object satisfies the query, without looking up any objects.
+
+        Args:
+            query: Dict of ``{attribute: expression}``, same as in ``dex[query]``.
+        """
+        return self.count(query) > 0
+
+    def group_counts(self, query: Dict, by: Union[str, Callable]) -> Dict[Any, int]:
+        """Count the objects that satisfy the query, grouped by their value of the ``by`` attribute. Same as
+        running ``count()`` once per value, but done in one pass, without looking up any objects.
+
+        Args:
+            query: Dict of ``{attribute: expression}``, same as in ``dex[query]``.
+
+            by: The attribute to group by. Must be one of the attributes specified in the constructor.
+
+        Returns:
+            Dict of ``{value: count}``. Values with no matching objects are left out, and so are matching objects
+            that don't have the ``by`` attribute.
+        """
+        match, exclude = parse_query(query)
+        match = use_composites(self._indexes, match)
+        validate_query(self._indexes, match, exclude)
+        validate_attr(self._indexes, by, "group by")
+        hits = self._find_ids(match, exclude) if match or exclude else None
+        return self._indexes[by].value_counts(hits)
+
+    def aggregate(
+        self, query: Dict, aggs: Dict[Union[str, Callable], Union[str, List[str]]]
+    ) -> Dict[Union[str, Callable], Dict[str, Any]]:
+        """Compute numeric aggregates over the attribute values of the objects that satisfy the query.
+        The values are read from a typed column of each attribute's values, which is built on first use. No objects
+        are looked up.
+
+        Args:
+            query: Dict of ``{attribute: expression}``, same as in ``dex[query]``.
+
+            aggs: Dict of ``{attribute: aggregates}``, such as ``{'latency': ['sum', 'max', 'p99']}``.
+                Valid aggregates are 'count', 'sum', 'min', 'max', 'mean', and percentiles like 'p50' or 'p99.9'.
+                Each attribute must be one of the attributes specified in the constructor.
+
+        Returns:
+            Dict of ``{attribute: {aggregate: value}}``. Objects that don't have the attribute, or have None for it,
+            are left out of its aggregates. With no values, 'sum' is 0, and the others except 'count' are None.
+            Raises TypeError if the values of an attribute aren't all numbers.
+        """
+        aggs = parse_aggregates(aggs)
+        match, exclude = parse_query(query)
+        match = use_composites(self._indexes, match)
+        validate_query(self._indexes, match, exclude)
+        for attr in aggs:
+            validate_attr(self._indexes, attr, "aggregate")
+        hits = self._find_ids(match, exclude) if match or exclude else None
+        result = dict()
+        for attr, ops in aggs.items():
+            values = self._indexes[attr].numeric_values(hits)
+            result[attr] = compute_aggregates(values, ops)
+        return result
+
     def get_values(self, attr: Union[str, Callable]) -> Set:
         """Get the set of unique values we have for the given attribute.
 
@@ -170,14 +459,15 @@ class FrozenDex:
     def _match_any_value_in(
         self, attr: Union[str, Callable], values: Iterable[Any]
     ) -> np.ndarray:
-        """ "Get the union of object ID matches for the values."""
-        matches = [self._indexes[attr].get(v) for v in values]
-        if matches:
-            return np.sort(np.concatenate(matches))
-        else:
-            return make_empty_array(self.dtype)
+        """Get the union of object ID matches for the values."""
+        return self._indexes[attr].get_many(values)
 
     def __contains__(self, obj):
+        if self.obj_arr.dtype != "O":
+            # contains row positions, made by from_columns()
+            return isinstance(obj, (int, np.integer)) and 0 <= obj < len(self.obj_arr)
+        if self.sorted_obj_ids is None:
+            self.sorted_obj_ids = np.sort([id(obj) for obj in self.obj_arr])
         obj_id = id(obj)
         idx = bisect_left(self.sorted_obj_ids, obj_id)
         if (
@@ -218,13 +508,90 @@ class FrozenDex:
         Returns:
             Numpy array of objects matching the constraints. Array will be in the same order as the original objects.
         """
-        if not isinstance(query, dict):
-            raise TypeError(f"Got {type(query)}; expected a dict.")
-        std_query = dict()
-        for attr, expr in query.items():
-            std_query[attr] = standardize_expr(expr)
-        match_query, exclude_query = split_query(std_query)
-        return self._find(match_query, exclude_query)
+        return self.find(query)
+
+    def find(
+        self,
+        query: Dict,
+        lazy: bool = False,
+        order_by: Optional[Union[str, Callable]] = None,
+        descending: bool = False,
+        limit: Optional[int] = None,
+    ) -> Union[np.ndarray, LazyResult]:
+        """Find objects in the FrozenDex that satisfy the constraints.
+
+        Args:
+            query: Dict of ``{attribute: expression}``, same as in ``dex[query]``.
+
+            lazy: If True, return a ``LazyResult`` that looks up the matching objects only as they are consumed.
+
+            order_by: An attribute in ``on`` to sort the results by. Optional. Objects whose value is None come after
+                the others, and objects missing the attribute come last. Objects with equal values stay in their
+                original order, or the reverse of it if ``descending``.
+
+            descending: If True, sort from the largest value to the smallest.
+
+            limit: Return at most this many objects. Optional. With ``order_by``, the ``order_by`` index is walked in
+                order, and the walk stops once ``limit`` matching objects are found.
+
+        Returns:
+            Numpy array of objects matching the constraints, or a LazyResult of them.
+            Either will be in the same order as the original objects, unless ``order_by`` is given.
+        """
+        match_query, exclude_query = parse_query(query)
+        validate_order(self._indexes, order_by, descending, limit)
+        if not lazy and order_by is None and limit is None:
+            return self._find(match_query, exclude_query)
+        match_query = use_composites(self._indexes, match_query)
+        validate_query(self._indexes, match_query, exclude_query)
+        if order_by is None:
+            obj_ids = self._find_ids(match_query, exclude_query)[:limit]
+        else:
+            obj_ids = self._find_ordered_ids(
+                match_query, exclude_query, order_by, descending, limit
+            )
+        if lazy:
+            return LazyResult(obj_ids, self.obj_arr.__getitem__)
+        return self.obj_arr[obj_ids]
+
+    def _find_ordered_ids(
+        self,
+        match: Dict[Union[str, Callable], Dict],
+        exclude: Dict[Union[str, Callable], Dict],
+        order_by: Union[str, Callable],
+        descending: bool,
+        limit: Optional[int],
+    ) -> np.ndarray:
+        """Find the matching object positions, in order of their order_by values. Walks the order_by index in
+        order, keeping the positions that match the other terms, and stops after ``limit`` of them."""
+        index = self._indexes[order_by]
+        walk_expr, match = split_order_range(match, order_by)
+        hits = self._find_ids(match, exclude) if match or exclude else None
+        if limit is None:
+            limit = len(self.obj_arr)
+        found = [make_empty_array(self.dtype)]
+        n_found = 0
+        block_size = max(limit, ORDER_BLOCK_SIZE)
+        for obj_ids in index.ordered_ids(walk_expr, descending):
+            # check the hits a block at a time, so a long run of values doesn't get checked past the limit
+            for start in range(0, len(obj_ids), block_size):
+                if n_found >= limit:
+                    break
+                block = obj_ids[start : start + block_size]
+                if hits is not None:
+                    block = block[postings_contains(hits, block)]
+                found.append(block)
+                n_found += len(block)
+            if n_found >= limit:
+                # stop before the index reads the next values
+                break
+        if n_found < limit and not walk_expr:
+            # Every matching object with a value has been found. Next come those with None, then those without.
+            if hits is None:
+                hits = np.arange(len(self.obj_arr), dtype=self.dtype)
+            found.append(snp.intersect(hits, index.none_ids.astype(self.dtype)))
+            found.append(snp_difference(hits, index.get_all().astype(self.dtype)))
+        return np.concatenate(found)[:limit].astype(self.dtype, copy=False)
 
 
 def save(box: FrozenDex, filepath: str):
@@ -236,5 +603,10 @@ def save(box: FrozenDex, filepath: str):
 def load(box: FrozenDex):
     """Creates a FrozenDex from the pickle file contents."""
     # If this was created by one Python process and loaded by another, the object IDs will no longer
-    # correspond to the objects. Re-create the object ID array with the correct IDs.
-    box.sorted_obj_ids = np.sort([id(obj) for obj in box.obj_arr])
+    # correspond to the objects. Drop the object ID array; it will be rebuilt on the first contains() check.
+    box.sorted_obj_ids = None
+    for index in box._indexes.values():
+        # files saved by older versions don't have this
+        index.obj_id_to_rank = None
+        index.value_codes = None
+        index.value_column = None
@@ -0,0 +1,202 @@
+"""
+Save and load a FrozenDex in a memory-mapped binary format.
+
+The index arrays are written as aligned raw buffers into one file, and loaded back as views on a read-only
+``np.memmap``. Nothing is copied or rebuilt on load; pages are read from disk as queries touch them.
+The objects are pickled into a separate file, and only unpickled if they are asked for.
+
+Layout of the directory:
+ - ``arrays.bin``: a 64-byte header, then each array's raw bytes, each starting on a 64-byte boundary.
+ - ``meta.pkl``: attribute names, array offsets / dtypes / shapes, the large-value keys of each index, and any
+   value arrays that have ``dtype="O"``, which can't be memory-mapped.
+ - ``objs.pkl``: the objects.
+"""
+import os
+import pickle  # nosec
+from typing import Any
+from typing import BinaryIO
+from typing import Dict
+from typing import Tuple
+
+import numpy as np
+from ducks.btree import BTree
+from ducks.frozen.frozen_attr import FrozenAttrIndex
+from ducks.frozen.main import FrozenDex
+from ducks.frozen.postings import BitmapPostings
+from ducks.frozen.postings import Postings
+from ducks.frozen.postings import RunPostings
+
+ALIGN = 64
+HEADER = b"DUCKSMM1".ljust(ALIGN, b"\x00")
+ARRAYS_FILE = "arrays.bin"
+META_FILE = "meta.pkl"
+OBJS_FILE = "objs.pkl"
+
+ArrayRef = Tuple[int, str, Tuple[int, ...]]  # (offset, dtype, shape)
+
+
+class _ArrayWriter:
+    """Appends arrays to the file at aligned offsets, and returns a reference to each one."""
+
+    def __init__(self, fh: BinaryIO):
+        self.fh = fh
+        self.fh.write(HEADER)
+        self.offset = len(HEADER)
+
+    def write(self, arr: np.ndarray) -> ArrayRef:
+        padding = -self.offset % ALIGN
+        self.fh.write(b"\x00" * padding)
+        self.offset += padding
+        data = np.ascontiguousarray(arr).tobytes()
+        self.fh.write(data)
+        ref = (self.offset, arr.dtype.str, arr.shape)
+        self.offset += len(data)
+        return ref
+
+
+def _read_array(mm: np.memmap, ref: ArrayRef) -> np.ndarray:
+    offset, dtype, shape = ref
+    dtype = np.dtype(dtype)
+    n_bytes = int(np.prod(shape)) * dtype.itemsize
+    return mm[offset : offset + n_bytes].view(dtype).reshape(shape)
+
+
+def _write_postings(writer: _ArrayWriter, postings: Postings) -> Tuple:
+    if isinstance(postings, BitmapPostings):
+        return (
+            "bitmap",
+            writer.write(postings.bits),
+            postings.n_objs,
+            postings.n_ids,
+            postings.dtype.str,
+        )
+    if isinstance(postings, RunPostings):
+        return (
+            "runs",
+            writer.write(postings.starts),
+            writer.write(postings.ends),
+            postings.n_ids,
+            postings.dtype.str,
+        )
+    return ("array", writer.write(postings))
+
+
+def _read_postings(mm: np.memmap, meta: Tuple) -> Postings:
+    if meta[0] == "bitmap":
+        _, bits_ref, n_objs, n_ids, dtype = meta
+        postings = BitmapPostings.__new__(BitmapPostings)
+        postings.bits = _read_array(mm, bits_ref)
+        postings.n_objs = n_objs
+    elif meta[0] == "runs":
+        _, starts_ref, ends_ref, n_ids, dtype = meta
+        postings = RunPostings.__new__(RunPostings)
+        postings.starts = _read_array(mm, starts_ref)
+        postings.ends = _read_array(mm, ends_ref)
+    else:
+        return _read_array(mm, meta[1])
+    postings.n_ids = n_ids
+    postings.dtype = np.dtype(dtype)
+    return postings
+
+
+def _write_index(writer: _ArrayWriter, index: FrozenAttrIndex) -> Dict[str, Any]:
+    meta = {
+        "attr": index.attr,
+        "dtype": index.dtype,
+        "none_ids": writer.write(index.none_ids),
+        "obj_id_arr": writer.write(index.obj_id_arr),
+        "val_to_obj_ids": [
+            (val, _write_postings(writer, postings))
+            for val, postings in index.val_to_obj_ids.items()
+        ],
+    }
+    if index.val_arr.dtype == "O":
+        meta["val_list"] = index.val_arr.tolist()
+    else:
+        meta["val_arr"] = writer.write(index.val_arr)
+    return meta
+
+
+def _read_index(mm: np.memmap, meta: Dict[str, Any]) -> FrozenAttrIndex:
+    index = FrozenAttrIndex.__new__(FrozenAttrIndex)
+    index.attr = meta["attr"]
+    index.dtype = meta["dtype"]
+    index.none_ids = _read_array(mm, meta["none_ids"])
+    index.obj_id_arr = _read_array(mm, meta["obj_id_arr"])
+    index.val_to_obj_ids = BTree()
+    for val, postings_meta in meta["val_to_obj_ids"]:
+        index.val_to_obj_ids[val] = _read_postings(mm, postings_meta)
+    if "val_list" in meta:
+        index.val_arr = np.empty(len(meta["val_list"]), dtype="O")
+        for i, val in enumerate(meta["val_list"]):
+            index.val_arr[i] = val
+    else:
+        index.val_arr = _read_array(mm, meta["val_arr"])
+    index.obj_id_to_rank = None
+    index.value_codes = None
+    index.value_column = None
+    return index
+
+
+def save_mmap(box: FrozenDex, dirpath: str):
+    """Save a FrozenDex to a directory in a format that ``load_mmap`` can memory-map.
+
+    Attributes and objects must be picklable, same as with ``save``.
+    """
+    os.makedirs(dirpath, exist_ok=True)
+    with open(os.path.join(dirpath, ARRAYS_FILE), "wb") as fh:
+        writer = _ArrayWriter(fh)
+        meta = {
+            "dtype": box.dtype,
+            "n_objs": len(box.obj_arr),
+            "has_objs": box.obj_arr.dtype == "O",
+            "indexes": [_write_index(writer, index) for index in box._indexes.values()],
+        }
+    with open(os.path.join(dirpath, META_FILE), "wb") as fh:
+        pickle.dump(meta, fh)
+    if meta["has_objs"]:
+        with open(os.path.join(dirpath, OBJS_FILE), "wb") as fh:
+            pickle.dump(box.obj_arr.tolist(), fh)
+
+
+def load_mmap(dirpath: str, load_objs: bool = True) -> FrozenDex:
+    """Load a FrozenDex saved by ``save_mmap``. The index arrays are memory-mapped, not read into memory.
+
+    Args:
+        dirpath: The directory passed to ``save_mmap``.
+
+        load_objs: If True, unpickle the saved objects, and queries return objects as usual.
+            If False, the objects aren't read at all; the FrozenDex contains the object positions
+            ``0, 1, ..., n-1`` instead, and queries return positions. Use ``load_mmap_objs`` to get the
+            objects later.
+
+    Returns:
+        The FrozenDex.
+    """
+    with open(os.path.join(dirpath, META_FILE), "rb") as fh:
+        meta = pickle.load(fh)  # nosec
+    mm = np.memmap(os.path.join(dirpath, ARRAYS_FILE), dtype="uint8", mode="r")
+    if bytes(mm[: len(HEADER)]) != HEADER:
+        raise ValueError(f"{dirpath} does not contain a memory-mapped FrozenDex.")
+
+    box = FrozenDex.__new__(FrozenDex)
+    box.dtype = meta["dtype"]
+    if load_objs and meta["has_objs"]:
+        box.obj_arr = load_mmap_objs(dirpath)
+    else:
+        box.obj_arr = np.arange(meta["n_objs"], dtype=box.dtype)
+    box._indexes = {}
+    for index_meta in meta["indexes"]:
+        box._indexes[index_meta["attr"]] = _read_index(mm, index_meta)
+    box.sorted_obj_ids = None  # built on the first contains() check
+    return box
+
+
+def load_mmap_objs(dirpath: str) -> np.ndarray:
+    """Load the objects saved by ``save_mmap``, as an array in their original order."""
+    with open(os.path.join(dirpath, OBJS_FILE), "rb") as fh:
+        objs = pickle.load(fh)  # nosec
+    obj_arr = np.empty(len(objs), dtype="O")
+    for i, obj in enumerate(objs):
+        obj_arr[i] = obj
+    return obj_arr
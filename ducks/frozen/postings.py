@@ -0,0 +1,107 @@
+"""
+Compressed posting lists for FrozenDex.
+
+A posting list holds the sorted object ids for one attribute value. By default it's a numpy array, which costs
+4 or 8 bytes per object. For values that most objects share, a bitmap over all object positions is much smaller.
+For values whose objects sit next to each other, such as data that was sorted before indexing, runs of
+consecutive ids are smaller still.
+"""
+from typing import Union
+
+import numpy as np
+
+
+class BitmapPostings:
+    """Object ids stored as one bit per object in the FrozenDex."""
+
+    def __init__(self, obj_ids: np.ndarray, n_objs: int):
+        flags = np.zeros(n_objs, dtype=bool)
+        flags[obj_ids] = True
+        self.bits = np.packbits(flags)
+        self.n_objs = n_objs
+        self.n_ids = len(obj_ids)
+        self.dtype = obj_ids.dtype
+
+    def contains(self, obj_ids: np.ndarray) -> np.ndarray:
+        """Return a bool array that is True where obj_ids are in this posting list."""
+        shifts = (7 - (obj_ids & 7)).astype("uint8")
+        return ((self.bits[obj_ids >> 3] >> shifts) & 1).astype(bool)
+
+    def to_array(self) -> np.ndarray:
+        """Get the object ids as a sorted array."""
+        flags = np.unpackbits(self.bits)[: self.n_objs]
+        return np.flatnonzero(flags).astype(self.dtype)
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
+
+    def __len__(self):
+        return self.n_ids
+
+
+class RunPostings:
+    """Object ids stored as runs of consecutive ids, as [start, end) pairs."""
+
+    def __init__(self, obj_ids: np.ndarray):
+        breaks = np.flatnonzero(np.diff(obj_ids) != 1) + 1
+        self.starts = obj_ids[np.append(0, breaks)]
+        self.ends = obj_ids[np.append(breaks - 1, len(obj_ids) - 1)] + 1
+        self.n_ids = len(obj_ids)
+        self.dtype = obj_ids.dtype
+
+    def contains(self, obj_ids: np.ndarray) -> np.ndarray:
+        """Return a bool array that is True where obj_ids are in this posting list."""
+        run_idx = self.starts.searchsorted(obj_ids, "right") - 1
+        in_run = obj_ids < self.ends[run_idx]
+        in_run[run_idx < 0] = False
+        return in_run
+
+    def to_array(self) -> np.ndarray:
+        """Get the object ids as a sorted array."""
+        lengths = self.ends - self.starts
+        # each id is its run's start plus its offset within the run
+        offsets = np.arange(self.n_ids) - np.repeat(
+            np.cumsum(lengths) - lengths, lengths
+        )
+        return (np.repeat(self.starts, lengths) + offsets).astype(self.dtype)
+
+    @property
+    def nbytes(self) -> int:
+        return self.starts.nbytes + self.ends.nbytes
+
+    def __len__(self):
+        return self.n_ids
+
+
+Postings = Union[np.ndarray, BitmapPostings, RunPostings]
+
+
+def compress_postings(obj_ids: np.ndarray, n_objs: int) -> Postings:
+    """Pick the smallest representation for these sorted obj_ids: array, bitmap, or runs."""
+    n_runs = 1 + np.count_nonzero(np.diff(obj_ids) != 1)
+    array_bytes = obj_ids.nbytes
+    bitmap_bytes = (n_objs + 7) // 8
+    run_bytes = 2 * n_runs * obj_ids.itemsize
+    if run_bytes < array_bytes and run_bytes <= bitmap_bytes:
+        return RunPostings(obj_ids)
+    if bitmap_bytes < array_bytes:
+        return BitmapPostings(obj_ids, n_objs)
+    return obj_ids
+
+
+def postings_to_array(postings: Postings) -> np.ndarray:
+    """Get the object ids of any posting list as a sorted array."""
+    if isinstance(postings, np.ndarray):
+        return postings
+    return postings.to_array()
+
+
+def postings_contains(postings: Postings, obj_ids: np.ndarray) -> np.ndarray:
+    """Return a bool array that is True where obj_ids are in any kind of posting list."""
+    if isinstance(postings, np.ndarray):
+        idx = postings.searchsorted(obj_ids)
+        found = idx < len(postings)
+        found[found] = postings[idx[found]] == obj_ids[found]
+        return found
+    return postings.contains(obj_ids)
@@ -0,0 +1,300 @@
+"""
+Keep a Dex or ConcurrentDex on disk as a snapshot, plus a log of the changes made since the snapshot.
+
+``save()`` writes every object each time. With a journal, each add, remove, or update appends only the objects it
+changed to the log, so keeping the file current costs as much as the changes. Once the log grows larger than the
+snapshot, it is compacted: a new snapshot is written, and the log starts over empty. ``load_journal()`` loads the
+snapshot and replays the log over it.
+
+Layout of the directory, where g is the generation, which goes up by one with each snapshot:
+ - ``snapshot.{g}.pkl``: the Dex, in the format of ``save()``.
+ - ``log.{g}.pkl``: the changes made after snapshot g. Each record is a length, then a pickled
+   ``(operation, keys, objects)``.
+
+Objects are identified in the log by a key: their position in the snapshot, or a count for objects added since.
+Records are written after the Dex is changed, and flushed to the operating system, so they survive the process
+crashing. Pass ``sync=True``, or call ``Journal.checkpoint()``, to have them survive the machine crashing too.
+A record that was cut short by a crash is dropped on load.
+"""
+import os
+import pickle  # nosec
+import re
+import struct
+import threading
+from typing import Any
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Union
+
+import numpy as np
+from cykhash import Int64toInt64Map
+from cykhash import Int64toInt64Map_from_buffers
+from ducks.concurrent.main import ConcurrentDex
+from ducks.concurrent.main import load as c_load
+from ducks.mutable.main import Dex
+from ducks.mutable.main import load as m_load
+from ducks.mutable.main import to_saved
+
+SNAPSHOT_FILE = "snapshot.{}.pkl"
+LOG_FILE = "log.{}.pkl"
+ADD = "add"
+REMOVE = "remove"
+UPDATE = "update"
+
+_LENGTH = struct.Struct("<Q")
+_FILE_PATTERN = re.compile(r"(snapshot|log)\.(\d+)\.pkl")
+
+
+class Journal:
+    """Writes the snapshots and the log of a Dex or ConcurrentDex. Made by ``start_journal()`` or
+    ``load_journal()``. While it's open, the Dex appends a record to it on each change."""
+
+    def __init__(
+        self,
+        box: Union[Dex, ConcurrentDex],
+        path: str,
+        sync: bool = False,
+        compact_ratio: Optional[float] = 1.0,
+    ):
+        self.box = box
+        self.path = path
+        self.sync = sync
+        self.compact_ratio = compact_ratio
+        self.generation = -1
+        self.snapshot_size = 0
+        self.fh = None
+        # {object ID: key}, and the next key to give an added object
+        self.keys = Int64toInt64Map()
+        self.next_key = 0
+        # Set when the log outgrows the snapshot. A ConcurrentDex compacts after releasing its write lock.
+        self.compact_due = False
+        self._compact_lock = threading.RLock()
+
+    def on_add(self, objs: List[Any]):
+        """Called by the Dex after the objs are added."""
+        self._record(ADD, objs)
+
+    def on_remove(self, objs: List[Any]):
+        """Called by the Dex after the objs are removed."""
+        self._record(REMOVE, objs)
+
+    def on_update(self, objs: List[Any]):
+        """Called by the Dex after the objs are updated."""
+        self._record(UPDATE, objs)
+
+    def _record(self, op: str, objs: List[Any]):
+        """Append a record of the op on the objs to the log."""
+        if not objs:
+            return
+        ptrs = [id(obj) for obj in objs]
+        if op == ADD:
+            keys = list(range(self.next_key, self.next_key + len(ptrs)))
+            self.next_key += len(ptrs)
+            for ptr, key in zip(ptrs, keys):
+                self.keys[ptr] = key
+        elif op == REMOVE:
+            keys = [self.keys.pop(ptr) for ptr in ptrs]
+        else:
+            keys = [self.keys[ptr] for ptr in ptrs]
+        data = pickle.dumps(
+            (op, keys, None if op == REMOVE else objs),
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+        self.fh.write(_LENGTH.pack(len(data)))
+        self.fh.write(data)
+        self.fh.flush()
+        if self.sync:
+            os.fsync(self.fh.fileno())
+        if (
+            self.compact_ratio is not None
+            and self.fh.tell() > self.compact_ratio * self.snapshot_size
+        ):
+            self.compact_due = True
+            if not isinstance(self.box, ConcurrentDex):
+                self.compact()
+
+    def checkpoint(self):
+        """Make sure every record so far is on disk. Only needed if ``sync`` is False."""
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+
+    def compact(self):
+        """Write a new snapshot, and start a new, empty log. Holds a read lock on a ConcurrentDex meanwhile, so
+        queries go on, and changes wait until it's done."""
+        with self._compact_lock:
+            if isinstance(self.box, ConcurrentDex):
+                with self.box.read_lock():
+                    self._compact()
+            else:
+                self._compact()
+
+    def compact_if_due(self):
+        """Compact if the log has outgrown the snapshot. Called by a ConcurrentDex after each change, once it has
+        released the write lock."""
+        if self.compact_due:
+            with self._compact_lock:
+                # unless another thread compacted meanwhile
+                if self.compact_due:
+                    self.compact()
+
+    def close(self):
+        """Stop recording changes, and close the log."""
+        _dex(self.box).journal = None
+        self.fh.close()
+
+    def _compact(self):
+        dex = _dex(self.box)
+        saved = to_saved(dex)
+        if isinstance(self.box, ConcurrentDex):
+            saved["priority"] = self.box.priority
+        generation = self.generation + 1
+        snapshot = os.path.join(self.path, SNAPSHOT_FILE.format(generation))
+        with open(snapshot + ".tmp", "wb") as fh:
+            pickle.dump(saved, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(snapshot + ".tmp", snapshot)
+        self.snapshot_size = os.path.getsize(snapshot)
+        # keys start over as the positions of the objects in the snapshot
+        ptrs = np.fromiter(dex.obj_map.keys(), dtype=np.int64, count=len(dex.obj_map))
+        self.keys = Int64toInt64Map_from_buffers(ptrs, np.arange(len(ptrs)))
+        self.next_key = len(ptrs)
+        self._open_log(generation)
+        self.compact_due = False
+
+    def _open_log(self, generation: int):
+        """Append to the log of this generation from now on, and delete the files of older generations."""
+        if self.fh is not None:
+            self.fh.close()
+        self.generation = generation
+        self.fh = open(os.path.join(self.path, LOG_FILE.format(generation)), "ab")
+        for name in os.listdir(self.path):
+            m = _FILE_PATTERN.fullmatch(name)
+            if m and int(m.group(2)) < generation:
+                os.remove(os.path.join(self.path, name))
+
+
+def start_journal(
+    box: Union[Dex, ConcurrentDex],
+    path: str,
+    sync: bool = False,
+    compact_ratio: Optional[float] = 1.0,
+) -> Journal:
+    """Keep the box on disk in the directory at path. Writes a snapshot now, then logs each change.
+
+    Args:
+        box: The Dex or ConcurrentDex.
+
+        path: The directory. Created if it doesn't exist. Anything journaled there before is replaced.
+
+        sync: If True, each record is synced to disk before the change returns, so it survives the machine
+            crashing. Slower. Default False.
+
+        compact_ratio: Write a new snapshot once the log is this many times the size of the snapshot.
+            None to only do so when ``Journal.compact()`` is called. Default 1.0.
+            A ConcurrentDex compacts after the change that made it due, once the write lock is released, holding only
+            a read lock. Changes made through ``box.box`` under ``write_lock()`` are compacted after the next change
+            through the ConcurrentDex, or by ``Journal.compact()``.
+
+    Returns:
+        The Journal.
+    """
+    if not isinstance(box, (Dex, ConcurrentDex)):
+        raise TypeError("Only a Dex or ConcurrentDex can be journaled.")
+    os.makedirs(path, exist_ok=True)
+    journal = Journal(box, path, sync, compact_ratio)
+    journal.generation = max(_generations(path), default=-1)
+    # attach only after the snapshot, with no writes in between
+    if isinstance(box, ConcurrentDex):
+        with box.write_lock():
+            journal._compact()
+            box.box.journal = journal
+    else:
+        journal._compact()
+        box.journal = journal
+    return journal
+
+
+def load_journal(
+    path: str,
+    sync: bool = False,
+    compact_ratio: Optional[float] = 1.0,
+) -> Union[Dex, ConcurrentDex]:
+    """Load the box journaled in the directory at path: its last snapshot, with the logged changes replayed.
+    Changes are logged there again from now on, as in ``start_journal()``, whose args these are.
+    The Journal is the box's ``journal`` attribute; on a ConcurrentDex, that of its ``box``."""
+    generations = _generations(path)
+    if not generations:
+        raise FileNotFoundError(f"No journal snapshot in {path}")
+    generation = max(generations)
+    with open(os.path.join(path, SNAPSHOT_FILE.format(generation)), "rb") as fh:
+        saved = pickle.load(fh)  # nosec
+    box = c_load(saved) if "priority" in saved else m_load(saved)
+    journal = Journal(box, path, sync, compact_ratio)
+    journal.snapshot_size = os.path.getsize(
+        os.path.join(path, SNAPSHOT_FILE.format(generation))
+    )
+    log = os.path.join(path, LOG_FILE.format(generation))
+    if os.path.exists(log):
+        _replay(journal, log)
+    _dex(box).journal = journal
+    journal._open_log(generation)
+    return box
+
+
+def _replay(journal: Journal, log: str):
+    """Apply the records in the log to the journal's box, and cut off a record left incomplete by a crash."""
+    dex = _dex(journal.box)
+    # {key: object ID} while replaying; the journal keeps the reverse
+    ptrs = np.fromiter(dex.obj_map.keys(), dtype=np.int64, count=len(dex.obj_map))
+    key_to_ptr = Int64toInt64Map_from_buffers(np.arange(len(ptrs)), ptrs)
+    next_key = len(ptrs)
+    end = 0
+    with open(log, "rb") as fh:
+        for op, keys, objs in _read_records(fh):
+            end = fh.tell()
+            if op != ADD:
+                dex.remove_many([dex.obj_map[key_to_ptr.pop(key)] for key in keys])
+            if op != REMOVE:
+                dex.add_many(objs)
+                for key, obj in zip(keys, objs):
+                    key_to_ptr[key] = id(obj)
+                next_key = max(next_key, keys[-1] + 1)
+    if end < os.path.getsize(log):
+        os.truncate(log, end)
+    items = list(key_to_ptr.items())
+    journal.keys = Int64toInt64Map_from_buffers(
+        np.array([ptr for _, ptr in items], dtype=np.int64),
+        np.array([key for key, _ in items], dtype=np.int64),
+    )
+    journal.next_key = next_key
+
+
+def _read_records(fh) -> Iterable[tuple]:
+    """Read records until the end of the file, or until one is incomplete."""
+    while True:
+        header = fh.read(_LENGTH.size)
+        if len(header) < _LENGTH.size:
+            return
+        (length,) = _LENGTH.unpack(header)
+        data = fh.read(length)
+        if len(data) < length:
+            return
+        yield pickle.loads(data)  # nosec
+
+
+def _generations(path: str) -> List[int]:
+    """Get the generations of the snapshots in the directory."""
+    if not os.path.isdir(path):
+        return []
+    generations = []
+    for name in os.listdir(path):
+        m = _FILE_PATTERN.fullmatch(name)
+        if m and m.group(1) == "snapshot":
+            generations.append(int(m.group(2)))
+    return generations
+
+
+def _dex(box: Union[Dex, ConcurrentDex]) -> Dex:
+    return box.box if isinstance(box, ConcurrentDex) else box
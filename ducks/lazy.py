@@ -0,0 +1,50 @@
+"""
+Lazy query results, which look up objects only as they are consumed.
+"""
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import Sequence
+from typing import Union
+
+from ducks.constants import LAZY_CHUNK_SIZE
+
+
+class LazyResult:
+    """The result of a query made with ``find(query, lazy=True)``.
+
+    Holds the IDs of the matching objects, and only looks up the objects when they are asked for. Use it to take
+    the first few matches of a big result, or to stream through a big result in chunks.
+
+    Supports ``len()``, indexing, slicing, iteration, and ``chunks()``. A slice is looked up all at once, and returns
+    the same type that ``dex[query]`` would: a list for Dex, or a numpy array for FrozenDex.
+    """
+
+    def __init__(
+        self,
+        obj_ids: Sequence[int],
+        lookup: Callable[[Sequence[int]], Sequence[Any]],
+    ):
+        self.obj_ids = obj_ids
+        self.lookup = lookup
+
+    def chunks(self, size: int = LAZY_CHUNK_SIZE) -> Iterator[Sequence[Any]]:
+        """Look up the objects ``size`` at a time, and yield each chunk."""
+        if size < 1:
+            raise ValueError("size must be at least 1.")
+        for start in range(0, len(self.obj_ids), size):
+            yield self.lookup(self.obj_ids[start : start + size])
+
+    def __iter__(self) -> Iterator[Any]:
+        for chunk in self.chunks():
+            yield from chunk
+
+    def __getitem__(self, key: Union[int, slice]) -> Any:
+        if isinstance(key, slice):
+            return self.lookup(self.obj_ids[key])
+        # range() handles negative indexes and raises IndexError for us
+        i = range(len(self.obj_ids))[key]
+        return self.lookup(self.obj_ids[i : i + 1])[0]
+
+    def __len__(self):
+        return len(self.obj_ids)
@@ -0,0 +1,401 @@
+"""
+Backends that store the object IDs of each attribute value in a Dex.
+
+Each value of an attribute has a container holding the IDs of the objects that have it. The backend decides what
+kind of container that is, and does every operation on it. Values held by a single object are stored as a plain
+int by every backend here, since most values of a high-cardinality attribute are.
+
+ - ``HybridBackend``, the default, grows a container from an int to an array to an Int64Set as IDs are added.
+   Arrays are small and fast for a few IDs; Int64Sets have fast lookups for many.
+ - ``SortedBackend`` keeps IDs in a sorted array, plus small buffers of recently added and removed IDs that are
+   merged in once they get big. It takes 8 bytes per ID, where an Int64Set takes 10 to 20, so it saves memory on
+   values that many objects share. Lookups and changes are slower.
+
+A backend is chosen per Dex, or per attribute, with the ``backend`` argument of Dex.
+"""
+import abc
+from array import array
+from bisect import bisect_left
+from itertools import chain
+from timeit import timeit
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+from cykhash import Int64Set
+from cykhash import Int64Set_from_buffer
+from cykhash import isin_int64
+from ducks.constants import ARR_TYPE
+from ducks.constants import ARRAY_SIZE_MAX
+from ducks.constants import SET_SIZE_MIN
+from ducks.constants import SORTED_BUFFER_MIN
+from ducks.utils import cyk_intersect
+
+
+class IdSetBackend(abc.ABC):
+    """Creates and operates on the containers of object IDs. Subclass this to make a new backend; it must define
+    make, add, remove, size and iterate.
+
+    Containers are opaque to the index that holds them. Operations that change a container return the container
+    to store from then on, which may be a different object than the one passed in.
+    """
+
+    @abc.abstractmethod
+    def make(self, ptrs: List[int]) -> Any:
+        """Make a container holding one or more ptrs."""
+
+    @abc.abstractmethod
+    def add(self, container: Any, ptrs: List[int]) -> Any:
+        """Add ptrs that aren't in the container yet."""
+
+    @abc.abstractmethod
+    def remove(
+        self, container: Any, ptrs: List[int]
+    ) -> Tuple[Optional[Any], List[int]]:
+        """Remove the ptrs that are in the container. Returns the container, or None if it is now empty, and the
+        ptrs that were found in it."""
+
+    @abc.abstractmethod
+    def size(self, container: Any) -> int:
+        """Get the number of IDs in the container."""
+
+    @abc.abstractmethod
+    def iterate(self, container: Any) -> Iterable[int]:
+        """Get the IDs in the container."""
+
+    def to_set(self, container: Any) -> Int64Set:
+        """Get the IDs in the container as an Int64Set. It may be the container itself, so don't modify it."""
+        return self.union([container])
+
+    def flatten(self, containers: Iterable[Any]) -> Tuple[array, List[Int64Set]]:
+        """Get the IDs in the containers as an array, plus a list of Int64Sets holding more of them. Bulk operations
+        on many containers use this, so a backend can hand over the arrays and sets it already has."""
+        flat = array(ARR_TYPE)
+        for container in containers:
+            flat.extend(self.iterate(container))
+        return flat, []
+
+    def union(self, containers: Iterable[Any]) -> Int64Set:
+        """Get the IDs in any of the containers as a new Int64Set."""
+        flat, sets = self.flatten(containers)
+        n = len(flat) + sum(len(id_set) for id_set in sets)
+        if len(flat):
+            # reads the array several times faster than adding its IDs one at a time, and sizes the table for all
+            # the IDs up front, so it isn't rehashed as the sets are added
+            obj_ids = Int64Set_from_buffer(flat, n / len(flat))
+        else:
+            obj_ids = Int64Set(number_of_elements_hint=n)
+        for id_set in sets:
+            obj_ids.update(id_set)
+        return obj_ids
+
+    def filter(self, containers: Iterable[Any], obj_ids: Int64Set) -> Int64Set:
+        """Get the obj_ids that are in any of the containers. Probes obj_ids with the containers' IDs in bulk,
+        without making a set of them."""
+        flat, sets = self.flatten(containers)
+        found = np.zeros(len(flat), dtype=bool)
+        isin_int64(flat, obj_ids, found)
+        hits = Int64Set_from_buffer(np.frombuffer(flat, dtype="int64")[found])
+        for id_set in sets:
+            hits.update(cyk_intersect(obj_ids, id_set))
+        return hits
+
+    def count_common(self, container: Any, obj_ids: Int64Set) -> int:
+        """Count the obj_ids that are in the container."""
+        return len(self.filter([container], obj_ids))
+
+
+class HybridBackend(IdSetBackend):
+    """Stores one ID as an int, up to ``array_size_max`` IDs as an array, and more as an Int64Set.
+    An Int64Set shrinks back to an array once it has fewer than ``set_size_min`` IDs. Keeping the two thresholds
+    apart stops a value that hovers around one size from switching back and forth."""
+
+    def __init__(
+        self, array_size_max: int = ARRAY_SIZE_MAX, set_size_min: int = SET_SIZE_MIN
+    ):
+        if array_size_max < 1 or not 2 <= set_size_min <= array_size_max + 1:
+            raise ValueError(
+                "Need array_size_max >= 1 and 2 <= set_size_min <= array_size_max + 1."
+            )
+        self.array_size_max = array_size_max
+        self.set_size_min = set_size_min
+
+    @classmethod
+    def tuned(cls) -> "HybridBackend":
+        """Get a HybridBackend with thresholds measured on this machine. Arrays take less memory than Int64Sets, so
+        ``array_size_max`` is the largest size at which an array lookup is at most twice as slow as an Int64Set
+        lookup. The measurement takes a few milliseconds and is done once per process."""
+        global _tuned_thresholds
+        if _tuned_thresholds is None:
+            _tuned_thresholds = _measure_thresholds()
+        return cls(*_tuned_thresholds)
+
+    def make(self, ptrs: List[int]) -> Union[int, array, Int64Set]:
+        if len(ptrs) == 1:
+            return ptrs[0]
+        if len(ptrs) <= self.array_size_max:
+            return array(ARR_TYPE, ptrs)
+        return Int64Set(ptrs)
+
+    def add(
+        self, container: Union[int, array, Int64Set], ptrs: List[int]
+    ) -> Union[int, array, Int64Set]:
+        if type(container) is Int64Set:
+            container.update(ptrs)
+            return container
+        if type(container) is array:
+            if len(container) + len(ptrs) <= self.array_size_max:
+                container.extend(ptrs)
+                return container
+            return self.make(list(container) + ptrs)
+        return self.make([container] + ptrs)
+
+    def remove(
+        self, container: Union[int, array, Int64Set], ptrs: List[int]
+    ) -> Tuple[Optional[Union[int, array, Int64Set]], List[int]]:
+        if type(container) is Int64Set:
+            found = [ptr for ptr in ptrs if ptr in container]
+            for ptr in found:
+                container.discard(ptr)
+            if len(container) >= self.set_size_min:
+                return container, found
+            remaining = list(container)
+        elif type(container) is array:
+            found = [ptr for ptr in ptrs if ptr in container]
+            found_set = set(found)
+            remaining = [ptr for ptr in container if ptr not in found_set]
+        else:
+            found = [ptr for ptr in ptrs if ptr == container]
+            remaining = [] if found else [container]
+        if not found:
+            return container, found
+        if len(remaining) == 0:
+            return None, found
+        if len(remaining) == 1:
+            return remaining[0], found
+        return array(ARR_TYPE, remaining), found
+
+    def size(self, container: Union[int, array, Int64Set]) -> int:
+        if type(container) in [array, Int64Set]:
+            return len(container)
+        return 1
+
+    def iterate(self, container: Union[int, array, Int64Set]) -> Iterable[int]:
+        if type(container) in [array, Int64Set]:
+            return container
+        return (container,)
+
+    def to_set(self, container: Union[int, array, Int64Set]) -> Int64Set:
+        if type(container) is Int64Set:
+            return container
+        if type(container) is array:
+            return Int64Set_from_buffer(container)
+        return Int64Set([container])
+
+    def flatten(
+        self, containers: Iterable[Union[int, array, Int64Set]]
+    ) -> Tuple[array, List[Int64Set]]:
+        flat = array(ARR_TYPE)
+        sets = []
+        for container in containers:
+            if type(container) is int:
+                flat.append(container)
+            elif type(container) is array:
+                flat.extend(container)
+            else:
+                sets.append(container)
+        return flat, sets
+
+    def count_common(
+        self, container: Union[int, array, Int64Set], obj_ids: Int64Set
+    ) -> int:
+        if type(container) is Int64Set:
+            return len(cyk_intersect(container, obj_ids))
+        if type(container) is array:
+            return sum(1 for ptr in container if ptr in obj_ids)
+        return int(container in obj_ids)
+
+    def __repr__(self):
+        return f"HybridBackend(array_size_max={self.array_size_max}, set_size_min={self.set_size_min})"
+
+
+class SortedIds:
+    """The IDs of one value in a SortedBackend. ``ids`` is sorted. ``added`` holds IDs that aren't in ``ids``,
+    and ``removed`` holds IDs of ``ids`` that are no longer present. Each buffer is None until it is needed, since
+    most containers are never changed after they are made."""
+
+    __slots__ = ("ids", "added", "removed")
+
+    def __init__(self, ids: array):
+        self.ids = ids
+        self.added = None
+        self.removed = None
+
+    def __len__(self):
+        n = len(self.ids)
+        if self.added:
+            n += len(self.added)
+        if self.removed:
+            n -= len(self.removed)
+        return n
+
+    def __contains__(self, ptr: int) -> bool:
+        if self.added and ptr in self.added:
+            return True
+        i = bisect_left(self.ids, ptr)
+        if i == len(self.ids) or self.ids[i] != ptr:
+            return False
+        return not self.removed or ptr not in self.removed
+
+    def __iter__(self):
+        ids = self.ids
+        if self.removed:
+            ids = (ptr for ptr in ids if ptr not in self.removed)
+        if self.added:
+            return chain(ids, self.added)
+        return iter(ids)
+
+
+class SortedBackend(IdSetBackend):
+    """Stores one ID as an int, and more in a SortedIds: a sorted array of IDs, plus buffers of IDs added and
+    removed since. The buffers are merged into the array once they hold more than ``buffer_min`` IDs and more
+    than 1/``buffer_ratio`` of the array, which keeps the merging cost per change low."""
+
+    def __init__(self, buffer_min: int = SORTED_BUFFER_MIN, buffer_ratio: int = 8):
+        if buffer_min < 0 or buffer_ratio < 1:
+            raise ValueError("Need buffer_min >= 0 and buffer_ratio >= 1.")
+        self.buffer_min = buffer_min
+        self.buffer_ratio = buffer_ratio
+
+    def make(self, ptrs: List[int]) -> Union[int, SortedIds]:
+        if len(ptrs) == 1:
+            return ptrs[0]
+        return SortedIds(array(ARR_TYPE, sorted(ptrs)))
+
+    def add(
+        self, container: Union[int, SortedIds], ptrs: List[int]
+    ) -> Union[int, SortedIds]:
+        if type(container) is not SortedIds:
+            return self.make([container] + ptrs)
+        if container.added is None:
+            container.added = Int64Set()
+        for ptr in ptrs:
+            if container.removed and ptr in container.removed:
+                container.removed.discard(ptr)
+            else:
+                container.added.add(ptr)
+        return self._maybe_merge(container)
+
+    def remove(
+        self, container: Union[int, SortedIds], ptrs: List[int]
+    ) -> Tuple[Optional[Union[int, SortedIds]], List[int]]:
+        if type(container) is not SortedIds:
+            found = [ptr for ptr in ptrs if ptr == container]
+            return (None if found else container), found
+        if container.removed is None:
+            container.removed = Int64Set()
+        found = []
+        for ptr in ptrs:
+            if container.added and ptr in container.added:
+                container.added.discard(ptr)
+                found.append(ptr)
+            elif ptr in container:
+                container.removed.add(ptr)
+                found.append(ptr)
+        n = len(container)
+        if n == 0:
+            return None, found
+        if n == 1:
+            return next(iter(container)), found
+        return self._maybe_merge(container), found
+
+    def size(self, container: Union[int, SortedIds]) -> int:
+        if type(container) is SortedIds:
+            return len(container)
+        return 1
+
+    def iterate(self, container: Union[int, SortedIds]) -> Iterable[int]:
+        if type(container) is SortedIds:
+            return container
+        return (container,)
+
+    def flatten(
+        self, containers: Iterable[Union[int, SortedIds]]
+    ) -> Tuple[array, List[Int64Set]]:
+        flat = array(ARR_TYPE)
+        sets = []
+        for container in containers:
+            if type(container) is int:
+                flat.append(container)
+            elif container.removed:
+                flat.extend(container)
+            else:
+                flat.extend(container.ids)
+                if container.added:
+                    sets.append(container.added)
+        return flat, sets
+
+    def _maybe_merge(self, container: SortedIds) -> SortedIds:
+        """Merge the buffers into the sorted array if they have gotten big."""
+        added = container.added or ()
+        removed = container.removed or ()
+        n_buffered = len(added) + len(removed)
+        if n_buffered <= max(self.buffer_min, len(container.ids) // self.buffer_ratio):
+            return container
+        ids = np.frombuffer(container.ids, dtype="int64")
+        if removed:
+            ids = ids[~np.isin(ids, np.fromiter(removed, dtype="int64"))]
+        added = np.fromiter(added, dtype="int64")
+        # both parts are sorted, and a stable sort merges sorted runs
+        merged = np.sort(np.concatenate([ids, np.sort(added)]), kind="stable")
+        return SortedIds(array(ARR_TYPE, merged.tobytes()))
+
+    def __repr__(self):
+        return f"SortedBackend(buffer_min={self.buffer_min}, buffer_ratio={self.buffer_ratio})"
+
+
+BACKENDS = {
+    "hybrid": HybridBackend,
+    "sorted": SortedBackend,
+    "tuned": HybridBackend.tuned,
+}
+
+_tuned_thresholds = None
+
+
+def get_backend(
+    backend: Union[str, IdSetBackend, Dict[Any, Any]], attr: Any
+) -> IdSetBackend:
+    """Get the backend for an attribute from Dex's ``backend`` argument: a backend, the name of one, or a dict of
+    ``{attribute: backend}``, where attributes not in the dict get the default."""
+    if isinstance(backend, dict):
+        backend = backend.get(attr, "hybrid")
+    if isinstance(backend, IdSetBackend):
+        return backend
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Invalid backend: {backend}. Must be an IdSetBackend, or one of {list(BACKENDS)}."
+        )
+    return BACKENDS[backend]()
+
+
+def _measure_thresholds() -> Tuple[int, int]:
+    """Find the largest array size at which looking up a missing ID in an array is at most twice as slow as in an
+    Int64Set. Returns (array_size_max, set_size_min)."""
+    n_lookups = 2000
+    array_size_max = 4
+    for size in [8, 16, 32, 64, 128]:
+        ptrs = list(range(size))
+        arr = array(ARR_TYPE, ptrs)
+        id_set = Int64Set(ptrs)
+        arr_time = timeit(lambda: -1 in arr, number=n_lookups)
+        set_time = timeit(lambda: -1 in id_set, number=n_lookups)
+        if arr_time > 2 * set_time:
+            break
+        array_size_max = size
+    return array_size_max, max(2, array_size_max // 2)
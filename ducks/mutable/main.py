@@ -1,4 +1,6 @@
 import pickle  # nosec
+from array import array
+from itertools import islice
 from operator import itemgetter
 from typing import Any
 from typing import Callable
@@ -7,14 +9,33 @@ from typing import Iterable
 from typing import List
 from typing import Optional
 from typing import Set
+from typing import Tuple
 from typing import Union
 
 from cykhash import Int64Set
+from ducks.aggregate import compute_aggregates
+from ducks.aggregate import parse_aggregates
+from ducks.aggregate import values_from_counts
+from ducks.compiled import CompiledQuery
+from ducks.compiled import get_plan
+from ducks.constants import ARR_TYPE
+from ducks.constants import RANGE_OPERATORS
+from ducks.exceptions import AttributeNotFoundError
+from ducks.lazy import LazyResult
+from ducks.mutable.backends import get_backend
+from ducks.mutable.backends import IdSetBackend
 from ducks.mutable.mutable_attr import MutableAttrIndex
+from ducks.mutable.observable import add_observer
+from ducks.mutable.result_cache import ResultCache
+from ducks.utils import build_indexes
 from ducks.utils import cyk_intersect
-from ducks.utils import cyk_union
-from ducks.utils import split_query
-from ducks.utils import standardize_expr
+from ducks.utils import make_query_key
+from ducks.utils import make_term_key
+from ducks.utils import parse_query
+from ducks.utils import split_order_range
+from ducks.utils import use_composites
+from ducks.utils import validate_attr
+from ducks.utils import validate_order
 from ducks.utils import validate_query
 
 
@@ -23,6 +44,12 @@ class Dex:
         self,
         objs: Optional[Iterable[Any]] = None,
         on: Iterable[Union[str, Callable]] = None,
+        workers: Optional[int] = None,
+        cache_size: Optional[int] = None,
+        backend: Union[str, IdSetBackend, Dict] = "hybrid",
+        reverse_map: Union[bool, Iterable[Union[str, Callable]]] = False,
+        observe: bool = False,
+        max_pending: Optional[int] = None,
     ):
         """
         Create a Dex containing the ``objs``, queryable by the ``on`` attributes.
@@ -32,6 +59,29 @@ class Dex:
 
             on: The attributes that will be used for finding objects.
                 Must contain at least one.
+                A tuple of attributes, such as ``('region', 'tier')``, builds a composite index on their values,
+                which is used for queries having '==' on each of them but the last, and '==' or a range on the last.
+
+            workers: Number of threads used to build the attribute indexes concurrently. Optional.
+                Helps most when attribute functions release the GIL, e.g. by calling into numpy or doing I/O.
+
+            cache_size: If set, query results are cached, up to this many objects in total across all cached results.
+                Changes to the Dex drop only the cached results they affect. Optional.
+
+            backend: How the object IDs of each attribute value are stored. Either 'hybrid' (the default), 'sorted',
+                'tuned', an ``IdSetBackend`` instance, or a dict of ``{attribute: backend}`` to choose per attribute;
+                attributes not in the dict use 'hybrid'. See ``ducks.mutable.backends``.
+
+            reverse_map: If True, or for the attributes listed, keep a map from each object to its stored value.
+                Then removing or updating an object whose attribute changed is O(log n) instead of a search through
+                every value, and ``update()`` leaves attributes whose values didn't change alone. Costs about 20 bytes
+                per object per attribute. Default False.
+
+            observe: If True, objects that subclass ``ducks.Observable`` are updated automatically when an indexed
+                attribute is assigned. The updates are batched: they're applied by ``flush()``, which runs before
+                each query. Default False.
+
+            max_pending: With ``observe``, also flush once this many objects have pending updates. Optional.
 
         It's OK if the objects in ``objs`` are missing some or all of the attributes in ``on``.
 
@@ -49,15 +99,43 @@ class Dex:
         else:
             self.obj_map = dict()
 
+        self.cache_size = cache_size
+        self._cache = None if cache_size is None else ResultCache(cache_size)
+
         # Build an index for each attribute
-        self._indexes = {}
-        for attr in on:
-            self._indexes[attr] = MutableAttrIndex(attr, objs)
+        unique_objs = list(self.obj_map.values())
+        self.backend = backend
+        if not isinstance(reverse_map, bool):
+            reverse_map = set(reverse_map)
+        self.reverse_map = reverse_map
+        self._indexes = build_indexes(
+            lambda attr: MutableAttrIndex(
+                attr,
+                unique_objs,
+                get_backend(backend, attr),
+                reverse_map is True
+                or (reverse_map is not False and attr in reverse_map),
+            ),
+            on,
+            workers,
+        )
+
+        # Pending updates of Observable objects: {object ID: index keys to update}
+        self.observe = observe
+        self.max_pending = max_pending
+        self._pending = dict()
+        self._pending_keys = dict()
+        if observe:
+            add_observer(self)
+
+        # Set by ducks.journal.start_journal() to log each change
+        self.journal = None
 
     def _find(
         self,
         match: Dict[Union[str, Callable], Dict[str, Any]],
         exclude: Dict[Union[str, Callable], Dict[str, Any]],
+        memo: Optional[Dict] = None,
     ) -> List:
         """Find objects in the Dex that satisfy the match and exclude constraints.
 
@@ -84,13 +162,173 @@ class Dex:
                 Each attribute is a string or Callable. Must be one of the attributes specified in the constructor.
                 Valid expressions are the same as in ``match``.
 
+            memo: Dict of term matches shared by the queries of one ``find_many()`` call. Optional.
+
         Returns:
             List of objects matching the constraints. List will be unordered.
         """
+        self.flush()
         # validate input and convert expressions to dict
+        match = use_composites(self._indexes, match)
         validate_query(self._indexes, match, exclude)
-        obj_ids = self._find_ids(match, exclude)
-        return self._obj_ids_to_objs(obj_ids)
+        if self._cache is None:
+            return self._obj_ids_to_objs(self._find_ids(match, exclude, memo))
+        key = self._cache.make_key(match, exclude)
+        if key is not None:
+            objs = self._cache.get(key)
+            if objs is not None:
+                return objs
+        obj_ids = self._find_ids(match, exclude, memo)
+        objs = self._obj_ids_to_objs(obj_ids)
+        if key is not None:
+            self._cache.put(key, match, obj_ids, objs)
+        return objs
+
+    def find_many(self, queries: Iterable[Dict]) -> List[List[Any]]:
+        """Find the objects matching each of several queries. Same as ``[dex[q] for q in queries]``, but faster
+        when the queries overlap: a term that appears in several queries is looked up once, and a repeated query
+        is run once.
+
+        Args:
+            queries: Iterable of queries. Each is a dict of ``{attribute: expression}``, same as in ``dex[query]``.
+
+        Returns:
+            List of results, one for each query, in the same order as the queries.
+        """
+        parsed = [parse_query(query) for query in queries]
+        memo = dict()
+        done = dict()
+        results = []
+        for match, exclude in parsed:
+            key = make_query_key(match, exclude)
+            if key in done:
+                results.append(list(done[key]))
+                continue
+            objs = self._find(match, exclude, memo)
+            if key is not None:
+                done[key] = objs
+            results.append(objs)
+        return results
+
+    def compile(self, query: Dict) -> CompiledQuery:
+        """Parse and validate a query template once, so it can be run many times with different values.
+
+        Args:
+            query: Dict of ``{attribute: expression}``, same as in ``dex[query]``. Any value may be a
+                ``ducks.Param``, which is filled in when the query is run.
+
+        Returns:
+            A CompiledQuery. Call it with a keyword argument for each Param to get the matching objects.
+
+        Example::
+
+            q = dex.compile({'x': Param('x'), 'y': {'>': Param('min_y')}})
+            q(x=1, min_y=5)  # same as dex[{'x': 1, 'y': {'>': 5}}]
+        """
+        plan = get_plan(query)
+        validate_query(
+            self._indexes, use_composites(self._indexes, plan.match), plan.exclude
+        )
+        return CompiledQuery(self, plan)
+
+    def count(self, query: Dict) -> int:
+        """Count the objects that satisfy the query. Same as ``len(dex[query])``, but the objects are not looked up.
+
+        Args:
+            query: Dict of ``{attribute: expression}``, same as in ``dex[query]``.
+        """
+        self.flush()
+        match, exclude = parse_query(query)
+        match = use_composites(self._indexes, match)
+        validate_query(self._indexes, match, exclude)
+        if len(match) == 1 and not exclude:
+            attr, expr = next(iter(match.items()))
+            if list(expr) == ["=="]:
+                # count straight from the size of the value's container
+                return self._indexes[attr].count(expr["=="])
+        return len(self._find_ids(match, exclude))
+
+    def exists(self, query: Dict) -> bool:
+        """Check if any object satisfies the query. Stops at the first match, and does not look up any objects.
+
+        Args:
+            query: Dict of ``{attribute: expression}``, same as in ``dex[query]``.
+        """
+        self.flush()
+        match, exclude = parse_query(query)
+        match = use_composites(self._indexes, match)
+        validate_query(self._indexes, match, exclude)
+        if match:
+            hit_sets = []
+            for attr, expr in match.items():
+                hit_set = self._match_attr_expr(attr, expr)
+                if len(hit_set) == 0:
+                    return False
+                hit_sets.append(hit_set)
+            hit_sets.sort(key=len)
+            candidates = hit_sets.pop(0)
+        else:
+            candidates = self.obj_map.keys()
+            hit_sets = []
+        exc_sets = [self._match_attr_expr(attr, expr) for attr, expr in exclude.items()]
+        # check the candidates one at a time, instead of building the intersection
+        for ptr in candidates:
+            if all(ptr in s for s in hit_sets) and not any(ptr in s for s in exc_sets):
+                return True
+        return False
+
+    def group_counts(self, query: Dict, by: Union[str, Callable]) -> Dict[Any, int]:
+        """Count the objects that satisfy the query, grouped by their value of the ``by`` attribute. Same as
+        running ``count()`` once per value, but done in one pass, without looking up any objects.
+
+        Args:
+            query: Dict of ``{attribute: expression}``, same as in ``dex[query]``.
+
+            by: The attribute to group by. Must be one of the attributes specified in the constructor.
+
+        Returns:
+            Dict of ``{value: count}``. Values with no matching objects are left out, and so are matching objects
+            that don't have the ``by`` attribute.
+        """
+        self.flush()
+        match, exclude = parse_query(query)
+        match = use_composites(self._indexes, match)
+        validate_query(self._indexes, match, exclude)
+        validate_attr(self._indexes, by, "group by")
+        hits = self._find_ids(match, exclude) if match or exclude else None
+        return self._indexes[by].value_counts(hits)
+
+    def aggregate(
+        self, query: Dict, aggs: Dict[Union[str, Callable], Union[str, List[str]]]
+    ) -> Dict[Union[str, Callable], Dict[str, Any]]:
+        """Compute numeric aggregates over the attribute values of the objects that satisfy the query.
+        The values are counted from the indexes, so no objects are looked up.
+
+        Args:
+            query: Dict of ``{attribute: expression}``, same as in ``dex[query]``.
+
+            aggs: Dict of ``{attribute: aggregates}``, such as ``{'latency': ['sum', 'max', 'p99']}``.
+                Valid aggregates are 'count', 'sum', 'min', 'max', 'mean', and percentiles like 'p50' or 'p99.9'.
+                Each attribute must be one of the attributes specified in the constructor.
+
+        Returns:
+            Dict of ``{attribute: {aggregate: value}}``. Objects that don't have the attribute, or have None for it,
+            are left out of its aggregates. With no values, 'sum' is 0, and the others except 'count' are None.
+            Raises TypeError if the values of an attribute aren't all numbers.
+        """
+        self.flush()
+        aggs = parse_aggregates(aggs)
+        match, exclude = parse_query(query)
+        match = use_composites(self._indexes, match)
+        validate_query(self._indexes, match, exclude)
+        for attr in aggs:
+            validate_attr(self._indexes, attr, "aggregate")
+        hits = self._find_ids(match, exclude) if match or exclude else None
+        result = dict()
+        for attr, ops in aggs.items():
+            values = values_from_counts(self._indexes[attr].value_counts(hits))
+            result[attr] = compute_aggregates(values, ops)
+        return result
 
     def add(self, obj: Any):
         """Add the object, evaluating any attributes and storing the results.
@@ -101,6 +339,10 @@ class Dex:
         self.obj_map[ptr] = obj
         for attr in self._indexes:
             self._indexes[attr].add(ptr, obj)
+        if self._cache is not None:
+            self._cache.on_add(obj)
+        if self.journal is not None:
+            self.journal.on_add([obj])
 
     def remove(self, obj: Any):
         """Remove the object. Raises KeyError if not present."""
@@ -111,11 +353,180 @@ class Dex:
         for attr in self._indexes:
             self._indexes[attr].remove(ptr, obj)
         del self.obj_map[ptr]
+        self._pending.pop(ptr, None)
+        if self._cache is not None:
+            self._cache.on_remove(ptr)
+        if self.journal is not None:
+            self.journal.on_remove([obj])
+
+    def update(self, obj: Any, attrs: Optional[Iterable[Union[str, Callable]]] = None):
+        """Update the stored attributes of the object. Raises KeyError if object not present.
 
-    def update(self, obj: Any):
-        """Remove and re-add the object, updating all stored attributes. Raises KeyError if object not present."""
-        self.remove(obj)
-        self.add(obj)
+        Args:
+            obj: The object, whose attributes changed.
+
+            attrs: The attributes that changed, if known. Only their indexes, and the composite indexes that include
+                them, are updated. Optional; by default all attributes are updated. Attributes with a reverse map
+                are only changed if their value did, either way.
+        """
+        ptr = id(obj)
+        if ptr not in self.obj_map:
+            raise KeyError
+        for attr in self._attrs_to_update(attrs):
+            self._indexes[attr].update(ptr, obj)
+        if attrs is None:
+            self._pending.pop(ptr, None)
+        if self._cache is not None:
+            self._cache.on_remove(ptr)
+            self._cache.on_add(obj)
+        if self.journal is not None:
+            self.journal.on_update([obj])
+
+    def add_many(self, objs: Iterable[Any]):
+        """Add many objects. Faster than calling ``add()`` on each one, because the objects are grouped by attribute
+        value, and each value is updated once. Objects that are already present will not be updated."""
+        new_objs = dict()
+        for obj in objs:
+            ptr = id(obj)
+            if ptr not in self.obj_map:
+                new_objs[ptr] = obj
+        if not new_objs:
+            return
+        self.obj_map.update(new_objs)
+        ptrs = list(new_objs.keys())
+        objs = list(new_objs.values())
+        for attr in self._indexes:
+            self._indexes[attr].add_many(ptrs, objs)
+        if self._cache is not None:
+            for obj in objs:
+                self._cache.on_add(obj)
+        if self.journal is not None:
+            self.journal.on_add(objs)
+
+    def remove_many(self, objs: Iterable[Any]):
+        """Remove many objects. Faster than calling ``remove()`` on each one.
+        Raises KeyError if any object is not present, in which case no objects are removed."""
+        to_remove = dict()
+        for obj in objs:
+            ptr = id(obj)
+            if ptr not in self.obj_map:
+                raise KeyError
+            to_remove[ptr] = obj
+        ptrs = list(to_remove.keys())
+        objs = list(to_remove.values())
+        for attr in self._indexes:
+            self._indexes[attr].remove_many(ptrs, objs)
+        for ptr in ptrs:
+            del self.obj_map[ptr]
+            self._pending.pop(ptr, None)
+            if self._cache is not None:
+                self._cache.on_remove(ptr)
+        if self.journal is not None:
+            self.journal.on_remove(objs)
+
+    def update_many(
+        self,
+        objs: Iterable[Any],
+        attrs: Optional[Iterable[Union[str, Callable]]] = None,
+    ):
+        """Update the stored attributes of many objects. Faster than calling ``update()`` on each one.
+        If given, only the ``attrs`` are updated, as in ``update()``.
+        Raises KeyError if any object is not present, in which case no objects are updated."""
+        to_update_attrs = self._attrs_to_update(attrs)
+        to_update = dict()
+        for obj in objs:
+            ptr = id(obj)
+            if ptr not in self.obj_map:
+                raise KeyError
+            to_update[ptr] = obj
+        ptrs = list(to_update.keys())
+        objs = list(to_update.values())
+        for attr in to_update_attrs:
+            self._indexes[attr].update_many(ptrs, objs)
+        if attrs is None:
+            for ptr in ptrs:
+                self._pending.pop(ptr, None)
+        if self._cache is not None:
+            for ptr, obj in to_update.items():
+                self._cache.on_remove(ptr)
+                self._cache.on_add(obj)
+        if self.journal is not None:
+            self.journal.on_update(objs)
+
+    def _attrs_to_update(
+        self, attrs: Optional[Iterable[Union[str, Callable]]]
+    ) -> List[Union[str, Callable, Tuple]]:
+        """Get the indexes that may change when the attrs change: their own, and the composites that include them.
+        All indexes if attrs is None."""
+        if attrs is None:
+            return list(self._indexes)
+        if isinstance(attrs, str):
+            attrs = [attrs]
+        attrs = list(attrs)
+        composites = [key for key in self._indexes if isinstance(key, tuple)]
+        for attr in attrs:
+            if attr not in self._indexes and not any(attr in c for c in composites):
+                raise AttributeNotFoundError(
+                    f"Cannot update: {attr}. Attributes must be specified on creation."
+                )
+        return [
+            key
+            for key in self._indexes
+            if key in attrs or (key in composites and any(a in key for a in attrs))
+        ]
+
+    def flush(self):
+        """Apply the pending updates of Observable objects whose indexed attributes were assigned.
+        Called before each query, so there's only a need to call it to control when the work is done.
+        Each index gets one ``update_many()`` of the objects whose attributes in it changed."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, dict()
+        ptrs_by_key = {key: [] for key in self._indexes}
+        for ptr, keys in pending.items():
+            for key in keys:
+                ptrs_by_key[key].append(ptr)
+        for key, ptrs in ptrs_by_key.items():
+            if ptrs:
+                objs = [self.obj_map[ptr] for ptr in ptrs]
+                self._indexes[key].update_many(ptrs, objs)
+        if self._cache is not None:
+            for ptr in pending:
+                self._cache.on_remove(ptr)
+                self._cache.on_add(self.obj_map[ptr])
+        if self.journal is not None:
+            self.journal.on_update([self.obj_map[ptr] for ptr in pending])
+
+    def _on_assign(self, obj: Any, name: str):
+        """Called by an Observable object when its attribute called name is assigned or deleted."""
+        ptr = id(obj)
+        if ptr not in self.obj_map:
+            return
+        keys = self._pending_keys.get(name)
+        if keys is None:
+            keys = self._keys_using(name)
+            self._pending_keys[name] = keys
+        if not keys:
+            return
+        if ptr in self._pending:
+            self._pending[ptr].update(keys)
+        else:
+            self._pending[ptr] = set(keys)
+            if self.max_pending is not None and len(self._pending) >= self.max_pending:
+                self.flush()
+
+    def _keys_using(self, name: str) -> List[Union[str, Callable, Tuple]]:
+        """Get the indexes whose values may depend on the attribute called name. Indexes on functions could
+        read any attribute, so they're always included."""
+
+        def uses(attr):
+            return attr == name or callable(attr)
+
+        return [
+            key
+            for key in self._indexes
+            if uses(key) or (isinstance(key, tuple) and any(map(uses, key)))
+        ]
 
     def get_values(self, attr: Union[str, Callable]) -> Set:
         """Get the unique values we have for the given attribute.
@@ -126,48 +537,63 @@ class Dex:
         Returns:
             Set of all unique values for this attribute.
         """
+        self.flush()
         return self._indexes[attr].get_values()
 
     def _find_ids(
         self,
         match: Optional[Dict[Union[str, Callable], Dict]] = None,
         exclude: Optional[Dict[Union[str, Callable], Dict]] = None,
+        memo: Optional[Dict] = None,
     ) -> Int64Set:
-        """Perform lookup based on given constraints. Return a set of object IDs."""
+        """Perform lookup based on given constraints. Return a set of object IDs.
+        If memo is given, the matches of the first term are looked up in it, and stored there."""
         # perform 'match' query
         if match:
-            # find intersection of each attr
-            hit_sets = []
-            for attr, expr in match.items():
-                hit_set = self._match_attr_expr(attr, expr)
-                if len(hit_set) == 0:
-                    # this attr had no matches, therefore the intersection will be empty. We can stop here.
-                    return Int64Set()
-                hit_sets.append(hit_set)
-
-            for i, hit_set in enumerate(sorted(hit_sets, key=len)):
-                # intersect this attr's hits with our hits so far
-                if i == 0:
-                    hits = hit_set
-                else:
-                    hits = cyk_intersect(hits, hit_set)
+            # Find the hits for the term that matches the fewest objects, then filter those hits by the other terms.
+            # Ranges are estimated last, since counting them takes longer, and the cap from other terms cuts it short.
+            cap = len(self.obj_map)
+            estimates = dict()
+            for attr in sorted(
+                match, key=lambda a: any(op in match[a] for op in RANGE_OPERATORS)
+            ):
+                estimates[attr] = self._indexes[attr].estimate(match[attr], cap)
+                cap = min(cap, estimates[attr])
+            attrs = sorted(match, key=estimates.get)
+            if estimates[attrs[0]] == 0:
+                # the intersection will be empty. We can stop here.
+                return Int64Set()
+            hits = self._match_term(attrs[0], match[attrs[0]], memo)
+            for attr in attrs[1:]:
+                hits = self._indexes[attr].filter_ids(match[attr], hits)
+                if len(hits) == 0:
+                    return hits
         else:
             # 'match' is unspecified, so match all objects
             hits = Int64Set(self.obj_map.keys())
 
         # perform 'exclude' query
         if exclude:
-            exc_sets = []
             for attr, expr in exclude.items():
-                exc_sets.append(self._match_attr_expr(attr, expr))
-
-            for exc_set in sorted(exc_sets, key=len, reverse=True):
+                exc_set = self._indexes[attr].filter_ids(expr, hits)
                 hits = Int64Set.difference(hits, exc_set)
                 if len(hits) == 0:
                     break
 
         return hits
 
+    def _match_term(
+        self, attr: Union[str, Callable], expr: Dict[str, Any], memo: Optional[Dict]
+    ) -> Int64Set:
+        """Get the matches of one term, reusing them from memo if an earlier query had the same term.
+        The matches may be the index's own set, so they must not be modified."""
+        key = None if memo is None else make_term_key(attr, expr)
+        if key is None:
+            return self._match_attr_expr(attr, expr)
+        if key not in memo:
+            memo[key] = self._match_attr_expr(attr, expr)
+        return memo[key]
+
     def _match_attr_expr(
         self, attr: Union[str, Callable], expr: Dict[str, Any]
     ) -> Int64Set:
@@ -201,13 +627,9 @@ class Dex:
         self, attr: Union[str, Callable], values: Iterable[Any]
     ) -> Int64Set:
         """Handle 'in' queries. Return the union of object ID matches for the values."""
-        matches = Int64Set()
-        for v in values:
-            v_matches = self._indexes[attr].get_obj_ids(v)
-            matches = cyk_union(matches, v_matches)
-        return Int64Set(matches)
+        return self._indexes[attr].get_obj_ids_many(values)
 
-    def _obj_ids_to_objs(self, obj_ids: Int64Set) -> List[Any]:
+    def _obj_ids_to_objs(self, obj_ids: Iterable[int]) -> List[Any]:
         """Look up each obj_id in self.obj_map, and return the list of objs."""
         # Using itemgetter is about 10% faster than doing a comprehension like [self.objs[ptr] for ptr in hits]
         if len(obj_ids) == 0:
@@ -254,28 +676,137 @@ class Dex:
         Returns:
             List of objects matching the constraints. List will be unordered.
         """
-        if not isinstance(query, dict):
-            raise TypeError(f"Got {type(query)}; expected a dict.")
-        std_query = dict()
-        for attr, expr in query.items():
-            std_query[attr] = standardize_expr(expr)
-        match_query, exclude_query = split_query(std_query)
-        return self._find(match_query, exclude_query)
+        return self.find(query)
+
+    def find(
+        self,
+        query: Dict,
+        lazy: bool = False,
+        order_by: Optional[Union[str, Callable]] = None,
+        descending: bool = False,
+        limit: Optional[int] = None,
+    ) -> Union[List[Any], LazyResult]:
+        """Find objects in the Dex that satisfy the constraints.
+
+        Args:
+            query: Dict of ``{attribute: expression}``, same as in ``dex[query]``.
+
+            lazy: If True, return a ``LazyResult`` that looks up the matching objects only as they are consumed.
+
+            order_by: An attribute in ``on`` to sort the results by. Optional. Objects whose value is None come after
+                the others, and objects missing the attribute come last.
+
+            descending: If True, sort from the largest value to the smallest.
+
+            limit: Return at most this many objects. Optional. With ``order_by``, the ``order_by`` index is walked in
+                order, and the walk stops once ``limit`` matching objects are found.
+
+        Returns:
+            List of objects matching the constraints, or a LazyResult of them.
+            Unordered, unless ``order_by`` is given.
+        """
+        self.flush()
+        match_query, exclude_query = parse_query(query)
+        validate_order(self._indexes, order_by, descending, limit)
+        if not lazy and order_by is None and limit is None:
+            return self._find(match_query, exclude_query)
+        match_query = use_composites(self._indexes, match_query)
+        validate_query(self._indexes, match_query, exclude_query)
+        if order_by is None:
+            obj_ids = self._find_ids(match_query, exclude_query)
+            obj_ids = array(ARR_TYPE, islice(obj_ids, limit))
+        else:
+            obj_ids = self._find_ordered_ids(
+                match_query, exclude_query, order_by, descending, limit
+            )
+        if lazy:
+            return LazyResult(obj_ids, self._obj_ids_to_objs)
+        return self._obj_ids_to_objs(obj_ids)
+
+    def _find_ordered_ids(
+        self,
+        match: Dict[Union[str, Callable], Dict],
+        exclude: Dict[Union[str, Callable], Dict],
+        order_by: Union[str, Callable],
+        descending: bool,
+        limit: Optional[int],
+    ) -> array:
+        """Find the matching object IDs, in order of their order_by values. Walks the order_by index in order,
+        keeping the object IDs that match the other terms, and stops after ``limit`` of them."""
+        index = self._indexes[order_by]
+        walk_expr, match = split_order_range(match, order_by)
+        hits = self._find_ids(match, exclude) if match or exclude else None
+        if limit is None:
+            limit = len(self.obj_map)
+        obj_ids = array(ARR_TYPE)
+        for ptrs in index.ordered_ids(walk_expr, descending):
+            if len(obj_ids) >= limit:
+                break
+            matches = ptrs if hits is None else (ptr for ptr in ptrs if ptr in hits)
+            obj_ids.extend(islice(matches, limit - len(obj_ids)))
+        if len(obj_ids) < limit and not walk_expr:
+            # Every matching object with a value has been found. Next come those with None, then those without.
+            if hits is None:
+                hits = Int64Set(self.obj_map.keys())
+            found = Int64Set(obj_ids)
+            nones = [ptr for ptr in index.none_ids if ptr in hits]
+            obj_ids.extend(nones)
+            found.update(nones)
+            obj_ids.extend(ptr for ptr in hits if ptr not in found)
+        del obj_ids[limit:]
+        return obj_ids
 
 
 def save(box: Dex, filepath: str):
     """Saves this object to a pickle file."""
-    # We can't pickle this easily, because:
+    with open(filepath, "wb") as fh:
+        pickle.dump(to_saved(box), fh)
+
+
+def to_saved(box: Dex) -> Dict:
+    """Make a picklable representation of the Dex."""
+    # We can't pickle the Dex directly, because:
     # - Int64Sets cannot be pickled, so the MutableAttrIndex is hard to save.
     # - Object IDs are specific to the process that created them, so the object map will be invalid if saved.
-    # Therefore, this just pickles the objects and the list of what to build indexes on.
-    # The Dex container will be built anew with __init__ on load.
-    # A bit slow, but it's simple, guaranteed to work, and is very robust against changes in the container code.
-    saved = {"objs": list(box.obj_map.values()), "on": list(box._indexes.keys())}
-    with open(filepath, "wb") as fh:
-        pickle.dump(saved, fh)
+    # Therefore, each index is saved with object IDs replaced by positions in the list of objects.
+    # On load, the positions are mapped to the new object IDs. No attributes need to be evaluated.
+    box.flush()
+    objs = list(box.obj_map.values())
+    ptr_to_pos = {ptr: pos for pos, ptr in enumerate(box.obj_map)}
+    return {
+        "objs": objs,
+        "on": list(box._indexes.keys()),
+        "cache_size": box.cache_size,
+        "backend": box.backend,
+        "reverse_map": box.reverse_map,
+        "observe": box.observe,
+        "max_pending": box.max_pending,
+        "indexes": [index.to_positions(ptr_to_pos) for index in box._indexes.values()],
+    }
 
 
 def load(saved: Dict) -> Dex:
     """Creates a Dex from the pickle file."""
-    return Dex(saved["objs"], saved["on"])
+    if "indexes" not in saved:
+        # saved by an older version that only stored objs and on; build anew
+        return Dex(saved["objs"], saved["on"])
+    box = Dex(
+        on=saved["on"],
+        cache_size=saved.get("cache_size"),
+        backend=saved.get("backend", "hybrid"),
+        reverse_map=saved.get("reverse_map", False),
+        observe=saved.get("observe", False),
+        max_pending=saved.get("max_pending"),
+    )
+    box.obj_map = {id(obj): obj for obj in saved["objs"]}
+    pos_to_ptr = list(box.obj_map)
+    for attr, saved_index in zip(saved["on"], saved["indexes"]):
+        index = box._indexes[attr]
+        box._indexes[attr] = MutableAttrIndex.from_positions(
+            attr,
+            saved_index,
+            pos_to_ptr,
+            index.backend,
+            index.reverse_map is not None,
+        )
+    return box
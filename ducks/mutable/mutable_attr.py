@@ -1,19 +1,29 @@
 from array import array
+from itertools import chain
 from typing import Any
 from typing import Callable
 from typing import Dict
 from typing import Hashable
 from typing import Iterable
+from typing import Iterator
+from typing import List
 from typing import Optional
 from typing import Set
+from typing import Tuple
 from typing import Union
 
 from cykhash import Int64Set
 from ducks.btree import BTree
+from ducks.btree import range_expr_to_args
 from ducks.constants import ANY
 from ducks.constants import ARR_TYPE
-from ducks.constants import ARRAY_SIZE_MAX
-from ducks.constants import SET_SIZE_MIN
+from ducks.constants import RANGE_OPERATORS
+from ducks.constants import WIDE_RANGE_MIN_VALS
+from ducks.constants import WIDE_RANGE_OUTSIDE_MAX
+from ducks.mutable.backends import HybridBackend
+from ducks.mutable.backends import IdSetBackend
+from ducks.mutable.reverse_map import ReverseMap
+from ducks.utils import cyk_intersect
 from ducks.utils import get_attribute
 
 
@@ -24,14 +34,23 @@ class MutableAttrIndex:
         self,
         attr: Union[Callable, str],
         objs: Optional[Iterable[Any]] = None,
+        backend: Optional[IdSetBackend] = None,
+        reverse_map: bool = False,
     ):
         self.attr = attr
+        self.backend = HybridBackend() if backend is None else backend
+        # Stores the value of each object ID, if enabled, so objects can be found after their attributes change
+        self.reverse_map = ReverseMap() if reverse_map else None
         self.none_ids = Int64Set()  # Stores object IDs for the attribute value None
-        self.tree = BTree()  # Stores object IDs for all other values
+        self.tree = (
+            BTree()
+        )  # Stores a container of object IDs, made by the backend, for each other value
         self.n_obj_ids = 0
+        # The IDs of all objects with this attribute. Built when first needed, then kept up to date.
+        self._all_ids = None
         if objs:
-            for obj in objs:
-                self.add(id(obj), obj)
+            objs = list(objs)
+            self.add_many([id(obj) for obj in objs], objs)
 
     def add(self, ptr: int, obj: Any):
         """Add an object if it has this attribute."""
@@ -41,41 +60,149 @@ class MutableAttrIndex:
         self._add_val(ptr, val)
         self.n_obj_ids += 1
 
+    def add_many(self, ptrs: List[int], objs: List[Any]):
+        """Add many objects. They are grouped by attribute value first, so each value is looked up once."""
+        groups, _ = self._group_by_val(ptrs, objs)
+        for val, val_ptrs in groups:
+            self._add_vals(val, val_ptrs)
+            self.n_obj_ids += len(val_ptrs)
+
     def get_obj_ids(self, val: Any) -> Int64Set:
         """Get the object IDs associated with this value as an Int64Set."""
         if val is ANY:
             return self.get_all_ids()
         if val is None:
             return self.none_ids
-        ids = self.tree.get(val, Int64Set())
-        if type(ids) is array:
-            return Int64Set(ids)
-        elif type(ids) is Int64Set:
-            return ids
-        else:
-            return Int64Set([ids])
+        container = self.tree.get(val)
+        if container is None:
+            return Int64Set()
+        return self.backend.to_set(container)
+
+    def get_obj_ids_many(self, values: Iterable[Any]) -> Int64Set:
+        """Get the object IDs associated with any of the values, filling one Int64Set in a single pass."""
+        values = list(values)
+        if any(val is ANY for val in values):
+            return self.get_all_ids()
+        containers = (self.tree.get(val) for val in values if val is not None)
+        obj_ids = self.backend.union(c for c in containers if c is not None)
+        if any(val is None for val in values):
+            obj_ids.update(self.none_ids)
+        return obj_ids
+
+    def count(self, val: Any) -> int:
+        """Get the number of objects with this value, without building a set of their IDs."""
+        if val is ANY:
+            return self.n_obj_ids
+        if val is None:
+            return len(self.none_ids)
+        container = self.tree.get(val)
+        if container is None:
+            return 0
+        return self.backend.size(container)
+
+    def estimate(self, expr: Dict[str, Any], cap: int) -> int:
+        """Get the number of objects that match expr, without finding them. Used to plan queries.
+        Stops counting once the count exceeds cap, since then the term won't be evaluated first anyway.
+        When expr has several operators, it's the smallest of their counts."""
+        counts = []
+        if "==" in expr:
+            counts.append(self.count(expr["=="]))
+        if "in" in expr:
+            n = 0
+            for val in expr["in"]:
+                n += self.count(val)
+                if n > cap:
+                    break
+            counts.append(n)
+        if any(op in expr for op in RANGE_OPERATORS):
+            containers = self.tree.get_range_expr(expr)
+            if len(containers) > cap:
+                # every value has at least one object, so the count is over cap without reading the containers
+                n = cap + 1
+            else:
+                n = 0
+                for container in containers:
+                    n += self.backend.size(container)
+                    if n > cap:
+                        break
+            counts.append(n)
+        return min(counts, default=0)
+
+    def filter_ids(self, expr: Dict[str, Any], obj_ids: Int64Set) -> Int64Set:
+        """Get the obj_ids that match expr. Intersects obj_ids with each matching value's container, instead of
+        collecting every match of expr first, so it's cheap when obj_ids is small."""
+        if "==" in expr:
+            obj_ids = self._filter_by_vals(obj_ids, [expr["=="]])
+        if "in" in expr:
+            obj_ids = self._filter_by_vals(obj_ids, expr["in"])
+        if any(op in expr for op in RANGE_OPERATORS):
+            obj_ids = self.backend.filter(self.tree.get_range_expr(expr), obj_ids)
+        return obj_ids
+
+    def _filter_by_vals(self, obj_ids: Int64Set, vals: Iterable[Any]) -> Int64Set:
+        """Get the obj_ids that have any of the values."""
+        if any(val is ANY for val in vals):
+            return cyk_intersect(obj_ids, self.get_all_ids())
+        containers = (self.tree.get(val) for val in vals if val is not None)
+        hits = self.backend.filter((c for c in containers if c is not None), obj_ids)
+        if any(val is None for val in vals):
+            hits.update(cyk_intersect(obj_ids, self.none_ids))
+        return hits
 
     def remove(self, ptr: int, obj: Any):
         """Remove a single object from the index. ptr is already known to be in the Dex.
-        Runs in O(1) if obj has this attr and the value of the attr hasn't changed. O(n_keys) otherwise."""
-        removed = False
-        val, success = get_attribute(obj, self.attr)
-        if success:
-            removed = self._try_remove(ptr, val)
-        if not removed:
-            # do O(n) search
-            for val in list(self.tree.keys()):
-                removed = self._try_remove(ptr, val)
-                if removed:
-                    break
+        Runs in O(log n) if the index has a reverse map, or if obj has this attr and the value of the attr hasn't
+        changed. O(n_keys) otherwise."""
+        if self.reverse_map is not None:
+            val, success = self.reverse_map.get(ptr)
+            if not success:
+                # the object didn't have this attribute when it was added
+                return
+        else:
+            val, success = get_attribute(obj, self.attr)
+        if not success or not self._try_remove(ptr, val):
+            self._remove_by_search([ptr])
+
+    def remove_many(self, ptrs: List[int], objs: List[Any]):
+        """Remove many objects from the index. ptrs are already known to be in the Dex.
+        They are grouped by attribute value first, so each value is looked up once."""
+        stored = self.reverse_map is not None
+        groups, not_found = self._group_by_val(ptrs, objs, stored)
+        if stored:
+            # objects missing from the reverse map didn't have this attribute when they were added
+            not_found = []
+        for val, val_ptrs in groups:
+            not_found.extend(self._remove_vals(val, val_ptrs))
+        if not_found:
+            self._remove_by_search(not_found)
+
+    def update(self, ptr: int, obj: Any):
+        """Store an object again after its attribute value may have changed. ptr is already known to be in the Dex.
+        With a reverse map, an object whose value is unchanged is left as it is."""
+        if not self._is_unchanged(ptr, obj):
+            self.remove(ptr, obj)
+            self.add(ptr, obj)
+
+    def update_many(self, ptrs: List[int], objs: List[Any]):
+        """Store many objects again after their attribute values may have changed."""
+        if self.reverse_map is not None:
+            changed = [
+                i for i, ptr in enumerate(ptrs) if not self._is_unchanged(ptr, objs[i])
+            ]
+            ptrs = [ptrs[i] for i in changed]
+            objs = [objs[i] for i in changed]
+        self.remove_many(ptrs, objs)
+        self.add_many(ptrs, objs)
 
     def get_all_ids(self) -> Int64Set:
         """Get the ID of every object that has this attribute.
-        Called when matching or excluding ``{attr: hashindex.ANY}``."""
-        obj_ids = Int64Set(self.none_ids)
-        for val in self.tree.values():
-            self._add_val_to_set(val, obj_ids)
-        return obj_ids
+        Called when matching or excluding ``{attr: hashindex.ANY}``, and for ranges that cover most values.
+        The set is built on the first call and kept up to date after that, so it must not be modified."""
+        if self._all_ids is None:
+            all_ids = self.backend.union(self.tree.values())
+            all_ids.update(self.none_ids)
+            self._all_ids = all_ids
+        return self._all_ids
 
     def get_values(self) -> Set:
         """Get unique values we have objects for."""
@@ -84,80 +211,209 @@ class MutableAttrIndex:
             vals.add(None)
         return vals
 
-    def get_ids_by_range(self, expr: Dict[str, Any]):
-        """Get object IDs based on less than / greater than some value"""
-        obj_ids = Int64Set()
-        vals = self.tree.get_range_expr(expr)
-        for val in vals:
-            self._add_val_to_set(val, obj_ids)
-        return obj_ids
+    def get_ids_by_range(self, expr: Dict[str, Any]) -> Int64Set:
+        """Get object IDs based on less than / greater than some value.
+        When the range covers most of the values, it's faster to take every ID and remove the ones outside it."""
+        lo, hi, include_lo, include_hi = range_expr_to_args(expr)
+        containers = self.tree.get_range(lo, hi, include_lo, include_hi)
+        n_vals = len(self.tree)
+        # len() of a BTree range takes time proportional to the range, which is small next to reading it
+        if (
+            n_vals >= WIDE_RANGE_MIN_VALS
+            and len(containers) > (1 - WIDE_RANGE_OUTSIDE_MAX) * n_vals
+        ):
+            outside = []
+            if lo is not None:
+                outside.append(self.tree.get_range(None, lo, True, not include_lo))
+            if hi is not None:
+                outside.append(self.tree.get_range(hi, None, not include_hi, True))
+            flat, sets = self.backend.flatten(chain.from_iterable(outside))
+            # discarding the few IDs outside from a copy is several times faster than Int64Set.difference
+            obj_ids = self.get_all_ids().copy()
+            for ptr in chain(flat, self.none_ids, *sets):
+                obj_ids.discard(ptr)
+            return obj_ids
+        return self.backend.union(containers)
 
-    def _add_val(self, ptr, val):
-        if val is None:
-            self.none_ids.add(ptr)
-        elif val in self.tree:
-            obj_ids = self.tree[val]
-            if type(obj_ids) is Int64Set:
-                self.tree[val].add(ptr)
-            elif type(obj_ids) is array:
-                if len(obj_ids) == ARRAY_SIZE_MAX:
-                    # upgrade array -> set
-                    obj_ids = Int64Set(obj_ids)
-                    obj_ids.add(ptr)
-                    self.tree[val] = obj_ids
-                else:
-                    obj_ids.append(ptr)
+    def value_counts(self, obj_ids: Optional[Int64Set] = None) -> Dict[Any, int]:
+        """Get the number of objects having each value. If obj_ids is given, only those objects are counted.
+        Values with no objects counted are left out."""
+        counts = {}
+        for val, container in self.tree.items():
+            if obj_ids is None:
+                n = self.backend.size(container)
             else:
-                # obj_ids was an int, now we have two. upgrade int -> array
-                self.tree[val] = array(ARR_TYPE, [obj_ids, ptr])
+                n = self.backend.count_common(container, obj_ids)
+            if n:
+                counts[val] = n
+        n_none = len(
+            self.none_ids if obj_ids is None else cyk_intersect(self.none_ids, obj_ids)
+        )
+        if n_none:
+            counts[None] = n_none
+        return counts
+
+    def ordered_ids(
+        self, expr: Dict[str, Any], descending: bool = False
+    ) -> Iterator[Iterable[int]]:
+        """Yield the object IDs of each value, in order of the values. Only values in the range expr are included,
+        or all values if expr has no range. None values are not included."""
+        lo, hi, include_lo, include_hi = range_expr_to_args(expr)
+        if descending:
+            containers = self.tree.get_range_descending(lo, hi, include_lo, include_hi)
         else:
-            # new val, add the int
-            self.tree[val] = ptr
-
-    @staticmethod
-    def _add_val_to_set(val: Any, obj_ids: Int64Set):
-        """We need to do this a lot"""
-        if type(val) in [array, Int64Set]:
-            for v in val:
-                obj_ids.add(v)
+            containers = self.tree.get_range(lo, hi, include_lo, include_hi)
+        for container in containers:
+            yield self.backend.iterate(container)
+
+    def _add_val(self, ptr: int, val: Any):
+        self._add_vals(val, [ptr])
+
+    def _add_vals(self, val: Any, ptrs: List[int]):
+        """Add several ptrs that share the same val, merging them into the val's container."""
+        if self.reverse_map is not None:
+            self.reverse_map.set_many(ptrs, val)
+        if self._all_ids is not None:
+            self._all_ids.update(ptrs)
+        if val is None:
+            self.none_ids.update(ptrs)
+            return
+        container = self.tree.get(val)
+        if container is None:
+            self.tree[val] = self.backend.make(ptrs)
+            return
+        new_container = self.backend.add(container, ptrs)
+        if new_container is not container:
+            self.tree[val] = new_container
+
+    def _group_by_val(
+        self, ptrs: List[int], objs: List[Any], stored: bool = False
+    ) -> Tuple[List[Tuple[Any, List[int]]], List[int]]:
+        """Get (value, ptrs) for each attribute value of the objects, and the ptrs of objects missing the attribute.
+        If stored, the values are taken from the reverse map instead of the objects.
+        Unhashable values can't be grouped, so each of those gets its own (value, [ptr])."""
+        val_to_ptrs = {}
+        unhashable = []
+        missing = []
+        for ptr, obj in zip(ptrs, objs):
+            if stored:
+                val, success = self.reverse_map.get(ptr)
+            else:
+                val, success = get_attribute(obj, self.attr)
+            if not success:
+                missing.append(ptr)
+                continue
+            try:
+                val_to_ptrs.setdefault(val, []).append(ptr)
+            except TypeError:
+                unhashable.append((val, [ptr]))
+        return list(val_to_ptrs.items()) + unhashable, missing
+
+    def _remove_vals(self, val: Any, ptrs: List[int]) -> List[int]:
+        """Remove the ptrs from the val's container. Return the ones that weren't in it."""
+        if val is None:
+            found = [ptr for ptr in ptrs if ptr in self.none_ids]
+            for ptr in found:
+                self.none_ids.discard(ptr)
         else:
-            obj_ids.add(val)
+            container = self.tree.get(val)
+            if container is None:
+                return ptrs
+            new_container, found = self.backend.remove(container, ptrs)
+            if new_container is None:
+                del self.tree[val]
+            elif new_container is not container:
+                self.tree[val] = new_container
+        self._forget_ids(found)
+        if len(found) == len(ptrs):
+            return []
+        found_set = set(found)
+        return [ptr for ptr in ptrs if ptr not in found_set]
+
+    def _forget_ids(self, ptrs: List[int]):
+        """Drop the removed ptrs from the count, the cached set of all IDs, and the reverse map."""
+        self.n_obj_ids -= len(ptrs)
+        if self._all_ids is not None:
+            for ptr in ptrs:
+                self._all_ids.discard(ptr)
+        if self.reverse_map is not None:
+            for ptr in ptrs:
+                self.reverse_map.discard(ptr)
+
+    def _remove_by_search(self, ptrs: List[int]):
+        """Remove ptrs whose current attribute value doesn't tell us where they are stored, because the value changed
+        or went missing since the object was added. Searches every value, so runs in O(n_keys)."""
+        remaining = self._remove_vals(None, ptrs)
+        for val in list(self.tree.keys()):
+            if not remaining:
+                break
+            remaining = self._remove_vals(val, remaining)
 
     def _try_remove(self, ptr: int, val: Hashable) -> bool:
         """Try to remove the object from self.tree[val]. Return True on success, False otherwise."""
-        # handle None
-        if val is None and ptr in self.none_ids:
-            self.none_ids.remove(ptr)
-            self.n_obj_ids -= 1
-            return True
-
-        # first, check that the ptr is in here
-        if val not in self.tree:
+        return not self._remove_vals(val, [ptr])
+
+    def _is_unchanged(self, ptr: int, obj: Any) -> bool:
+        """Check if the object's attribute value is the one stored in the reverse map. Without a reverse map,
+        the stored value isn't known, so it counts as changed."""
+        if self.reverse_map is None:
             return False
-        if type(self.tree[val]) in [array, Int64Set]:
-            if ptr not in self.tree[val]:
-                return False
-        else:
-            if self.tree[val] != ptr:
-                return False
-
-        # must be in the tree
-        obj_ids = self.tree[val]
-        if type(self.tree[val]) in [array, Int64Set]:
-            self.tree[val].remove(ptr)
-            if type(obj_ids) is array:
-                if len(self.tree[val]) == 1:
-                    # downgrade array -> int
-                    self.tree[val] = self.tree[val][0]
+        stored, was_stored = self.reverse_map.get(ptr)
+        val, success = get_attribute(obj, self.attr)
+        if not success or not was_stored:
+            return success == was_stored
+        return _same_value(stored, val)
+
+    def to_positions(self, ptr_to_pos: Dict[int, int]) -> Dict[str, Any]:
+        """Export the index with each object ID replaced by the object's position, given by ptr_to_pos.
+        Positions stay valid across processes, unlike object IDs."""
+        vals = []
+        positions = []
+        for val, container in self.tree.items():
+            vals.append(val)
+            ptrs = self.backend.iterate(container)
+            if self.backend.size(container) > 1:
+                positions.append(array(ARR_TYPE, [ptr_to_pos[ptr] for ptr in ptrs]))
             else:
-                if len(self.tree[val]) < SET_SIZE_MIN:
-                    # downgrade set -> array
-                    self.tree[val] = array(ARR_TYPE, list(self.tree[val]))
-        else:
-            # downgrade int -> nothing
-            del self.tree[val]
-        self.n_obj_ids -= 1
-        return True
+                positions.append(ptr_to_pos[next(iter(ptrs))])
+        none_positions = array(ARR_TYPE, [ptr_to_pos[ptr] for ptr in self.none_ids])
+        return {"vals": vals, "positions": positions, "none": none_positions}
+
+    @classmethod
+    def from_positions(
+        cls,
+        attr: Union[Callable, str],
+        saved: Dict[str, Any],
+        pos_to_ptr: List[int],
+        backend: Optional[IdSetBackend] = None,
+        reverse_map: bool = False,
+    ) -> "MutableAttrIndex":
+        """Rebuild an index exported by ``to_positions``, without evaluating the attribute on any objects.
+        pos_to_ptr gives the object ID of the object at each position."""
+        index = cls(attr, backend=backend, reverse_map=reverse_map)
+        tree = {}
+        for val, positions in zip(saved["vals"], saved["positions"]):
+            if type(positions) is not array:
+                positions = [positions]
+            ptrs = [pos_to_ptr[p] for p in positions]
+            tree[val] = index.backend.make(ptrs)
+            index.n_obj_ids += len(positions)
+            if reverse_map:
+                index.reverse_map.set_many(ptrs, val)
+        index.tree = BTree(tree)
+        index.none_ids = Int64Set([pos_to_ptr[p] for p in saved["none"]])
+        index.n_obj_ids += len(index.none_ids)
+        if reverse_map:
+            index.reverse_map.set_many(index.none_ids, None)
+        return index
 
     def __len__(self):
         return self.n_obj_ids
+
+
+def _same_value(a: Any, b: Any) -> bool:
+    """Check if two attribute values are equal. Values that can't be compared count as different."""
+    try:
+        return a is b or bool(a == b)
+    except (TypeError, ValueError):
+        return False
@@ -0,0 +1,57 @@
+"""
+Objects that tell the Dexes holding them when their attributes are assigned, so ``update()`` needn't be called.
+
+A Dex created with ``observe=True`` records which of its Observable objects had an indexed attribute assigned.
+The pending updates are applied in one batch by ``Dex.flush()``, which is called before each query. Many
+assignments to the same object between flushes cost one index update.
+"""
+import threading
+import weakref
+from typing import Any
+from typing import List
+
+# Dexes created with observe=True. Weak, so a Dex that is no longer used is not kept alive by its objects.
+# Dexes may be created in one thread while objects are assigned to in another, so the set is only added to, and
+# copied, under the lock.
+observers = weakref.WeakSet()
+_observers_lock = threading.Lock()
+
+
+def add_observer(dex: Any):
+    """Have the Dex told about each assignment to an Observable object."""
+    with _observers_lock:
+        observers.add(dex)
+
+
+def _current_observers() -> List[Any]:
+    with _observers_lock:
+        return list(observers)
+
+
+class Observable:
+    """Mixin for objects that notify observing Dexes when an attribute is assigned or deleted.
+
+    Example::
+
+        class Order(Observable):
+            def __init__(self, status):
+                self.status = status
+
+        dex = Dex(orders, ['status'], observe=True)
+        orders[0].status = 'shipped'
+        dex[{'status': 'shipped'}]  # finds orders[0]; no update() needed
+
+    Attribute functions in ``on`` may read any attribute, so their indexes are updated on every assignment.
+    """
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        for dex in _current_observers():
+            dex._on_assign(self, name)
+
+    def __delattr__(self, name):
+        super().__delattr__(name)
+        for dex in _current_observers():
+            dex._on_assign(self, name)
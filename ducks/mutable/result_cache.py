@@ -0,0 +1,129 @@
+"""
+Caches query results for a Dex, and drops exactly the results that a change to the Dex could affect.
+"""
+from collections import OrderedDict
+from threading import Lock
+from typing import Any
+from typing import Dict
+from typing import Hashable
+from typing import List
+from typing import Optional
+from typing import Union
+
+from cykhash import Int64Set
+from ducks.constants import ANY
+from ducks.utils import get_attribute
+from ducks.utils import make_query_key
+
+
+class CachedResult:
+    """The result of one query, along with the query's match terms, which are used to decide invalidation."""
+
+    def __init__(self, match: Dict, obj_ids: Int64Set, objs: List[Any]):
+        self.match = match
+        self.obj_ids = obj_ids
+        self.objs = objs
+
+
+class ResultCache:
+    """LRU cache of query results, bounded by the total number of objects in the cached results.
+
+    A result is dropped when an object that it contains is removed, or when an object that satisfies its
+    match terms is added. Results of other queries are kept.
+    """
+
+    def __init__(self, max_size: int):
+        if max_size < 1:
+            raise ValueError("cache_size must be at least 1.")
+        self.max_size = max_size
+        self.size = 0
+        self.results: "OrderedDict[Hashable, CachedResult]" = OrderedDict()
+        # Readers of a ConcurrentDex share a lock, so they may use the cache at the same time.
+        self.lock = Lock()
+
+    @staticmethod
+    def make_key(match: Dict, exclude: Dict) -> Optional[Hashable]:
+        """Get the cache key for a query, or None if the query can't be cached."""
+        return make_query_key(match, exclude)
+
+    def get(self, key: Hashable) -> Optional[List[Any]]:
+        """Get a copy of the cached objects for this query, or None if it's not cached."""
+        with self.lock:
+            result = self.results.get(key)
+            if result is None:
+                return None
+            self.results.move_to_end(key)
+            return list(result.objs)
+
+    def put(self, key: Hashable, match: Dict, obj_ids: Int64Set, objs: List[Any]):
+        """Cache the result of a query, dropping the least recently used results if the cache is too big."""
+        if len(objs) > self.max_size:
+            return
+        with self.lock:
+            if key in self.results:
+                return
+            # copy obj_ids, since it may be a container that the index changes later
+            self.results[key] = CachedResult(match, obj_ids.copy(), list(objs))
+            self.size += len(objs)
+            while self.size > self.max_size:
+                _, dropped = self.results.popitem(last=False)
+                self.size -= len(dropped.objs)
+
+    def on_add(self, obj: Any):
+        """Drop results that obj might belong in."""
+        self._drop(lambda result: _may_match(obj, result.match))
+
+    def on_remove(self, ptr: int):
+        """Drop results that contain the object."""
+        self._drop(lambda result: ptr in result.obj_ids)
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+            self.size = 0
+
+    def _drop(self, affected):
+        with self.lock:
+            for key in [k for k, result in self.results.items() if affected(result)]:
+                self.size -= len(self.results.pop(key).objs)
+
+    def __len__(self):
+        return len(self.results)
+
+
+def _may_match(obj: Any, match: Dict[Any, Dict[str, Any]]) -> bool:
+    """Check if obj satisfies the match terms. Exclude terms are not checked, so this may give a false positive,
+    which only costs an unneeded invalidation."""
+    for attr, expr in match.items():
+        val, success = get_attribute(obj, attr)
+        if not success:
+            return False
+        for op, query_val in expr.items():
+            try:
+                if not _op_matches(val, op, query_val):
+                    return False
+            except TypeError:
+                # can't compare; assume it matches
+                pass
+    return True
+
+
+def _op_matches(val: Any, op: str, query_val: Union[Any, List[Any]]) -> bool:
+    if op == "in":
+        return any(_op_matches(val, "==", v) for v in query_val)
+    if query_val is ANY:
+        return True
+    if val is None or query_val is None:
+        return op == "==" and val is query_val
+    if op == "==":
+        return val == query_val
+    if op == "<":
+        return val < query_val
+    if op == "<=":
+        return val <= query_val
+    if op == ">":
+        return val > query_val
+    if op == ">=":
+        return val >= query_val
+    # unknown operator; assume it matches
+    return True
@@ -0,0 +1,56 @@
+"""
+A map from object ID to the attribute value the object is stored under in a Dex index.
+
+Without it, an object whose attribute changed since it was added can only be found by searching every value of
+the index. With it, the stored value is looked up directly, so removing or updating an object takes O(log n)
+however its attributes have changed.
+"""
+from array import array
+from typing import Any
+from typing import Iterable
+from typing import Tuple
+
+from cykhash import Int64toInt64Map
+from ducks.constants import ARR_TYPE
+
+
+class ReverseMap:
+    """Maps object IDs to stored values.
+
+    The values are kept in a list of slots, with an Int64toInt64Map from each object ID to its slot. That takes
+    about 20 bytes per object, where a dict from object ID to value takes about 75, since each ID would be a
+    separate int object. Values don't need to be hashable. Slots of removed objects are reused.
+    """
+
+    def __init__(self):
+        self.slots = Int64toInt64Map()
+        self.vals = []
+        self.free = array(ARR_TYPE)
+
+    def set_many(self, ptrs: Iterable[int], val: Any):
+        """Store val as the value of each ptr. The ptrs must not be in the map already."""
+        for ptr in ptrs:
+            if self.free:
+                slot = self.free.pop()
+                self.vals[slot] = val
+            else:
+                slot = len(self.vals)
+                self.vals.append(val)
+            self.slots[ptr] = slot
+
+    def get(self, ptr: int) -> Tuple[Any, bool]:
+        """Get (value, True) if ptr is in the map, or (None, False) if not."""
+        slot = self.slots.get(ptr, -1)
+        if slot == -1:
+            return None, False
+        return self.vals[slot], True
+
+    def discard(self, ptr: int):
+        """Remove ptr from the map, if it's there."""
+        slot = self.slots.pop(ptr, -1)
+        if slot != -1:
+            self.vals[slot] = None
+            self.free.append(slot)
+
+    def __len__(self):
+        return len(self.slots)
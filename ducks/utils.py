@@ -1,6 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 from typing import Callable
 from typing import Dict
+from typing import Hashable
+from typing import Iterable
 from typing import List
 from typing import Optional
 from typing import Tuple
@@ -10,14 +13,19 @@ import numpy as np
 from cykhash import Int64Set
 from ducks.constants import ANY
 from ducks.constants import EXCLUDE_OPERATORS
+from ducks.constants import MatchAnything
 from ducks.constants import OPERATOR_MAP
+from ducks.constants import RANGE_OPERATORS
 from ducks.constants import VALID_OPERATORS
 from ducks.exceptions import AttributeNotFoundError
 from ducks.exceptions import MissingAttribute
 
 
-def get_attribute(obj: Any, attr: Union[Callable, str]) -> Tuple[Any, bool]:
-    """Get the object's attribute value. Return (value, success). Unsuccessful if attribute is missing."""
+def get_attribute(obj: Any, attr: Union[Callable, str, Tuple]) -> Tuple[Any, bool]:
+    """Get the object's attribute value. Return (value, success). Unsuccessful if attribute is missing.
+    A tuple of attributes is a composite attribute; its value is the tuple of their values."""
+    if isinstance(attr, tuple):
+        return get_composite_attribute(obj, attr)
     if callable(attr):
         try:
             val = attr(obj)
@@ -36,6 +44,18 @@ def get_attribute(obj: Any, attr: Union[Callable, str]) -> Tuple[Any, bool]:
     return val, True
 
 
+def get_composite_attribute(obj: Any, attrs: Tuple) -> Tuple[Any, bool]:
+    """Get the tuple of the object's values for attrs. Unsuccessful if any of them is missing or None, because
+    a tuple containing None can't be sorted among the others."""
+    vals = []
+    for attr in attrs:
+        val, success = get_attribute(obj, attr)
+        if not success or val is None:
+            return None, False
+        vals.append(val)
+    return tuple(vals), True
+
+
 def get_attributes(cls) -> List[str]:
     """Helper function to grab the attributes of a class"""
     return list(cls.__annotations__.keys())
@@ -61,6 +81,55 @@ def split_query(query: Dict) -> Tuple[Dict, Dict]:
     return match_query, exclude_query
 
 
+def parse_query(query: Dict) -> Tuple[Dict, Dict]:
+    """Standardize each expression in the query, and split it into match and exclude terms."""
+    if not isinstance(query, dict):
+        raise TypeError(f"Got {type(query)}; expected a dict.")
+    std_query = dict()
+    for attr, expr in query.items():
+        std_query[attr] = standardize_expr(expr)
+    return split_query(std_query)
+
+
+def freeze_query(query: Any) -> Hashable:
+    """Turn the dicts and lists in a query into tuples, so it can be used as a cache key. Each part is tagged with
+    its type so that e.g. a list can't collide with a tuple value, or 1 with True.
+    The result is unhashable if the query contains unhashable values."""
+    if isinstance(query, dict):
+        return dict, tuple((k, freeze_query(v)) for k, v in query.items())
+    if isinstance(query, list):
+        return list, tuple(freeze_query(v) for v in query)
+    if query is ANY:
+        return (MatchAnything,)
+    return type(query), query
+
+
+def make_query_key(match: Dict, exclude: Dict) -> Optional[Hashable]:
+    """Get a key that identifies a parsed query, or None if the query contains unhashable values."""
+    match_keys = [make_term_key(attr, expr) for attr, expr in match.items()]
+    exclude_keys = [make_term_key(attr, expr) for attr, expr in exclude.items()]
+    if None in match_keys or None in exclude_keys:
+        return None
+    return tuple(match_keys), tuple(exclude_keys)
+
+
+def make_term_key(attr: Any, expr: Dict) -> Optional[Hashable]:
+    """Get a key that identifies one term of a parsed query, or None if it contains unhashable values."""
+    if len(expr) == 1 and "==" in expr and expr["=="] is not ANY:
+        # the most common term; skips freezing, which is slow compared to looking up one value
+        val = expr["=="]
+        return _hashable_or_none((attr, type(val), val))
+    return _hashable_or_none((attr, freeze_query(expr)))
+
+
+def _hashable_or_none(key: Any) -> Optional[Hashable]:
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
 def standardize_expr(expr: Any) -> Dict:
     """Turn a find() expr into a dict of {operator: value}."""
     if isinstance(expr, dict):
@@ -92,6 +161,88 @@ def validate_and_standardize_operators(expr: Dict) -> Dict:
     return std_expr
 
 
+class Greatest:
+    """Compares greater than every other value. Ends the open side of a range on a composite attribute."""
+
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return other is self
+
+    def __gt__(self, other):
+        return other is not self
+
+    def __ge__(self, other):
+        return True
+
+    def __repr__(self):
+        return "GREATEST"
+
+
+GREATEST = Greatest()
+
+
+def use_composites(indexes: Dict, match: Dict) -> Dict:
+    """Rewrite match terms to use the composite indexes, which are the indexes keyed by a tuple of attributes.
+
+    A composite index on ``(a1, ..., ak)`` is used when the query has '==' on a1 through a(k-1), and either '=='
+    or a range on ak. Those k terms become one term on the composite index, so the matches are found with a single
+    lookup instead of intersecting k sets of matches. Other terms are left as they are.
+    """
+    composites = [attr for attr in indexes if isinstance(attr, tuple)]
+    if not composites:
+        return match
+    match = dict(match)
+    for composite in composites:
+        if composite in match or not all(attr in match for attr in composite):
+            continue
+        *leading, trailing = composite
+        if not all(_is_single_value(match[attr], "==") for attr in leading):
+            continue
+        expr = _composite_expr(
+            tuple(match[attr]["=="] for attr in leading), match[trailing]
+        )
+        if expr is None:
+            continue
+        for attr in composite:
+            del match[attr]
+        match[composite] = expr
+    return match
+
+
+def _is_single_value(expr: Dict, op: str) -> bool:
+    return list(expr) == [op] and expr[op] is not None and expr[op] is not ANY
+
+
+def _composite_expr(prefix: Tuple, expr: Dict) -> Optional[Dict]:
+    """Turn the expr on the last attribute of a composite into an expr on the composite key, given the values of
+    the attributes before it. None if the expr can't be turned into one."""
+    if _is_single_value(expr, "=="):
+        return {"==": prefix + (expr["=="],)}
+    if not expr or any(
+        op not in RANGE_OPERATORS or val is None or val is ANY
+        for op, val in expr.items()
+    ):
+        return None
+    # Keys are compared element by element, and a key is greater than its own prefix. So (*prefix, lo) is below
+    # every key having the value lo, and (*prefix, lo, GREATEST) is above them.
+    composite_expr = {}
+    if ">" in expr:
+        composite_expr[">"] = prefix + (expr[">"], GREATEST)
+    elif ">=" in expr:
+        composite_expr[">="] = prefix + (expr[">="],)
+    elif prefix:
+        composite_expr[">="] = prefix
+    if "<" in expr:
+        composite_expr["<"] = prefix + (expr["<"],)
+    elif "<=" in expr:
+        composite_expr["<"] = prefix + (expr["<="], GREATEST)
+    elif prefix:
+        composite_expr["<"] = prefix + (GREATEST,)
+    return composite_expr
+
+
 def validate_query(
     indexes: Dict,
     match: Optional[Dict[Union[str, Callable], Any]] = None,
@@ -110,6 +261,41 @@ def validate_query(
         )
 
 
+def validate_attr(indexes: Dict, attr: Union[str, Callable, Tuple], action: str):
+    """Check that there is an index for attr, which is used to ``action`` (e.g. "order by") the results."""
+    if attr not in indexes:
+        raise AttributeNotFoundError(
+            f"Cannot {action}: {attr}. Attributes must be specified on creation."
+        )
+
+
+def validate_order(
+    indexes: Dict,
+    order_by: Optional[Union[str, Callable, Tuple]],
+    descending: bool,
+    limit: Optional[int],
+):
+    """Check the ordering arguments of find()."""
+    if order_by is None:
+        if descending:
+            raise ValueError("descending needs an order_by attribute.")
+    else:
+        validate_attr(indexes, order_by, "order by")
+    if limit is not None and limit < 0:
+        raise ValueError("limit must be at least 0.")
+
+
+def split_order_range(
+    match: Dict, order_by: Union[str, Callable, Tuple]
+) -> Tuple[Dict, Dict]:
+    """Split off the match term on order_by if it is only a range. Returns (range expr, the other match terms).
+    The range then bounds the walk over the order_by index, instead of being matched separately."""
+    expr = match.get(order_by)
+    if not expr or any(op not in RANGE_OPERATORS for op in expr):
+        return {}, match
+    return expr, {attr: e for attr, e in match.items() if attr != order_by}
+
+
 def make_empty_array(dtype: str):
     """Shorthand for making a length-0 numpy array."""
     return np.empty(0, dtype=dtype)
@@ -121,7 +307,17 @@ def cyk_intersect(s1: Int64Set, s2: Int64Set) -> Int64Set:
     return s1.intersection(s2) if len(s1) < len(s2) else s2.intersection(s1)
 
 
-def cyk_union(s1: Int64Set, s2: Int64Set) -> Int64Set:
-    """Cykhash unions are faster on big.union(small); handle that appropriately.
-    https://github.com/realead/cykhash/issues/7"""
-    return s1.union(s2) if len(s1) > len(s2) else s2.union(s1)
+def build_indexes(
+    make_index: Callable[[Any], Any],
+    attrs: Iterable[Union[str, Callable]],
+    workers: Optional[int] = None,
+) -> Dict:
+    """Build an index for each attribute by calling ``make_index(attr)``.
+    The indexes are independent, so with ``workers`` > 1 they are built concurrently in a thread pool."""
+    attrs = list(attrs)
+    if workers is not None and workers < 1:
+        raise ValueError("workers must be at least 1.")
+    if workers is None or workers == 1 or len(attrs) == 1:
+        return {attr: make_index(attr) for attr in attrs}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(attrs, pool.map(make_index, attrs)))
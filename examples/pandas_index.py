@@ -24,21 +24,11 @@ objs = [
 # put them in a dataframe
 df = pd.DataFrame(objs)
 
-
-# make lookup functions that match attributes to dataframe rows
-def get_fruit(i):
-    """Get the fruit for this position in the df"""
-    return df.iloc[i]["fruit"]
-
-
-def get_size(i):
-    return df.iloc[i]["size"]
-
-
-# Build index
-dex = FrozenDex(list(range(len(df))), [get_fruit, get_size])
+# Build index directly from the dataframe columns.
+# The FrozenDex contains row positions 0 to len(df)-1.
+dex = FrozenDex.from_columns(df)
 
 
 # Perform index lookups
-rows = df.iloc[dex[{get_fruit: "apple", get_size: {">=": 8}}]]
+rows = df.iloc[dex[{"fruit": "apple", "size": {">=": 8}}]]
 print(rows)
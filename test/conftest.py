@@ -1,7 +1,17 @@
+import operator
+from typing import Any
+from typing import Dict
+from typing import List
+
 import pytest
+from ducks import ANY
 from ducks import ConcurrentDex
 from ducks import Dex
 from ducks import FrozenDex
+from ducks.constants import SIZE_THRESH
+from ducks.utils import parse_query
+
+RANGE_OPS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
 
 
 @pytest.fixture(params=[Dex, FrozenDex, ConcurrentDex])
@@ -41,3 +51,79 @@ class Attr:
 
     def __lt__(self, other):
         return self.n < other.n
+
+
+class Unhashable:
+    __hash__ = None
+
+    def __init__(self, n):
+        self.n = n
+
+    def __eq__(self, other):
+        return self.n == other.n
+
+    def __lt__(self, other):
+        return self.n < other.n
+
+
+def make_objs(n: int = 3 * SIZE_THRESH) -> List[dict]:
+    """Make dicts with an attribute for each shape of values that the indexes store differently:
+    - i: unique values
+    - big: two values, each shared by half the objects
+    - few: ten values, each shared by a tenth of the objects
+    - mixed: one value shared by half the objects, and unique ones
+    - some: a few floats, each shared by several objects; None on some objects, and missing from others
+    """
+    objs = []
+    for i in range(n):
+        obj = {"i": i, "big": i % 2, "few": i % 10, "mixed": i if i % 2 else -1}
+        if i % 5:
+            obj["some"] = None if i % 7 == 0 else float(i % 11)
+        objs.append(obj)
+    return objs
+
+
+def brute_force(objs: List[dict], query: Dict) -> List[dict]:
+    """Find the objs that match the query by checking each one. Query results are tested against this."""
+    return brute_force_terms(objs, *parse_query(query))
+
+
+def brute_force_terms(objs: List[dict], match: Dict, exclude: Dict) -> List[dict]:
+    """Find the objs that match every term in match and no term in exclude. The terms are standardized, as
+    parse_query returns them."""
+    return [
+        o
+        for o in objs
+        if all(_term_matches(o, attr, expr) for attr, expr in match.items())
+        and not any(_term_matches(o, attr, expr) for attr, expr in exclude.items())
+    ]
+
+
+def _term_matches(obj: dict, attr: Any, expr: Dict) -> bool:
+    if attr not in obj:
+        return False
+    val = obj[attr]
+    for op, x in expr.items():
+        if op == "in":
+            if not any(_same_value(val, v) for v in x):
+                return False
+        elif op == "==":
+            if not _same_value(val, x):
+                return False
+        elif x is None or val is None or not RANGE_OPS[op](val, x):
+            # None is only found by ==
+            return False
+    return True
+
+
+def _same_value(val: Any, x: Any) -> bool:
+    if x is ANY:
+        return True
+    if val is None or x is None:
+        return val is x
+    return val == x
+
+
+def ids(objs) -> List[int]:
+    """Get the sorted ids of the objects, to compare results that may be in different orders."""
+    return sorted(map(id, objs))
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+from ducks import FrozenDex
+from ducks import load_mmap
+from ducks import save_mmap
+from ducks.aggregate import compute_aggregates
+from ducks.constants import SIZE_THRESH
+from ducks.exceptions import AttributeNotFoundError
+
+from .conftest import AssertRaises
+
+OPS = ["count", "sum", "min", "max", "mean", "p0", "p50", "p99", "p99.9", "p100"]
+
+
+def make_objs():
+    objs = []
+    for i in range(5 * SIZE_THRESH):
+        # latency has some values shared by many objects, and many unique ones
+        obj = {"i": i, "svc": i % 4, "latency": 1.5 if i % 3 == 0 else (i % 97) / 7}
+        if i % 11 == 0:
+            obj["latency"] = None
+        if i % 13 == 0:
+            del obj["latency"]
+        objs.append(obj)
+    return objs
+
+
+def expected(box, query, ops):
+    values = np.array(
+        [o["latency"] for o in box[query] if o.get("latency") is not None],
+        dtype="float64",
+    )
+    return compute_aggregates(values, ops)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [{}, {"svc": 1}, {"i": {"<": 100}, "svc": {"!=": 2}}, {"i": -1}],
+)
+def test_aggregate(box_class, query):
+    box = box_class(make_objs(), ["i", "svc", "latency"])
+    result = box.aggregate(query, {"latency": OPS, "i": "sum"})
+    assert result["latency"] == pytest.approx(expected(box, query, OPS))
+    assert result["i"] == {"sum": sum(o["i"] for o in box[query])}
+
+
+def test_compute_aggregates():
+    values = np.arange(1, 101)
+    result = compute_aggregates(values, OPS)
+    assert result["count"] == 100
+    assert result["sum"] == 5050 and type(result["sum"]) is int
+    assert (result["min"], result["max"], result["mean"]) == (1, 100, 50.5)
+    assert result["p0"] == 1 and result["p100"] == 100
+    assert result["p50"] == np.percentile(values, 50)
+    empty = compute_aggregates(np.array([]), OPS)
+    assert empty["count"] == 0 and empty["sum"] == 0
+    assert all(empty[op] is None for op in OPS[2:])
+
+
+def test_frozen_column(tmp_path):
+    box = FrozenDex(make_objs(), ["i", "latency", "empty"], compress=True)
+    result = box.aggregate({"i": {">=": 20}}, {"latency": OPS})
+    assert result["latency"] == pytest.approx(expected(box, {"i": {">=": 20}}, OPS))
+    save_mmap(box, tmp_path / "box")
+    box2 = load_mmap(tmp_path / "box")
+    assert box2.aggregate({"i": {">=": 20}}, {"latency": OPS}) == result
+    # no object has the attribute
+    assert box.aggregate({}, {"empty": ["sum", "max"]}) == {
+        "empty": {"sum": 0, "max": None}
+    }
+
+
+def test_from_columns():
+    box = FrozenDex.from_columns({"a": np.arange(1000) % 10, "b": np.arange(1000)})
+    result = box.aggregate({"a": 3}, {"b": ["count", "sum", "max"]})
+    assert result == {"b": {"count": 100, "sum": sum(range(3, 1000, 10)), "max": 993}}
+
+
+def test_aggregate_errors(box_class):
+    box = box_class([{"a": 1, "s": "x"}, {"a": 2, "s": "y"}], ["a", "s"])
+    with AssertRaises(AttributeNotFoundError):
+        box.aggregate({}, {"b": "sum"})
+    with AssertRaises(ValueError):
+        box.aggregate({}, {"a": "median"})
+    with AssertRaises(ValueError):
+        box.aggregate({}, {"a": "p101"})
+    with AssertRaises(ValueError):
+        box.aggregate({}, {"a": "pxyz"})
+    with AssertRaises(TypeError):
+        box.aggregate({}, ["a"])
+    with AssertRaises(TypeError):
+        box.aggregate({}, {"s": "sum"})
+    assert box.aggregate({}, {"a": "sum"}) == {"a": {"sum": 3}}
@@ -0,0 +1,196 @@
+import random
+from collections import Counter
+
+import pytest
+from ducks import ANY
+from ducks import ConcurrentDex
+from ducks import Dex
+from ducks import load
+from ducks import save
+from ducks.mutable.backends import HybridBackend
+from ducks.mutable.backends import IdSetBackend
+from ducks.mutable.backends import SortedBackend
+from ducks.mutable.backends import SortedIds
+
+from .conftest import AssertRaises
+
+
+class SetBackend(IdSetBackend):
+    """A minimal backend, which relies on the base class for everything else"""
+
+    def make(self, ptrs):
+        return set(ptrs)
+
+    def add(self, container, ptrs):
+        container.update(ptrs)
+        return container
+
+    def remove(self, container, ptrs):
+        found = [ptr for ptr in ptrs if ptr in container]
+        container.difference_update(found)
+        return (container if container else None), found
+
+    def size(self, container):
+        return len(container)
+
+    def iterate(self, container):
+        return container
+
+
+BACKENDS = [
+    "hybrid",
+    "sorted",
+    "tuned",
+    HybridBackend(array_size_max=1, set_size_min=2),
+    HybridBackend(array_size_max=50, set_size_min=3),
+    SortedBackend(buffer_min=0, buffer_ratio=1),  # merges on every change
+    SortedBackend(buffer_min=1000),  # never merges in this test
+    {"v": "sorted", "k": HybridBackend(2, 2)},
+    SetBackend(),
+]
+
+
+@pytest.fixture(params=[Dex, ConcurrentDex])
+def mutable_class(request):
+    return request.param
+
+
+def make_obj(rng, i):
+    # 'k' has a few values held by many objects, 'v' has values held by 1 to 100 or so objects
+    obj = {"i": i, "k": i % 5, "v": int(rng.paretovariate(1.2)) % 200}
+    if i % 13 == 0:
+        obj["v"] = None
+    if i % 17 == 0:
+        del obj["v"]
+    return obj
+
+
+def ids(objs):
+    return sorted(map(id, objs))
+
+
+def check(box, objs):
+    assert len(box) == len(objs)
+    for v in [1, 2, 7, 150, 500, None]:
+        expected = [o for o in objs if "v" in o and o["v"] == v]
+        assert ids(box[{"v": v}]) == ids(expected)
+    expected = [o for o in objs if o.get("v") is not None and 3 <= o["v"] < 40]
+    assert ids(box[{"v": {">=": 3, "<": 40}}]) == ids(expected)
+    expected = [o for o in objs if o["k"] == 2 and "v" in o and o["v"] in [1, 4, None]]
+    assert ids(box[{"k": 2, "v": [1, 4, None]}]) == ids(expected)
+    assert ids(box[{"k": 1, "v": ANY}]) == ids(
+        o for o in objs if o["k"] == 1 and "v" in o
+    )
+    assert ids(box[{"v": {"!=": 1}, "k": {"<": 2}}]) == ids(
+        o for o in objs if o["k"] < 2 and o.get("v", 0) != 1
+    )
+    assert box.group_counts({"k": 3}, by="v") == Counter(
+        o["v"] for o in objs if o["k"] == 3 and "v" in o
+    )
+    ordered = box.find({"k": 4}, order_by="v", limit=30)
+    assert [o.get("v") for o in ordered] == sorted(
+        (o["v"] for o in objs if o["k"] == 4 and o.get("v") is not None)
+    )[:30]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backend_mutations(mutable_class, backend):
+    rng = random.Random(42)
+    objs = [make_obj(rng, i) for i in range(1000)]
+    box = mutable_class(objs, ["i", "k", "v"], backend=backend)
+    check(box, objs)
+    for step in range(4):
+        removed = rng.sample(objs, 300)
+        box.remove_many(removed)
+        removed_ids = set(map(id, removed))
+        objs = [o for o in objs if id(o) not in removed_ids]
+        for o in objs[:50]:
+            box.remove(o)
+            o["v"] = rng.randrange(10)
+            box.add(o)
+        added = [make_obj(rng, 1000 * (step + 1) + i) for i in range(200)]
+        box.add_many(added[:100])
+        for o in added[100:]:
+            box.add(o)
+        objs += added
+        check(box, objs)
+    for o in objs[:20]:
+        # changed without telling the Dex; found by searching
+        o["v"] = -1
+    box.remove_many(objs[:20])
+    box.remove(objs[20])
+    check(box, objs[21:])
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backend_pickling(mutable_class, backend, tmp_path):
+    rng = random.Random(1)
+    objs = [make_obj(rng, i) for i in range(500)]
+    box = mutable_class(objs, ["i", "k", "v"], backend=backend)
+    save(box, tmp_path / "box.pkl")
+    box2 = load(tmp_path / "box.pkl")
+    backend, backend2 = box._indexes["v"].backend, box2._indexes["v"].backend
+    assert type(backend2) is type(backend) and vars(backend2) == vars(backend)
+    check(box2, list(box2))
+
+
+def test_per_attribute():
+    box = Dex([{"a": 1, "b": 2}], ["a", "b"], backend={"b": "sorted"})
+    assert type(box._indexes["a"].backend) is HybridBackend
+    assert type(box._indexes["b"].backend) is SortedBackend
+    assert (
+        repr(box._indexes["b"].backend)
+        == "SortedBackend(buffer_min=64, buffer_ratio=8)"
+    )
+
+
+def test_tuned():
+    backend = HybridBackend.tuned()
+    assert 4 <= backend.array_size_max <= 128
+    assert 2 <= backend.set_size_min <= backend.array_size_max
+    # measured once
+    assert repr(HybridBackend.tuned()) == repr(backend)
+
+
+def test_sorted_ids():
+    backend = SortedBackend(buffer_min=4, buffer_ratio=2)
+    c = backend.make([5, 1, 3])
+    assert type(c) is SortedIds and list(c.ids) == [1, 3, 5]
+    assert c.added is None and c.removed is None
+    c, found = backend.remove(c, [3, 4])
+    assert found == [3]
+    c = backend.add(c, [3, 2])
+    assert 3 not in c.removed and 2 in c.added
+    assert 2 in c and 3 in c and 4 not in c
+    assert sorted(c) == [1, 2, 3, 5] and len(c) == 4
+    # buffers are merged once they hold more than buffer_min changes
+    c = backend.add(c, [10, 11, 12, 13, 14])
+    assert list(c.ids) == [1, 2, 3, 5, 10, 11, 12, 13, 14] and not c.added
+    c, found = backend.remove(c, [1, 2, 3, 5, 10, 11, 12, 13])
+    assert c == 14 and len(found) == 8
+    assert backend.remove(c, [14]) == (None, [14])
+
+
+def test_backend_errors():
+    with AssertRaises(ValueError):
+        Dex([{"a": 1}], "a", backend="roaring")
+    with AssertRaises(ValueError):
+        Dex([{"a": 1}], "a", backend={"a": "roaring"})
+    with AssertRaises(ValueError):
+        HybridBackend(array_size_max=10, set_size_min=12)
+    with AssertRaises(ValueError):
+        HybridBackend(array_size_max=0)
+    with AssertRaises(ValueError):
+        SortedBackend(buffer_ratio=0)
+    # a backend that doesn't define every container operation can't be made
+    with AssertRaises(TypeError):
+        IdSetBackend()
+
+    class NoIterate(IdSetBackend):
+        make = SetBackend.make
+        add = SetBackend.add
+        remove = SetBackend.remove
+        size = SetBackend.size
+
+    with AssertRaises(TypeError):
+        NoIterate()
@@ -1,3 +1,6 @@
+import pickle
+import random
+
 import pytest
 from ducks.btree import BTree
 
@@ -110,3 +113,59 @@ def test_bad_first_insert():
     with AssertRaises(TypeError):
         bt[{"x": 1}] = 5
     bt = BTree()
+
+
+@pytest.mark.parametrize("size", [0, 5, 100, 20000])
+def test_get_range_descending(size):
+    rng = random.Random(size)
+    bt = BTree({2 * i: i for i in range(size)})
+    for i in rng.sample(range(size), size // 3):
+        # deleted keys can still be the separators in the tree's nodes
+        del bt[2 * i]
+    bounds = [None, -1, 0, 7, 8, size, 2 * size, 2 * size + 5]
+    for _ in range(200):
+        lo, hi = rng.choice(bounds), rng.choice(bounds)
+        # as from range_expr_to_args: a missing bound is inclusive
+        include_lo = lo is None or rng.random() < 0.5
+        include_hi = hi is None or rng.random() < 0.5
+        expected = list(bt.get_range(lo, hi, include_lo, include_hi))[::-1]
+        found = list(bt.get_range_descending(lo, hi, include_lo, include_hi))
+        assert found == expected
+        if rng.random() < 0.1:
+            # the keys change between walks
+            key = rng.randrange(-5, 2 * size + 5)
+            if key in bt:
+                del bt[key]
+            else:
+                bt[key] = key
+
+
+def test_get_range_descending_stale():
+    # the key list the walk goes down by is only remade after many changes; results are current before then
+    bt = BTree({i: i for i in range(1000)})
+    assert list(bt.get_range_descending(990)) == list(range(999, 989, -1))
+    for i in range(1000, 1010):
+        bt[i] = i
+    del bt[995]
+    assert list(bt.get_range_descending(990, 1005)) == [
+        v for v in range(1005, 989, -1) if v != 995
+    ]
+    assert bt._key_changes == 11
+    for i in range(1010, 1050):
+        bt[i] = i
+    for i in range(0, 1000, 3):
+        del bt[i]
+    expected = [v for v in range(1049, -1, -1) if v >= 1000 or (v % 3 and v != 995)]
+    assert list(bt.get_range_descending()) == expected
+    assert list(bt.get_range_descending(500, 1010, False, False)) == [
+        v for v in expected if 500 < v < 1010
+    ]
+    assert bt._key_changes == 0 and len(bt._sorted_keys) == len(bt)
+
+
+def test_sorted_keys_not_pickled():
+    bt = BTree({i: i for i in range(10)})
+    assert list(bt.get_range_descending(3, 5)) == [5, 4, 3]
+    bt2 = pickle.loads(pickle.dumps(bt))
+    assert "_sorted_keys" not in bt2.__dict__
+    assert list(bt2.get_range_descending(None, 2)) == [2, 1, 0]
@@ -0,0 +1,123 @@
+import pytest
+from ducks import ANY
+from ducks import ConcurrentDex
+from ducks import Dex
+from ducks.constants import ARRAY_SIZE_MAX
+from ducks.constants import SET_SIZE_MIN
+
+from .conftest import AssertRaises
+
+
+SIZES = [1, 2, SET_SIZE_MIN - 1, SET_SIZE_MIN, ARRAY_SIZE_MAX, ARRAY_SIZE_MAX + 1]
+
+
+@pytest.fixture(params=[Dex, ConcurrentDex])
+def mutable_class(request):
+    return request.param
+
+
+def make_objs(n_per_val):
+    """Objects with values 0 .. len(SIZES) - 1, where value i is shared by SIZES[i] * n_per_val objects."""
+    return [
+        {"n": i, "none": None}
+        for i, size in enumerate(SIZES)
+        for _ in range(size * n_per_val)
+    ]
+
+
+def assert_matches(box, objs):
+    """Check box against the expected contents."""
+    assert len(box) == len(objs)
+    for i in range(len(SIZES)):
+        expected = [o for o in objs if o["n"] == i]
+        assert sorted(map(id, box[{"n": i}])) == sorted(map(id, expected))
+    assert len(box[{"none": None}]) == len(objs)
+    assert len(box[{"n": ANY}]) == len(objs)
+    assert len(box._indexes["n"]) == len(objs)
+    assert len(box._indexes["none"]) == len(objs)
+
+
+@pytest.mark.parametrize("n_existing", [0, 1, 2])
+@pytest.mark.parametrize("n_added", [1, 2])
+def test_add_many(mutable_class, n_existing, n_added):
+    existing = make_objs(n_existing)
+    added = make_objs(n_added)
+    box = mutable_class(existing, on=["n", "none"])
+    box.add_many(added)
+    assert_matches(box, existing + added)
+
+
+@pytest.mark.parametrize("n_existing", [1, 2])
+@pytest.mark.parametrize("keep_every", [2, 3, 1000])
+def test_remove_many(mutable_class, n_existing, keep_every):
+    objs = make_objs(n_existing)
+    box = mutable_class(objs, on=["n", "none"])
+    to_remove = [o for i, o in enumerate(objs) if i % keep_every]
+    box.remove_many(to_remove)
+    assert_matches(box, [o for i, o in enumerate(objs) if i % keep_every == 0])
+
+
+def test_add_many_existing_and_duplicates(mutable_class):
+    objs = make_objs(1)
+    box = mutable_class(objs[:5], on=["n", "none"])
+    box.add_many(objs + objs)
+    assert_matches(box, objs)
+
+
+def test_add_many_missing_attr(mutable_class):
+    objs = [{"n": 1}, {"x": 1}, {"n": None}]
+    box = mutable_class(on=["n"])
+    box.add_many(objs)
+    assert len(box) == 3
+    assert box[{"n": 1}] == [objs[0]]
+    assert len(box[{"n": ANY}]) == 2
+    assert box[{"n": None}] == [objs[2]]
+    assert len(box._indexes["n"]) == 2
+
+
+def test_remove_many_not_present(mutable_class):
+    objs = make_objs(1)
+    box = mutable_class(objs[:-1], on=["n", "none"])
+    with AssertRaises(KeyError):
+        box.remove_many(objs)
+    # nothing was removed
+    assert_matches(box, objs[:-1])
+
+
+def test_remove_many_stale(mutable_class):
+    """Objects whose values changed since they were added can still be removed."""
+    objs = [{"n": i % 3} for i in range(30)] + [{"n": None}]
+    box = mutable_class(objs, on=["n"])
+    objs[0]["n"] = 100
+    del objs[1]["n"]
+    objs[-1]["n"] = 2
+    box.remove_many([objs[0], objs[1], objs[2], objs[-1]])
+    assert len(box) == 27
+    assert len(box._indexes["n"]) == 27
+    assert len(box[{"n": ANY}]) == 27
+    assert box[{"n": None}] == []
+
+
+def test_update_many(mutable_class):
+    objs = make_objs(1)
+    box = mutable_class(objs, on=["n", "none"])
+    for o in objs[::2]:
+        o["n"] = (o["n"] + 1) % len(SIZES)
+    box.update_many(o for o in objs[::2])
+    assert_matches(box, objs)
+
+
+def test_update_many_not_present(mutable_class):
+    objs = make_objs(1)
+    box = mutable_class(objs, on=["n", "none"])
+    with AssertRaises(KeyError):
+        box.update_many(objs + [{"n": 0, "none": None}])
+    assert_matches(box, objs)
+
+
+def test_many_with_nothing(mutable_class):
+    box = mutable_class(on="n")
+    box.add_many([])
+    box.remove_many([])
+    box.update_many([])
+    assert len(box) == 0
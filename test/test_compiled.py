@@ -0,0 +1,100 @@
+import pytest
+from ducks import ANY
+from ducks import Param
+from ducks.compiled import _plan_cache
+from ducks.compiled import get_plan
+from ducks.constants import PLAN_CACHE_SIZE
+from ducks.exceptions import AttributeNotFoundError
+
+from .conftest import AssertRaises
+
+
+def make_box(box_class):
+    objs = [{"a": i % 10, "b": i % 3, "c": i} for i in range(100)]
+    return box_class(objs, ["a", "b", "c"])
+
+
+def ids(objs):
+    return sorted(id(o) for o in objs)
+
+
+@pytest.mark.parametrize(
+    "template, params, query",
+    [
+        ({"a": Param("a")}, {"a": 3}, {"a": 3}),
+        ({"a": {"eq": Param("a")}}, {"a": 3}, {"a": 3}),
+        ({"a": {"in": Param("a")}}, {"a": [1, 2]}, {"a": [1, 2]}),
+        ({"a": {"!=": Param("a")}}, {"a": 3}, {"a": {"!=": 3}}),
+        (
+            {"a": {">": Param("lo"), "<=": Param("hi")}, "b": 1},
+            {"lo": 2, "hi": 5},
+            {"a": {">": 2, "<=": 5}, "b": 1},
+        ),
+        (
+            {"a": Param("x"), "c": {"not in": [3, 13]}, "b": {"!=": Param("x")}},
+            {"x": 3},
+            {"a": 3, "c": {"not in": [3, 13]}, "b": {"!=": 3}},
+        ),
+        ({"a": ANY}, {}, {"a": ANY}),
+        ({}, {}, {}),
+    ],
+)
+def test_compiled_matches_query(box_class, template, params, query):
+    box = make_box(box_class)
+    q = box.compile(template)
+    assert ids(q(**params)) == ids(box[query])
+    # running again with the same params gives the same result
+    assert ids(q(**params)) == ids(box[query])
+
+
+def test_compiled_many_values(box_class):
+    box = make_box(box_class)
+    q = box.compile({"a": Param("a"), "b": {"!=": 0}})
+    for a in range(-1, 11):
+        assert ids(q(a=a)) == ids(box[{"a": a, "b": {"!=": 0}}])
+
+
+def test_compiled_bad_params(box_class):
+    box = make_box(box_class)
+    q = box.compile({"a": Param("a"), "b": {">": Param("b")}})
+    with AssertRaises(TypeError):
+        q(a=1)
+    with AssertRaises(TypeError):
+        q(a=1, b=2, c=3)
+
+
+def test_compile_bad_template(box_class):
+    box = make_box(box_class)
+    with AssertRaises(AttributeNotFoundError):
+        box.compile({"z": Param("z")})
+    with AssertRaises(ValueError):
+        box.compile({"a": [Param("a"), 1]})
+    with AssertRaises(ValueError):
+        box.compile({"a": {"~": Param("a")}})
+    with AssertRaises(TypeError):
+        box.compile([Param("a")])
+
+
+def test_plan_cache():
+    template = {"a": Param("a"), "b": [1, 2]}
+    assert get_plan(template) is get_plan({"a": Param("a"), "b": [1, 2]})
+    # constants are part of the key, including their type
+    assert get_plan(template) is not get_plan({"a": Param("a"), "b": [1, 2.0]})
+    assert get_plan({"a": 1}) is not get_plan({"a": True})
+    assert get_plan({"a": ANY}) is get_plan({"a": ANY})
+    # unhashable values are fine, but aren't cached
+    assert get_plan({"a": {"==": {1}}}) is not get_plan({"a": {"==": {1}}})
+    for i in range(PLAN_CACHE_SIZE + 1):
+        get_plan({"a": i})
+    assert len(_plan_cache) == PLAN_CACHE_SIZE
+
+
+def test_compiled_does_not_mutate(box_class):
+    box = make_box(box_class)
+    template = {"a": {"eq": Param("a")}}
+    q = box.compile(template)
+    q(a=1)
+    assert template == {"a": {"eq": Param("a")}}
+    query = {"a": {"eq": 1}, "b": 1}
+    box[query]
+    assert query == {"a": {"eq": 1}, "b": 1}
@@ -0,0 +1,106 @@
+import pytest
+from ducks import ANY
+from ducks import FrozenDex
+from ducks import load
+from ducks import Param
+from ducks import save
+from ducks.exceptions import AttributeNotFoundError
+from ducks.utils import GREATEST
+from ducks.utils import use_composites
+
+from .conftest import AssertRaises
+from .conftest import brute_force
+from .conftest import ids
+from .conftest import make_objs
+
+ON = ["big", "few", "some", ("big", "few", "some")]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {"big": 1, "few": 3, "some": 4.0},
+        {"big": 1, "few": 3, "some": {">": 2, "<=": 8}},
+        {"big": 0, "few": 4, "some": {">=": 5, "<": 6}},
+        {"big": 0, "few": 4, "some": {"<": 3}},
+        {"big": 0, "few": 4, "some": {"<=": 3}},
+        {"big": 1, "few": 7, "some": {">": 9}},
+        {"big": 1, "few": 7, "some": {">=": 9}},
+        {"big": 1, "few": 7, "some": {">": 100}},
+        {"big": 2, "few": 0, "some": 1.0},
+        {"big": 1, "few": 3, "some": None},
+        {"big": 1, "few": 3},
+    ],
+)
+def test_composite_matches(box_class, query):
+    objs = make_objs()
+    box = box_class(objs, ON)
+    expected = brute_force(objs, query)
+    assert ids(box[query]) == ids(expected)
+    assert box.count(query) == len(expected)
+    assert box.exists(query) == bool(expected)
+
+
+def test_composite_only(box_class):
+    # the attributes don't need their own indexes when the composite covers the query
+    objs = make_objs()
+    box = box_class(objs, [("big", "few")])
+    query = {"big": 0, "few": {">": 5}}
+    assert ids(box[query]) == ids(brute_force(objs, query))
+    q = box.compile({"big": Param("b"), "few": Param("f")})
+    assert ids(q(b=1, f=3)) == ids(brute_force(objs, {"big": 1, "few": 3}))
+    # not covered: 'big' alone, or 'big' with a value the composite doesn't hold
+    with AssertRaises(AttributeNotFoundError):
+        box[{"big": 1}]
+    with AssertRaises(AttributeNotFoundError):
+        box[{"big": 1, "few": None}]
+    # the composite can also be queried directly
+    assert box.get_values(("big", "few")) == {(f % 2, f) for f in range(10)}
+    assert ids(box[{("big", "few"): (1, 3)}]) == ids(q(b=1, f=3))
+
+
+def test_composite_mutations(box_class):
+    if box_class is FrozenDex:
+        return
+    objs = make_objs()
+    box = box_class(objs, ON)
+    query = {"big": 1, "few": 3, "some": {">": 5}}
+    new_objs = [{"big": 1, "few": 3, "some": 10.0}, {"big": 1, "few": 3}]
+    box.add_many(new_objs)
+    box.remove(objs[13])
+    objs[3]["some"] = 24.0
+    box.update(objs[3])
+    remaining = [o for o in objs if o is not objs[13]] + new_objs
+    assert ids(box[query]) == ids(brute_force(remaining, query))
+
+
+def test_composite_pickling(box_class, tmp_path):
+    box = box_class(make_objs(), ON)
+    save(box, tmp_path / "box.pkl")
+    box2 = load(tmp_path / "box.pkl")
+    query = {"big": 1, "few": 3, "some": {"<": 7}}
+    assert ids(box2[query]) == ids(brute_force(list(box2), query))
+
+
+def test_use_composites():
+    indexes = {("a", "b"): None, ("b", "c"): None, "a": None}
+    match = {"a": {"==": 1}, "b": {"==": 2}, "c": {"==": 3}}
+    # the first composite that fits is used; the second overlaps it
+    assert use_composites(indexes, match) == {
+        "c": {"==": 3},
+        ("a", "b"): {"==": (1, 2)},
+    }
+    for trailing in [{"==": ANY}, {"in": [1, 2]}, {"==": 2, "<": 3}, {"<": None}]:
+        match = {"a": {"==": 1}, "b": trailing}
+        assert use_composites(indexes, match) == match
+    match = {"a": {"==": 1, "<": 5}, "b": {"==": 2}}
+    assert use_composites(indexes, match) == match
+    assert use_composites({"a": None}, match) is match
+
+
+def test_greatest():
+    assert 10**100 < GREATEST and "z" < GREATEST and (1, 2) < GREATEST
+    assert GREATEST > 1 and GREATEST >= 1 and not GREATEST < 1
+    assert GREATEST <= GREATEST and not GREATEST > GREATEST
+    assert (1, 5) < (1, GREATEST) < (2,)
+    assert repr(GREATEST) == "GREATEST"
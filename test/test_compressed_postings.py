@@ -0,0 +1,94 @@
+import random
+
+import numpy as np
+import pytest
+from ducks import FrozenDex
+from ducks.constants import SIZE_THRESH
+from ducks.frozen.postings import BitmapPostings
+from ducks.frozen.postings import compress_postings
+from ducks.frozen.postings import postings_to_array
+from ducks.frozen.postings import RunPostings
+
+
+@pytest.mark.parametrize("postings_class", [BitmapPostings, RunPostings])
+@pytest.mark.parametrize(
+    "obj_ids",
+    [
+        [0],
+        [999],
+        [0, 1, 2, 3, 10, 11, 500, 998, 999],
+        list(range(0, 1000, 3)),
+        list(range(100, 900)),
+    ],
+)
+def test_postings(postings_class, obj_ids):
+    n_objs = 1000
+    obj_ids = np.array(obj_ids, dtype="uint32")
+    if postings_class is BitmapPostings:
+        postings = BitmapPostings(obj_ids, n_objs)
+    else:
+        postings = RunPostings(obj_ids)
+    assert len(postings) == len(obj_ids)
+    arr = postings.to_array()
+    assert arr.dtype == obj_ids.dtype
+    assert np.array_equal(arr, obj_ids)
+    all_ids = np.arange(n_objs, dtype="uint32")
+    assert np.array_equal(all_ids[postings.contains(all_ids)], obj_ids)
+
+
+def test_compress_choice():
+    n_objs = 100_000
+    sparse = np.arange(0, n_objs, 1000, dtype="uint32")
+    assert compress_postings(sparse, n_objs) is sparse
+    dense = np.arange(0, n_objs, 2, dtype="uint32")
+    bitmap = compress_postings(dense, n_objs)
+    assert isinstance(bitmap, BitmapPostings)
+    assert bitmap.nbytes < dense.nbytes
+    contiguous = np.arange(5000, 60000, dtype="uint32")
+    runs = compress_postings(contiguous, n_objs)
+    assert isinstance(runs, RunPostings)
+    assert runs.nbytes < contiguous.nbytes
+    assert np.array_equal(postings_to_array(runs), contiguous)
+
+
+def test_compressed_dex_matches_uncompressed():
+    random.seed(1)
+    objs = [
+        {
+            "status": random.choice(["ok"] * 8 + ["error", "pending"]),
+            "sorted": i // 500,
+            "n": random.randrange(100),
+        }
+        for i in range(5000)
+    ]
+    objs.append({"n": None})
+    on = ["status", "sorted", "n"]
+    plain = FrozenDex(objs, on)
+    compressed = FrozenDex(objs, on, compress=True)
+    vals = compressed._indexes["status"].val_to_obj_ids.values()
+    assert any(isinstance(v, BitmapPostings) for v in vals)
+    vals = compressed._indexes["sorted"].val_to_obj_ids.values()
+    assert all(isinstance(v, RunPostings) for v in vals)
+    queries = [
+        {"status": "ok"},
+        {"status": "ok", "sorted": 3},
+        {"status": "error", "n": {"<": 10}},
+        {"status": {"!=": "ok"}},
+        {"status": {"!=": "ok"}, "sorted": {"!=": 2}},
+        {"sorted": {"in": [1, 2]}, "status": {"not in": ["error"]}},
+        {"sorted": {">=": 8}},
+        {"sorted": {"==": 4, "<": 9}},
+        {"status": "ok", "sorted": {"!=": 10}, "n": {"not in": [1, 2, 3]}},
+        {"status": "missing"},
+        {"n": None},
+    ]
+    for q in queries:
+        assert list(compressed[q]) == list(plain[q])
+    assert len(compressed[{"status": "ok"}]) > SIZE_THRESH
+    assert compressed.get_values("status") == {"ok", "error", "pending"}
+
+
+def test_compressed_from_columns():
+    fd = FrozenDex.from_columns({"a": np.arange(1000) // 200}, compress=True)
+    assert list(fd[{"a": 2}]) == list(range(400, 600))
+    assert list(fd[{"a": {"!=": 0}}]) == list(range(200, 1000))
@@ -0,0 +1,68 @@
+import pytest
+from ducks import ANY
+from ducks import FrozenDex
+from ducks.exceptions import AttributeNotFoundError
+
+from .conftest import AssertRaises
+from .conftest import brute_force
+from .conftest import make_objs
+
+# values held by one object (mixed), a few (some), more than fit in an array (few), and more than SIZE_THRESH (big)
+QUERIES = [
+    {},
+    {"mixed": 1},
+    {"some": 3.0},
+    {"few": 2},
+    {"big": 1},
+    {"mixed": -1},
+    {"some": 20.0},
+    {"some": None},
+    {"some": ANY},
+    {"some": {"!=": ANY}},
+    {"few": {"eq": 3}},
+    {"few": [1, 3]},
+    {"few": {">": 1}},
+    {"few": 3, "big": 1},
+    {"few": 3, "big": {"!=": 1}},
+    {"few": {"!=": 3}},
+    {"mixed": 1, "big": 0},
+    {"some": 20.0, "big": 1},
+    {"few": {"<": 0}, "big": 1},
+    {"big": {"not in": [0, 1]}},
+]
+
+ATTRS = ["big", "few", "mixed", "some"]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_count_and_exists(box_class, query):
+    objs = make_objs()
+    box = box_class(objs, ATTRS)
+    n = len(brute_force(objs, query))
+    assert len(box[query]) == n
+    assert box.count(query) == n
+    assert box.exists(query) == (n > 0)
+
+
+def test_count_empty(box_class):
+    box = box_class([], ["few"])
+    assert box.count({}) == 0
+    assert box.count({"few": ANY}) == 0
+    assert not box.exists({})
+
+
+def test_count_bad_attr(box_class):
+    box = box_class(make_objs(), ["few"])
+    with AssertRaises(AttributeNotFoundError):
+        box.count({"c": 1})
+    with AssertRaises(AttributeNotFoundError):
+        box.exists({"c": 1})
+    with AssertRaises(TypeError):
+        box.count([1])
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_count_compressed(query):
+    objs = make_objs()
+    box = FrozenDex(objs, ATTRS, compress=True)
+    assert box.count(query) == len(brute_force(objs, query))
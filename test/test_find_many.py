@@ -0,0 +1,120 @@
+from datetime import date
+from datetime import timedelta
+
+import numpy as np
+import pytest
+from ducks import ANY
+from ducks import ConcurrentDex
+from ducks import Dex
+from ducks import FrozenDex
+from ducks.constants import SIZE_THRESH
+from ducks.exceptions import AttributeNotFoundError
+
+from .conftest import AssertRaises
+from .conftest import brute_force
+from .conftest import ids
+from .conftest import make_objs
+from .conftest import Unhashable
+
+QUERIES = [
+    {"few": 3},
+    {"few": 3, "some": 1.0},
+    {"few": 3, "some": {"!=": 1.0}},
+    {"few": 3},
+    {"some": 1.0, "i": {"<": 100}},
+    {"i": {"<": 100}, "some": 1.0},
+    {"few": [1, 2], "some": None},
+    {"few": {"in": [1, 2]}, "some": {"==": None}},
+    {"some": ANY, "few": {">": 7}},
+    {"few": -1},
+    {},
+    {"some": 1.0, "few": {"not in": [3, 4]}},
+    {"few": 3},
+]
+
+
+def test_find_many(box_class):
+    objs = make_objs()
+    box = box_class(objs, ["i", "few", "some"])
+    results = box.find_many(QUERIES)
+    assert len(results) == len(QUERIES)
+    for query, result in zip(QUERIES, results):
+        assert ids(result) == ids(brute_force(objs, query))
+
+
+def test_find_many_results_independent(box_class):
+    # a repeated query gets its own copy of the result
+    box = box_class(make_objs(), ["few"])
+    first, second = box.find_many([{"few": 3}, {"few": 3}])
+    assert first is not second
+    assert ids(first) == ids(second)
+
+
+@pytest.mark.parametrize("cls", [Dex, ConcurrentDex])
+def test_find_many_cached(cls):
+    objs = make_objs()
+    box = cls(objs, ["i", "few", "some"], cache_size=1000)
+    results = box.find_many(QUERIES)
+    box.remove(objs[3])
+    results = box.find_many(QUERIES)
+    for query, result in zip(QUERIES, results):
+        assert ids(result) == ids(box[query])
+        assert all(o is not objs[3] for o in result)
+
+
+def test_find_many_unhashable(box_class):
+    objs = [{"a": Unhashable(i % 5)} for i in range(50)]
+    box = box_class(objs, "a")
+    queries = [{"a": Unhashable(1)}, {"a": Unhashable(1)}, {"a": [Unhashable(2)]}]
+    assert [len(r) for r in box.find_many(queries)] == [10, 10, 10]
+
+
+def test_find_many_frozen_memo():
+    # terms shared by queries are only looked up once
+    box = FrozenDex(make_objs(), ["i", "few", "some"])
+    calls = []
+    match_attr_expr = box._match_attr_expr
+
+    def counting(attr, expr):
+        calls.append(attr)
+        return match_attr_expr(attr, expr)
+
+    box._match_attr_expr = counting
+    box.find_many(
+        [{"few": 3, "some": {"!=": 1.0}}, {"few": 3}, {"few": 3, "some": 2.0}]
+    )
+    assert calls.count("few") == 1
+
+
+def test_find_many_lookups(box_class):
+    # one value of one attribute per query; FrozenDex looks these up together
+    objs = make_objs()
+    objs[5]["few"] = float("nan")
+    box = box_class(objs, ["few", "some", ("few", "some")])
+    values = [3, None, ANY, float("nan"), 2**70, -1, 3.0, 1, 0.5, True]
+    queries = [{"some": v} for v in values] + [{"few": v} for v in values]
+    queries += [{"few": 1, "some": 1.0}, {("few", "some"): (2, 2.0)}]
+    for query, result in zip(queries, box.find_many(queries)):
+        assert ids(result) == ids(box[query])
+
+
+def test_find_many_typed_columns():
+    n = 3 * SIZE_THRESH
+    box = FrozenDex.from_columns(
+        {"u": np.arange(n, dtype="uint8"), "f": np.arange(n, dtype="float32") / 2}
+    )
+    values = [1, -1, 300, 2**70, 1.0, 0.5]
+    queries = [{"u": v} for v in values] + [{"f": v} for v in values]
+    for query, result in zip(queries, box.find_many(queries)):
+        assert len(result) == box.count(query)
+    days = [date(2020, 1, 1) + timedelta(days=i % 50) for i in range(n)]
+    box = FrozenDex([{"day": d} for d in days], "day")
+    queries = [{"day": days[3]}, {"day": [days[4], days[3]]}, {"day": date(1990, 1, 1)}]
+    assert [len(r) for r in box.find_many(queries)] == [6, 12, 0]
+
+
+def test_find_many_errors(box_class):
+    box = box_class(make_objs(), ["few"])
+    assert box.find_many([]) == []
+    with AssertRaises(AttributeNotFoundError):
+        box.find_many([{"few": 1}, {"z": 1}])
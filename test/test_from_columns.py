@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from ducks import FrozenDex
+from ducks import load
+from ducks import save
+from ducks.constants import SIZE_THRESH
+
+from .conftest import AssertRaises
+
+
+def make_columns(n):
+    return {
+        "i": np.arange(n) % 10,
+        "f": np.arange(n) / 2,
+        "s": np.array(["abc"[i % 3] for i in range(n)]),
+        "o": [None if i % 4 == 0 else (i % 2, "x") for i in range(n)],
+        "d": np.array([f"d{i % 3}" for i in range(n)], dtype="O"),
+    }
+
+
+@pytest.mark.parametrize("n", [10, SIZE_THRESH * 20])
+def test_positions(n):
+    cols = make_columns(n)
+    fd = FrozenDex.from_columns(cols)
+    assert len(fd) == n
+    found = fd[{"i": 3, "s": {"in": ["a", "b"]}}]
+    assert found.dtype.kind == "u"
+    expected = [r for r in range(n) if cols["i"][r] == 3 and cols["s"][r] in ["a", "b"]]
+    assert list(found) == expected
+    assert list(fd[{"f": {"<": 2}}]) == [0, 1, 2, 3]
+    assert list(fd[{"o": None}]) == list(range(0, n, 4))
+    assert list(fd[{"o": (1, "x")}]) == list(range(1, n, 2))
+    assert fd.get_values("s") == {"a", "b", "c"}
+    assert list(fd[{"d": "d1"}]) == list(range(1, n, 3))
+    assert 0 in fd
+    assert n - 1 in fd
+    assert n not in fd
+    assert -1 not in fd
+    assert "a" not in fd
+
+
+def test_with_objs():
+    objs = [{"name": name} for name in ["a", "b", "c"]]
+    fd = FrozenDex.from_columns({"age": [30, 20, 30]}, objs=objs)
+    assert list(fd[{"age": 30}]) == [objs[0], objs[2]]
+    assert objs[1] in fd
+    assert {"name": "b"} not in fd
+
+
+def test_skewed_string_column():
+    # the index doesn't keep a fixed-width copy as wide as the one long string
+    col = np.array(["a", "b"] * 5000 + ["x" * 20000])
+    fd = FrozenDex.from_columns({"s": col})
+    assert fd._indexes["s"].val_arr.dtype == "O"
+    assert list(fd[{"s": "x" * 20000}]) == [10000]
+    assert len(fd[{"s": {"<": "b"}}]) == 5000
+
+
+def test_save_load_positions(tmp_path):
+    fn = tmp_path / "box.pkl"
+    fd = FrozenDex.from_columns({"a": np.arange(10)})
+    save(fd, fn)
+    fd2 = load(fn)
+    assert list(fd2[{"a": {">=": 8}}]) == [8, 9]
+    assert 3 in fd2
+
+
+@pytest.mark.parametrize(
+    "columns, objs",
+    [
+        ({}, None),
+        ({"a": [1, 2], "b": [1, 2, 3]}, None),
+        ({"a": np.zeros((2, 2))}, None),
+        ({"a": [1, 2]}, ["x"]),
+    ],
+)
+def test_bad_columns(columns, objs):
+    with AssertRaises(ValueError):
+        FrozenDex.from_columns(columns, objs)
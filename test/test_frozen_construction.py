@@ -0,0 +1,78 @@
+"""
+FrozenDex pulls all attribute values out in one pass, and stores homogeneous values in typed numpy arrays.
+Check that all the kinds of values still come out right.
+"""
+from types import SimpleNamespace
+
+import pytest
+from ducks import FrozenDex
+from ducks import MissingAttribute
+from ducks.constants import SIZE_THRESH
+from ducks.frozen.init_helpers import make_val_arr
+
+
+@pytest.mark.parametrize(
+    "vals, dtype_kind",
+    [
+        ([3, 1, 2], "i"),
+        ([0.5, -1.5, 2.0], "f"),
+        (["b", "a", "c"], "U"),
+        ([2**70, 1, 2], "O"),
+        (["a\x00", "a", "b"], "O"),
+        ([1, 2.5, 3], "O"),
+        ([(1, 2), (0, 1)], "O"),
+    ],
+)
+def test_make_val_arr(vals, dtype_kind):
+    val_arr = make_val_arr(vals, set(map(type, vals)))
+    assert val_arr.dtype.kind == dtype_kind
+    assert len(val_arr) == len(vals)
+    assert list(val_arr) == vals
+
+
+@pytest.mark.parametrize("n_copies", [1, SIZE_THRESH + 1])
+@pytest.mark.parametrize(
+    "vals",
+    [
+        [3, 1, 2],
+        [0.5, -1.5, 2.0],
+        ["b", "a", "c"],
+        [2**70, 1, 2],
+        ["a\x00", "a", "b"],
+    ],
+)
+def test_typed_values(vals, n_copies):
+    objs = [{"a": v} for v in vals for _ in range(n_copies)]
+    fd = FrozenDex(objs, "a")
+    for v in vals:
+        found = fd[{"a": v}]
+        assert len(found) == n_copies
+        assert all(obj["a"] == v for obj in found)
+    assert fd.get_values("a") == set(vals)
+    assert all(type(v) in [int, float, str] for v in fd.get_values("a"))
+    assert len(fd[{"a": {">": min(vals)}}]) == (len(vals) - 1) * n_copies
+
+
+def test_mixed_object_types():
+    """Dicts, objects, and missing attributes, all in one FrozenDex"""
+    objs = [
+        {"a": 1, "b": "x"},
+        SimpleNamespace(a=2, b="y"),
+        {"b": "z"},
+        SimpleNamespace(a=None),
+        {"a": 1},
+    ]
+
+    def a_plus_one(obj):
+        if isinstance(obj, dict):
+            if "a" not in obj:
+                raise MissingAttribute
+            return obj["a"] + 1
+        return obj.a
+
+    fd = FrozenDex(objs, ["a", "b", a_plus_one])
+    assert list(fd[{"a": 1}]) == [objs[0], objs[4]]
+    assert list(fd[{"a": None}]) == [objs[3]]
+    assert list(fd[{"b": {">": "x"}}]) == [objs[1], objs[2]]
+    assert list(fd[{"b": {"!=": "x"}}]) == objs[1:]
+    assert list(fd[{a_plus_one: 2}]) == [objs[0], objs[1], objs[4]]
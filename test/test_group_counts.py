@@ -0,0 +1,79 @@
+from collections import Counter
+
+import pytest
+from ducks import ANY
+from ducks import FrozenDex
+from ducks import load_mmap
+from ducks import save_mmap
+from ducks.constants import SIZE_THRESH
+from ducks.exceptions import AttributeNotFoundError
+
+from .conftest import AssertRaises
+from .conftest import brute_force
+from .conftest import make_objs
+
+
+N = 5 * SIZE_THRESH
+
+
+def expected_counts(objs, query, by):
+    return Counter(o[by] for o in brute_force(objs, query) if by in o)
+
+
+@pytest.mark.parametrize("by", ["some", "mixed"])
+@pytest.mark.parametrize(
+    "query",
+    [
+        {},
+        {"i": {"<": 50}},
+        {"i": {">=": 100}},
+        {"some": 3.0},
+        {"some": {"!=": 3.0}, "i": {"<": 300}},
+        {"some": ANY},
+        {"i": -1},
+    ],
+)
+def test_group_counts(box_class, query, by):
+    objs = make_objs(N)
+    box = box_class(objs, ["i", "some", "mixed"])
+    assert box.group_counts(query, by=by) == expected_counts(objs, query, by)
+
+
+def test_compressed():
+    objs = make_objs(N)
+    box = FrozenDex(objs, ["i", "some", "mixed"], compress=True)
+    for query in [{}, {"i": {"<": 200}}]:
+        for by in ["some", "mixed"]:
+            assert box.group_counts(query, by=by) == expected_counts(objs, query, by)
+
+
+def test_loaded(tmp_path):
+    objs = make_objs(N)
+    box = FrozenDex(objs, ["i", "some"], compress=True)
+    save_mmap(box, tmp_path / "box")
+    box2 = load_mmap(tmp_path / "box")
+    for query in [{}, {"i": {"<": 200}}]:
+        assert box2.group_counts(query, by="some") == expected_counts(
+            objs, query, "some"
+        )
+
+
+def test_group_counts_mutated(box_class):
+    if box_class is FrozenDex:
+        return
+    objs = make_objs(N)
+    box = box_class(objs, ["i", "some"])
+    box.remove_many(objs[:100])
+    new_obj = {"i": 1, "some": 99.0}
+    box.add(new_obj)
+    objs = objs[100:] + [new_obj]
+    query = {"i": {"<": 150}}
+    assert box.group_counts(query, by="some") == expected_counts(objs, query, "some")
+
+
+def test_group_counts_errors(box_class):
+    box = box_class(make_objs(), ["i", "some"])
+    with AssertRaises(AttributeNotFoundError):
+        box.group_counts({}, by="moon")
+    with AssertRaises(AttributeNotFoundError):
+        box.group_counts({"moon": 1}, by="some")
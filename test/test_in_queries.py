@@ -0,0 +1,92 @@
+"""
+'in' queries look up all their values at once. Make sure large and repetitive value lists give the same result as
+checking each value.
+"""
+import numpy as np
+import pytest
+from ducks import ANY
+from ducks import FrozenDex
+from ducks import load_mmap
+from ducks import save_mmap
+from ducks.constants import SIZE_THRESH
+
+from .conftest import brute_force
+from .conftest import ids
+from .conftest import make_objs
+from .conftest import Unhashable
+
+N = 5 * SIZE_THRESH
+
+
+VALUE_LISTS = [
+    [],
+    [1],
+    list(range(0, N, 2)),
+    list(range(-50, N + 50)) * 2,
+    [2, 2, 2, 1, 2],
+    [None, 4, 4.0, 27.0, float("nan")],
+    [ANY, 5],
+    [10**30, -(10**30), 6, True],
+    [0.5, 8.5, 8, 1.0],
+]
+
+
+@pytest.mark.parametrize("attr", ["mixed", "some"])
+@pytest.mark.parametrize("values", VALUE_LISTS)
+def test_in(box_class, values, attr):
+    objs = make_objs(N)
+    box = box_class(objs, ["i", attr])
+    query = {attr: values}
+    expected = brute_force(objs, query)
+    assert ids(box[query]) == ids(expected)
+    assert box.count(query) == len(expected)
+    # evaluated after a smaller term, and as an exclusion
+    query = {"i": {"<": 100}, attr: values}
+    assert ids(box[query]) == ids(brute_force(objs, query))
+    query = {"i": {"<": 100}, attr: {"not in": values}}
+    assert ids(box[query]) == ids(brute_force(objs, query))
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_in_frozen_saved(tmp_path, compress):
+    objs = make_objs(N)
+    box = FrozenDex(objs, ["i", "mixed", "some"], compress=compress)
+    save_mmap(box, tmp_path / "box")
+    box = load_mmap(tmp_path / "box")
+    for values in VALUE_LISTS:
+        for attr in ["mixed", "some"]:
+            query = {attr: values}
+            assert len(box[query]) == len(brute_force(objs, query))
+            query = {"i": {"<": 100}, attr: values}
+            assert box.count(query) == len(brute_force(objs, query))
+
+
+def test_in_typed_columns():
+    box = FrozenDex.from_columns(
+        {
+            "f": np.arange(N, dtype="float32") / 2,
+            "u": np.arange(N, dtype="uint8"),
+            "s": np.array([f"x{i % 50}" for i in range(N)]),
+            "t": np.arange(N).astype("datetime64[D]"),
+        }
+    )
+    assert len(box[{"f": [0.5, 1, 2**60, -1, 0.5]}]) == 2
+    assert len(box[{"u": [1, 2, -1, 300, 2**70]}]) == 2 * (N // 256 + 1)
+    assert len(box[{"s": ["x1", "x49", "x1\x00", "x100"]}]) == 2 * N // 50
+    days = np.arange(3).astype("datetime64[D]").tolist()
+    assert len(box[{"t": days + days[:1]}]) == 3
+
+
+def test_in_tuples(box_class):
+    objs = [{"v": (i % 5, i % 3)} for i in range(N)]
+    box = box_class(objs, "v")
+    values = [(1, 1), (2, 2), (1, 1), (9, 9)]
+    assert len(box[{"v": values}]) == len([o for o in objs if o["v"] in values])
+
+
+def test_in_unhashable(box_class):
+    # values shared by many objects, and unique ones
+    objs = [{"v": Unhashable(i % 3 if i % 2 else i)} for i in range(N)]
+    box = box_class(objs, "v")
+    values = [Unhashable(1), Unhashable(4), Unhashable(1), Unhashable(-1)]
+    assert len(box[{"v": values}]) == len([o for o in objs if o["v"] in values])
@@ -0,0 +1,177 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from ducks import ConcurrentDex
+from ducks import Dex
+from ducks import load_journal
+from ducks import Observable
+from ducks import start_journal
+from ducks.concurrent.main import READERS
+from ducks.concurrent.main import WRITERS
+from ducks.journal import Journal
+
+from .conftest import AssertRaises
+
+
+@pytest.fixture(params=[Dex, ConcurrentDex])
+def mutable_class(request):
+    return request.param
+
+
+class Thing(Observable):
+    def __init__(self, i):
+        self.i = i
+        self.k = i % 3
+
+
+def make_objs(n=100, start=0):
+    return [{"i": i, "k": i % 3} for i in range(start, start + n)]
+
+
+def contents(box):
+    return sorted((o["i"], o["k"]) for o in box)
+
+
+def check_same(box, box2):
+    assert contents(box) == contents(box2)
+    for k in range(3):
+        assert sorted(o["i"] for o in box2[{"k": k}]) == sorted(
+            o["i"] for o in box[{"k": k}]
+        )
+    assert box2.get_values("i") == box.get_values("i")
+
+
+def make_changes(box, objs):
+    box.add({"i": 1000, "k": 1})
+    box.add_many(make_objs(20, start=2000))
+    box.remove(objs[0])
+    box.remove_many(objs[1:10])
+    box.remove_many([])
+    box.update_many([])
+    objs[10]["k"] = 7
+    box.update(objs[10])
+    for o in objs[11:20]:
+        o["k"] = 8
+    box.update_many(objs[11:20])
+    objs[20]["k"] = 9
+    box.update(objs[20], attrs=["k"])
+
+
+def test_replay(mutable_class, tmp_path):
+    objs = make_objs()
+    box = mutable_class(objs, ["i", "k"])
+    start_journal(box, tmp_path, compact_ratio=None)
+    make_changes(box, objs)
+    box2 = load_journal(tmp_path)
+    assert type(box2) is mutable_class
+    check_same(box, box2)
+    # the loaded box goes on logging, including objects that were added and updated in the log
+    new = box2[{"i": 2005}][0]
+    new["k"] = 100
+    box2.update(new)
+    box2.remove(box2[{"i": 15}][0])
+    box3 = load_journal(tmp_path)
+    check_same(box2, box3)
+    assert sorted(os.listdir(tmp_path)) == ["log.0.pkl", "snapshot.0.pkl"]
+
+
+def test_compaction(mutable_class, tmp_path):
+    objs = make_objs()
+    box = mutable_class(objs, ["i", "k"])
+    journal = start_journal(box, tmp_path, compact_ratio=0.5)
+    for i in range(50):
+        box.add({"i": 100 + i, "k": 0})
+    assert journal.generation > 0
+    # older generations are deleted
+    assert sorted(os.listdir(tmp_path)) == [
+        f"log.{journal.generation}.pkl",
+        f"snapshot.{journal.generation}.pkl",
+    ]
+    box.remove_many([o for o in box if o["i"] % 2])
+    journal.compact()
+    box.remove(box[{"i": 10}][0])
+    check_same(box, load_journal(tmp_path))
+
+
+def test_readers_not_blocked_by_compaction(tmp_path, monkeypatch):
+    box = ConcurrentDex(make_objs(), ["i", "k"])
+    journal = start_journal(box, tmp_path, compact_ratio=0.5)
+    compact = Journal._compact
+    found = []
+
+    def compact_while_querying(self):
+        # a query from another thread finishes while the snapshot is being written
+        pool = ThreadPoolExecutor(1)
+        try:
+            found.append(len(pool.submit(box.find, {"k": 0}).result(timeout=10)))
+        finally:
+            pool.shutdown(wait=False)
+        compact(self)
+
+    monkeypatch.setattr(Journal, "_compact", compact_while_querying)
+    for i in range(50):
+        box.add({"i": 100 + i, "k": 0})
+    assert journal.generation > 0 and found
+    assert not journal.compact_due
+    check_same(box, load_journal(tmp_path))
+
+
+def test_concurrent_priority(tmp_path):
+    box = ConcurrentDex(make_objs(), ["i", "k"], priority=WRITERS)
+    start_journal(box, tmp_path)
+    box2 = load_journal(tmp_path)
+    assert box2.priority == WRITERS != READERS
+    assert box2.box.journal is not None
+
+
+def test_observed(tmp_path):
+    objs = [Thing(i) for i in range(10)]
+    dex = Dex(objs, ["i", "k"], observe=True)
+    journal = start_journal(dex, tmp_path, compact_ratio=None)
+    objs[0].k = 5
+    objs[1].k = 5
+    dex.flush()
+    journal.close()
+    objs[2].k = 5
+    assert len(dex[{"k": 5}]) == 3
+    dex2 = load_journal(tmp_path)
+    assert sorted(o.i for o in dex2[{"k": 5}]) == [0, 1]
+
+
+def test_incomplete_record(tmp_path):
+    objs = make_objs()
+    box = Dex(objs, ["i", "k"])
+    journal = start_journal(box, tmp_path, sync=True, compact_ratio=None)
+    box.remove(objs[0])
+    journal.checkpoint()
+    size = os.path.getsize(tmp_path / "log.0.pkl")
+    box.remove(objs[1])
+    journal.close()
+    # a crash in the middle of writing the last record
+    with open(tmp_path / "log.0.pkl", "r+b") as fh:
+        fh.truncate(os.path.getsize(tmp_path / "log.0.pkl") - 3)
+    box2 = load_journal(tmp_path)
+    assert len(box2) == 99 and box2[{"i": 1}]
+    assert os.path.getsize(tmp_path / "log.0.pkl") == size
+    box2.remove(box2[{"i": 1}][0])
+    assert len(load_journal(tmp_path)) == 98
+
+
+def test_restart_journal(tmp_path):
+    box = Dex(make_objs(), ["i", "k"])
+    start_journal(box, tmp_path).close()
+    box.add({"i": 500, "k": 0})
+    box2 = Dex(make_objs(5), ["i", "k"])
+    journal = start_journal(box2, tmp_path)
+    assert journal.generation == 1
+    assert contents(load_journal(tmp_path)) == contents(box2)
+
+
+def test_errors(tmp_path):
+    with AssertRaises(FileNotFoundError):
+        load_journal(tmp_path / "nothing")
+    with AssertRaises(FileNotFoundError):
+        load_journal(tmp_path)
+    with AssertRaises(TypeError):
+        start_journal([{"i": 1}], tmp_path)
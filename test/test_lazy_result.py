@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from ducks import ConcurrentDex
+from ducks import LazyResult
+
+from .conftest import AssertRaises
+
+
+def make_box(box_class, n=2500):
+    objs = [{"i": i, "even": i % 2 == 0} for i in range(n)]
+    return objs, box_class(objs, ["i", "even"])
+
+
+def ids(objs):
+    return sorted(id(o) for o in objs)
+
+
+@pytest.mark.parametrize(
+    "query", [{}, {"even": True}, {"i": {"<": 10}}, {"i": -1}, {"even": {"!=": True}}]
+)
+def test_lazy_matches_eager(box_class, query):
+    _, box = make_box(box_class)
+    eager = box[query]
+    lazy = box.find(query, lazy=True)
+    assert isinstance(lazy, LazyResult)
+    assert len(lazy) == len(eager)
+    assert ids(lazy) == ids(eager)
+    assert ids(lazy[:]) == ids(eager)
+    assert ids(box.find(query)) == ids(eager)
+
+
+def test_lazy_slicing(box_class):
+    _, box = make_box(box_class)
+    lazy = box.find({"even": True}, lazy=True)
+    everything = list(lazy)
+    first = lazy[:10]
+    assert type(first) is type(box[{}])
+    assert ids(first) == ids(everything[:10])
+    assert ids(lazy[10:20:2]) == ids(everything[10:20:2])
+    assert lazy[0] is everything[0]
+    assert lazy[-1] is everything[-1]
+    with AssertRaises(IndexError):
+        lazy[len(lazy)]
+
+
+def test_lazy_chunks(box_class):
+    _, box = make_box(box_class)
+    lazy = box.find({"i": {">=": 100}}, lazy=True)
+    chunks = list(lazy.chunks(1000))
+    assert [len(c) for c in chunks] == [1000, 1000, 400]
+    assert ids(np.concatenate(chunks)) == ids(lazy)
+    with AssertRaises(ValueError):
+        next(lazy.chunks(0))
+
+
+def test_lazy_early_termination(box_class):
+    """Only the chunks that are consumed get looked up."""
+    _, box = make_box(box_class)
+    lazy = box.find({}, lazy=True)
+    looked_up = []
+    lookup = lazy.lookup
+
+    def counting_lookup(obj_ids):
+        looked_up.append(len(obj_ids))
+        return lookup(obj_ids)
+
+    lazy.lookup = counting_lookup
+    for i, _ in enumerate(lazy):
+        if i == 5:
+            break
+    assert looked_up == [1000]
+
+
+def test_lazy_skips_removed():
+    objs, box = make_box(ConcurrentDex, 10)
+    lazy = box.find({"even": True}, lazy=True)
+    box.remove(objs[0])
+    assert len(lazy) == 5
+    assert ids(lazy) == ids(objs[2::2])
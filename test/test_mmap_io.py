@@ -0,0 +1,87 @@
+from datetime import date
+from datetime import timedelta
+
+import numpy as np
+import pytest
+from ducks import FrozenDex
+from ducks import load_mmap
+from ducks import save_mmap
+from ducks.constants import SIZE_THRESH
+from ducks.frozen.mmap_io import load_mmap_objs
+
+from .conftest import AssertRaises
+
+
+def make_objs(n):
+    objs = [
+        {
+            "i": i % 7,
+            "s": str(i % 3),
+            "d": date(2020, 1, 1) + timedelta(days=i % 50),
+            "t": (i % 2, "x"),
+            "sorted": i // (SIZE_THRESH * 2),
+            "maybe": None if i % 5 == 0 else i,
+        }
+        for i in range(n)
+    ]
+    objs.append({"nothing": True})
+    return objs
+
+
+QUERIES = [
+    {"i": 3},
+    {"i": {"in": [1, 2]}, "s": {"!=": "0"}},
+    {"d": {">=": date(2020, 2, 1)}},
+    {"t": (1, "x")},
+    {"sorted": {"<": 2}, "i": {"not in": [0]}},
+    {"maybe": None},
+    {"maybe": {">": 500}},
+    {"s": "1", "sorted": 0},
+]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+@pytest.mark.parametrize("n", [10, SIZE_THRESH * 20])
+def test_mmap_round_trip(tmp_path, n, compress):
+    objs = make_objs(n)
+    on = ["i", "s", "d", "t", "sorted", "maybe"]
+    fd = FrozenDex(objs, on, compress=compress)
+    save_mmap(fd, tmp_path / "fd")
+    fd2 = load_mmap(tmp_path / "fd")
+    assert len(fd2) == len(fd)
+    assert isinstance(fd2._indexes["maybe"].obj_id_arr, np.memmap)
+    for q in QUERIES:
+        assert list(fd2[q]) == list(fd[q])
+        assert all(o in fd2 for o in fd2[q])
+    assert (
+        objs[0] not in fd2
+    )  # objects were unpickled, so they are different objects now
+
+    positions = load_mmap(tmp_path / "fd", load_objs=False)
+    obj_arr = load_mmap_objs(tmp_path / "fd")
+    for q in QUERIES:
+        assert list(obj_arr[positions[q]]) == list(fd[q])
+
+
+def test_mmap_positions(tmp_path):
+    fd = FrozenDex.from_columns({"a": np.arange(1000) % 10})
+    save_mmap(fd, tmp_path / "fd")
+    fd2 = load_mmap(tmp_path / "fd")
+    assert list(fd2[{"a": 3}]) == list(range(3, 1000, 10))
+
+
+def test_mmap_empty(tmp_path):
+    fd = FrozenDex([], ["a"])
+    save_mmap(fd, tmp_path / "fd")
+    fd2 = load_mmap(tmp_path / "fd")
+    assert len(fd2) == 0
+    assert len(fd2[{"a": 1}]) == 0
+
+
+def test_mmap_bad_file(tmp_path):
+    fd = FrozenDex([{"a": 1}], ["a"])
+    save_mmap(fd, tmp_path / "fd")
+    with open(tmp_path / "fd" / "arrays.bin", "r+b") as fh:
+        fh.write(b"garbage")
+    with AssertRaises(ValueError):
+        load_mmap(tmp_path / "fd")
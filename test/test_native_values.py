@@ -0,0 +1,146 @@
+"""
+FrozenDex stores homogeneous attribute values in typed numpy arrays and searches them with np.searchsorted.
+Query values of other types still have to compare the way Python would compare them.
+"""
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from ducks import FrozenDex
+
+from .conftest import AssertRaises
+
+
+def test_val_arr_dtypes():
+    objs = [
+        {"i": i, "f": i / 2, "s": str(i), "d": date(2020, 1, 1) + timedelta(days=i)}
+        for i in range(10)
+    ]
+    fd = FrozenDex(objs, ["i", "f", "s", "d"])
+    assert fd._indexes["i"].val_arr.dtype == "int64"
+    assert fd._indexes["f"].val_arr.dtype == "float64"
+    assert fd._indexes["s"].val_arr.dtype.kind == "U"
+    assert fd._indexes["d"].val_arr.dtype == "datetime64[D]"
+
+
+@pytest.mark.parametrize(
+    "expr, expected",
+    [
+        (3, [3]),
+        (3.0, [3]),
+        (3.5, []),
+        (True, [1]),
+        (2**70, []),
+        (-(2**70), []),
+        (Decimal("3"), [3]),
+        (np.int64(3), [3]),
+        ({">": 2**70}, []),
+        ({"<": 2**70}, list(range(10))),
+        ({">": 6.5}, [7, 8, 9]),
+        ({">=": Decimal("6.5"), "<": 8}, [7]),
+        ({">": True, "<=": 3}, [2, 3]),
+    ],
+)
+def test_int_queries(expr, expected):
+    fd = FrozenDex([{"a": i} for i in range(10)], "a")
+    assert sorted(o["a"] for o in fd[{"a": expr}]) == expected
+
+
+@pytest.mark.parametrize(
+    "expr, expected",
+    [
+        (1, [1.0]),
+        (2**60, []),
+        (float("nan"), []),
+        ({"<": 2}, [0.0, 0.5, 1.0, 1.5]),
+        ({">": 2**60}, []),
+    ],
+)
+def test_float_queries(expr, expected):
+    fd = FrozenDex([{"a": i / 2} for i in range(10)], "a")
+    assert sorted(o["a"] for o in fd[{"a": expr}]) == expected
+
+
+@pytest.mark.parametrize(
+    "expr, expected",
+    [
+        (float(2**53), [2**53]),
+        (float(2**53 + 2), [2**53 + 2]),
+        ({">": float(2**53)}, [2**53 + 1, 2**53 + 2]),
+        ({">=": float(2**53 + 2)}, [2**53 + 2]),
+        ({"<": float(2**53)}, [-(2**63)]),
+        ({">": 2.0**51 + 0.5, "<": float(2**53 + 2)}, [2**53, 2**53 + 1]),
+        (1e30, []),
+        ({"<": 1e30}, [-(2**63), 2**53, 2**53 + 1, 2**53 + 2]),
+        ({">": -1e30, "<": -(2.0**62)}, [-(2**63)]),
+    ],
+)
+def test_large_ints_with_float_queries(expr, expected):
+    # float64 can't hold ints past 2**53, so these have to be compared as ints
+    vals = [-(2**63), 2**53, 2**53 + 1, 2**53 + 2]
+    fd = FrozenDex([{"a": v} for v in vals], "a")
+    assert fd._indexes["a"].val_arr.dtype == "int64"
+    assert sorted(o["a"] for o in fd[{"a": expr}]) == expected
+    assert sorted(o["a"] for o in fd.find_many([{"a": expr}])[0]) == expected
+
+
+def test_unsigned_and_bool_columns():
+    fd = FrozenDex.from_columns(
+        {"u": np.arange(5, dtype="uint8"), "b": np.arange(5) % 2 == 0}
+    )
+    assert list(fd[{"u": 3}]) == [3]
+    assert list(fd[{"u": {">": -1, "<": 2}}]) == [0, 1]
+    assert list(fd[{"u": {"<": 2**70}}]) == [0, 1, 2, 3, 4]
+    assert list(fd[{"b": True}]) == [0, 2, 4]
+    assert list(fd[{"b": 0}]) == [1, 3]
+
+
+def test_string_queries():
+    fd = FrozenDex([{"s": s} for s in ["a", "b", "c"]], "s")
+    assert [o["s"] for o in fd[{"s": "b"}]] == ["b"]
+    assert len(fd[{"s": "b\x00"}]) == 0
+    assert [o["s"] for o in fd[{"s": {">": "a\x00"}}]] == ["b", "c"]
+    with AssertRaises(TypeError):
+        fd[{"s": 1}]
+
+
+def test_skewed_string_lengths():
+    # one long string among many short ones would make every element of a fixed-width array that long
+    long_str = "x" * 20000
+    vals = [str(i % 500) for i in range(20000)] + [long_str]
+    fd = FrozenDex([{"s": s} for s in vals], "s")
+    assert fd._indexes["s"].val_arr.dtype == "O"
+    assert [o["s"] for o in fd[{"s": long_str}]] == [long_str]
+    assert len(fd[{"s": "7"}]) == 40
+    assert len(fd[{"s": {">=": "x"}}]) == 1
+    # long strings of about the same length are still stored fixed-width
+    vals = ["y" * 40 + str(i) for i in range(1000)]
+    fd = FrozenDex([{"s": s} for s in vals], "s")
+    assert fd._indexes["s"].val_arr.dtype.kind == "U"
+    assert len(fd[{"s": {"<": "y" * 40 + "2"}}]) == 112
+
+
+def test_datetime_queries():
+    t0 = datetime(2020, 1, 1)
+    objs = [{"t": t0 + timedelta(hours=i)} for i in range(10)]
+    fd = FrozenDex(objs, "t")
+    assert fd._indexes["t"].val_arr.dtype == "datetime64[us]"
+    assert list(fd[{"t": t0 + timedelta(hours=3)}]) == [objs[3]]
+    assert list(fd[{"t": {">": t0 + timedelta(hours=7, minutes=30)}}]) == objs[8:]
+    assert fd.get_values("t") == {o["t"] for o in objs}
+    with AssertRaises(TypeError):
+        fd[{"t": date(2020, 1, 1)}]
+    with AssertRaises(TypeError):
+        fd[{"t": t0.replace(tzinfo=timezone.utc)}]
+
+
+def test_aware_datetimes():
+    t0 = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    objs = [{"t": t0 + timedelta(hours=i)} for i in range(10)]
+    fd = FrozenDex(objs, "t")
+    assert fd._indexes["t"].val_arr.dtype == "O"
+    assert list(fd[{"t": {"<": t0 + timedelta(hours=2)}}]) == objs[:2]
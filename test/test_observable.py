@@ -0,0 +1,166 @@
+import gc
+import sys
+import threading
+
+from ducks import Dex
+from ducks import load
+from ducks import Observable
+from ducks import save
+from ducks.mutable.mutable_attr import MutableAttrIndex
+from ducks.mutable.observable import observers
+
+
+class Thing(Observable):
+    def __init__(self, i):
+        self.i = i
+        self.color = ["red", "blue"][i % 2]
+        self.size = i % 5
+
+
+class Slotted(Observable):
+    __slots__ = ("n",)
+
+    def __init__(self, n):
+        self.n = n
+
+
+def big(obj):
+    return obj.size >= 3
+
+
+def ids(objs):
+    return sorted(map(id, objs))
+
+
+def count_updates(monkeypatch):
+    calls = []
+    update_many = MutableAttrIndex.update_many
+
+    def spy(self, ptrs, objs):
+        calls.append((self.attr, len(ptrs)))
+        update_many(self, ptrs, objs)
+
+    monkeypatch.setattr(MutableAttrIndex, "update_many", spy)
+    return calls
+
+
+def test_assign(monkeypatch):
+    objs = [Thing(i) for i in range(100)]
+    dex = Dex(objs, ["i", "color", big, ("color", "size")], observe=True)
+    calls = count_updates(monkeypatch)
+    for _ in range(10):
+        objs[0].color = "green"
+        objs[1].color = "green"
+    objs[2].i = -2
+    # nothing is applied until the next query
+    assert calls == []
+    assert ids(dex[{"color": "green"}]) == ids(objs[:2])
+    assert ids(dex[{"i": -2}]) == [id(objs[2])]
+    # each index is updated once, with the objects whose attributes in it were assigned
+    assert calls == [("i", 1), ("color", 2), (big, 3), (("color", "size"), 2)]
+    assert ids(dex.find({"color": "green", "size": {">=": 0}})) == ids(objs[:2])
+    objs[3].size = 4
+    assert dex.count({big: True}) == len([o for o in objs if big(o)])
+    del objs[4].color
+    assert dex.exists({"color": "red", "i": 4}) is False
+    assert dex.group_counts({}, by="color")["blue"] == 49
+
+
+def test_flush_and_max_pending(monkeypatch):
+    objs = [Thing(i) for i in range(100)]
+    dex = Dex(objs, ["i", "color"], observe=True, max_pending=10)
+    calls = count_updates(monkeypatch)
+    for o in objs[:9]:
+        o.i = -o.i
+    objs[0].i = 0
+    assert calls == []
+    objs[9].i = -9
+    assert calls == [("i", 10)]
+    objs[10].i = -10
+    dex.flush()
+    dex.flush()
+    assert calls == [("i", 10), ("i", 1)]
+    assert dex.get_values("i") == set(range(-10, 1)) | set(range(11, 100))
+
+
+def test_not_observed():
+    objs = [Thing(i) for i in range(10)]
+    observing = Dex(objs, ["i"], observe=True)
+    plain = Dex(objs, ["i"])
+    other = Dex(objs[5:], ["color"], observe=True)
+    objs[0].i = 100
+    objs[0].color = "green"
+    assert ids(observing[{"i": 100}]) == [id(objs[0])]
+    assert plain[{"i": 100}] == []
+    assert other._pending == {}
+    # objects removed from the Dex aren't tracked
+    objs[1].i = 101
+    observing.remove(objs[1])
+    observing.remove_many(objs[2:4])
+    objs[2].i = 102
+    assert observing._pending == {}
+    assert len(observing) == 7
+    # a manual update leaves nothing pending
+    objs[5].i = 105
+    objs[6].i = 106
+    observing.update(objs[5])
+    observing.update_many([objs[6]])
+    assert observing._pending == {}
+    objs[7].i = 107
+    observing.update(objs[7], attrs=["i"])
+    assert ids(observing[{"i": {">": 100}}]) == ids(objs[5:8])
+
+
+def test_slotted_and_lazy():
+    objs = [Slotted(n) for n in [1, 2, 2]]
+    dex = Dex(objs, ["n"], observe=True, cache_size=10)
+    assert len(dex[{"n": 2}]) == 2
+    objs[0].n = 2
+    assert list(dex.find({"n": 2}, lazy=True)) == dex[{"n": 2}]
+    objs[1].n = 5
+    assert dex.aggregate({}, {"n": "sum"}) == {"n": {"sum": 9}}
+
+
+def test_pickling(tmp_path):
+    objs = [Thing(i) for i in range(10)]
+    dex = Dex(objs, ["i"], observe=True, max_pending=5)
+    objs[0].i = 50
+    save(dex, tmp_path / "dex.pkl")
+    dex2 = load(tmp_path / "dex.pkl")
+    assert dex2.observe and dex2.max_pending == 5
+    assert dex2[{"i": 50}][0].i == 50
+    dex2[{"i": 1}][0].i = 51
+    assert len(dex2[{"i": 51}]) == 1
+
+
+def test_observers_are_weak():
+    n = len(observers)
+    dex = Dex([Thing(1)], ["i"], observe=True)
+    assert len(observers) == n + 1
+    del dex
+    gc.collect()
+    assert len(observers) == n
+
+
+def test_dexes_created_during_assignment():
+    objs = [Thing(i) for i in range(10)]
+    dexes = [Dex(objs, ["i"], observe=True) for _ in range(50)]
+    stop = threading.Event()
+
+    def churn():
+        while not stop.is_set():
+            Dex([], ["i"], observe=True)
+
+    thread = threading.Thread(target=churn)
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    thread.start()
+    try:
+        for n in range(5000):
+            objs[n % 10].i = n
+    finally:
+        stop.set()
+        thread.join()
+        sys.setswitchinterval(interval)
+    for dex in dexes:
+        assert ids(dex[{"i": 4999}]) == ids([objs[9]])
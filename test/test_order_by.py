@@ -0,0 +1,145 @@
+import pytest
+from ducks import ANY
+from ducks import FrozenDex
+from ducks.constants import ORDER_BLOCK_SIZE
+from ducks.constants import SIZE_THRESH
+from ducks.exceptions import AttributeNotFoundError
+from ducks.frozen.postings import postings_to_array
+
+from .conftest import AssertRaises
+
+N = 3 * ORDER_BLOCK_SIZE
+
+
+def make_objs():
+    objs = []
+    for i in range(N):
+        obj = {"i": i, "k": i % 7}
+        if i % 11:
+            # mostly unique values, plus a couple that are shared by many objects
+            obj["v"] = None if i % 13 == 0 else (i * 7919) % 1000 if i % 4 else 500
+            if i % 5 == 0:
+                obj["v"] = 250
+        objs.append(obj)
+    return objs
+
+
+def sort_key(obj):
+    """Sort like find() does: values in order, then None, then missing. Returns a key for the value group."""
+    if "v" not in obj:
+        return 2, 0
+    if obj["v"] is None:
+        return 1, 0
+    return 0, obj["v"]
+
+
+def expected_groups(objs, descending):
+    valued = sorted((o for o in objs if sort_key(o)[0] == 0), key=sort_key)
+    if descending:
+        valued.reverse()
+    rest = sorted((o for o in objs if sort_key(o)[0] > 0), key=sort_key)
+    return [sort_key(o) for o in valued + rest]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {},
+        {"k": 3},
+        {"k": {"!=": 3}},
+        {"v": {">": 100, "<=": 600}},
+        {"v": {"<": 500}, "k": [1, 2]},
+        {"v": 250},
+        {"v": {">": 2000}},
+        {"v": ANY, "k": 0},
+    ],
+)
+def test_order_by(box_class, query):
+    objs = make_objs()
+    box = box_class(objs, ["i", "k", "v"])
+    matches = list(box[query])
+    match_ids = {id(o) for o in matches}
+    for descending in [False, True]:
+        for limit in [None, 0, 1, 50, 2 * ORDER_BLOCK_SIZE, 10 * N]:
+            result = list(
+                box.find(query, order_by="v", descending=descending, limit=limit)
+            )
+            expected = expected_groups(matches, descending)[:limit]
+            assert [sort_key(o) for o in result] == expected
+            assert len({id(o) for o in result}) == len(result)
+            assert all(id(o) in match_ids for o in result)
+            if box_class is FrozenDex:
+                # ties keep their original order, or the reverse of it
+                ties = [o["i"] for o in result if o.get("v") == 250]
+                assert ties == sorted(ties, reverse=descending)
+            lazy = box.find(
+                query, lazy=True, order_by="v", descending=descending, limit=limit
+            )
+            assert [id(o) for o in lazy] == [id(o) for o in result]
+
+
+def test_big_values_ordered(box_class):
+    # values shared by many objects are stored apart from the rest in FrozenDex; they must still come in order
+    objs = [{"v": i % 3 if i < 3 * SIZE_THRESH else i} for i in range(4 * SIZE_THRESH)]
+    box = box_class(objs, "v")
+    result = box.find({}, order_by="v", descending=True)
+    assert [o["v"] for o in result] == sorted((o["v"] for o in objs), reverse=True)
+    result = box.find({"v": {">=": 1, "<": 3 * SIZE_THRESH + 5}}, order_by="v")
+    assert [o["v"] for o in result] == sorted(
+        o["v"] for o in objs if 1 <= o["v"] < 3 * SIZE_THRESH + 5
+    )
+
+
+def test_limit_only(box_class):
+    objs = make_objs()
+    box = box_class(objs, ["k", "v"])
+    result = box.find({"k": 2}, limit=10)
+    assert len(result) == 10
+    assert all(o["k"] == 2 for o in result)
+    assert len(box.find({"k": 2}, lazy=True, limit=10)) == 10
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_limit_stops_early(monkeypatch, descending):
+    # FrozenDex only decodes the posting lists of the values it reaches
+    objs = [{"v": i % 10} for i in range(20 * SIZE_THRESH)]
+    box = FrozenDex(objs, "v", compress=True)
+    decoded = []
+
+    def counting(postings):
+        decoded.append(len(postings))
+        return postings_to_array(postings)
+
+    monkeypatch.setattr("ducks.frozen.frozen_attr.postings_to_array", counting)
+    result = box.find({}, order_by="v", descending=descending, limit=5)
+    assert [o["v"] for o in result] == [9 if descending else 0] * 5
+    assert decoded == [2 * SIZE_THRESH]
+
+
+def test_order_by_errors(box_class):
+    box = box_class(make_objs(), ["k", "v"])
+    with AssertRaises(AttributeNotFoundError):
+        box.find({}, order_by="i")
+    with AssertRaises(ValueError):
+        box.find({}, descending=True)
+    with AssertRaises(ValueError):
+        box.find({}, order_by="v", limit=-1)
+
+
+def test_order_by_empty(box_class):
+    box = box_class([{"k": 1}], ["k", "v"])
+    assert len(box.find({}, order_by="v")) == 1
+    assert len(box.find({"k": 2}, order_by="v")) == 0
+    assert len(box_class([], ["v"]).find({}, order_by="v", limit=5)) == 0
+
+
+def test_many_values_descending(box_class):
+    # more values than are read from the index at a time
+    objs = make_objs()
+    box = box_class(objs, ["i", "k"])
+    result = box.find({"k": 1, "i": {"<": N - 10}}, order_by="i", descending=True)
+    assert [o["i"] for o in result] == [i for i in range(N - 11, -1, -1) if i % 7 == 1]
+    result = box.find({"k": 1}, order_by="i", descending=True, limit=300)
+    assert [o["i"] for o in result] == [i for i in range(N - 1, -1, -1) if i % 7 == 1][
+        :300
+    ]
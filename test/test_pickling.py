@@ -1,3 +1,9 @@
+import pickle
+
+import ducks
+import pytest
+from ducks import ConcurrentDex
+from ducks import Dex
 from ducks import load
 from ducks import save
 
@@ -15,3 +21,57 @@ def test_save_and_load(box_class, tmp_path):
     assert box2[{"i": {">": 8}}] == [objs2[9]]
     for obj in objs2:
         assert obj in box2
+
+
+n_calls = 0
+
+
+def counted_mod(obj):
+    global n_calls
+    n_calls += 1
+    i = obj.get("i", 0)
+    return i % 25 if i % 7 else None
+
+
+@pytest.mark.parametrize("box_class", [Dex, ConcurrentDex])
+def test_load_does_not_evaluate_attrs(box_class, tmp_path):
+    global n_calls
+    fn = tmp_path / "box.pkl"
+    # values with 1, few, and many objects, so each container type gets saved
+    objs = [{"i": i, "j": i // 5} for i in range(1000)] + [{"x": 1}]
+    box = box_class(objs, ["i", "j", counted_mod])
+    save(box, fn)
+    n_calls = 0
+    box2 = load(fn)
+    assert n_calls == 0
+    objs2 = list(box2)
+    assert len(box2) == len(objs)
+    for attr, val in [("i", 3), ("j", 3), (counted_mod, 3), (counted_mod, None)]:
+        expected = [objs2[j] for j, obj in enumerate(objs) if box_val(obj, attr) == val]
+        assert sorted(box2[{attr: val}], key=id) == sorted(expected, key=id)
+    assert len(box2[{"i": {">=": 990}}]) == 10
+    assert len(box2[{counted_mod: ducks.ANY}]) == 1001
+    assert len(box2._indexes[counted_mod]) == 1001
+    # loaded box is fully mutable
+    box2.remove(objs2[0])
+    box2.add({"i": 3})
+    assert len(box2[{"i": 3}]) == 2
+
+
+def box_val(obj, attr):
+    if attr in ["i", "j"]:
+        return obj.get(attr, "missing")
+    return counted_mod(obj)
+
+
+@pytest.mark.parametrize("box_class", [Dex, ConcurrentDex])
+def test_load_legacy_format(box_class, tmp_path):
+    fn = tmp_path / "box.pkl"
+    saved = {"objs": [{"i": i} for i in range(10)], "on": ["i"]}
+    if box_class is ConcurrentDex:
+        saved["priority"] = "readers"
+    with open(fn, "wb") as fh:
+        pickle.dump(saved, fh)
+    box = load(fn)
+    assert type(box) is box_class
+    assert box[{"i": 3}] == [{"i": 3}]
@@ -0,0 +1,116 @@
+"""
+Queries with several terms are planned: the term that matches the fewest objects is evaluated first, and the other
+terms are checked against its hits. Make sure every combination of term sizes gives the same result as a brute-force
+scan.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from ducks import ANY
+from ducks import FrozenDex
+from ducks.constants import SIZE_THRESH
+
+from .conftest import brute_force_terms
+from .conftest import ids
+from .conftest import make_objs
+
+N = 3 * SIZE_THRESH
+
+
+TERMS = [
+    ("i", {"==": 5}),
+    ("i", {"<": 10}),
+    ("i", {">=": 3, "<": N - 3}),
+    ("i", {"in": [1, 2, 3, N - 1]}),
+    ("i", {"==": float("nan")}),
+    ("big", {"==": 1}),
+    ("big", {">": -1}),
+    ("big", {"in": [0, 1]}),
+    ("mixed", {"==": -1}),
+    ("mixed", {">": 5, "<": 50}),
+    ("mixed", {"in": [-1, 4, 5]}),
+    ("mixed", {"==": 1000}),
+    ("mixed", {"==": ANY}),
+    ("i", {"in": []}),
+    ("never", {"<": 5}),
+    ("some", {"==": ANY}),
+    ("some", {"==": None}),
+    ("some", {"in": [None, 3.0]}),
+    ("some", {"<=": 3.0}),
+]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+@pytest.mark.parametrize("first", TERMS)
+def test_planned_queries(box_class, first, compress):
+    objs = make_objs(N)
+    if box_class is FrozenDex:
+        box = FrozenDex(objs, ["i", "big", "mixed", "some", "never"], compress=compress)
+    else:
+        box = box_class(objs, ["i", "big", "mixed", "some", "never"])
+    for second in TERMS:
+        if second[0] == first[0]:
+            continue
+        for exclude_second in [False, True]:
+            match = {first[0]: first[1]}
+            exclude = {}
+            if exclude_second:
+                exclude[second[0]] = second[1]
+            else:
+                match[second[0]] = second[1]
+            expected = brute_force_terms(objs, match, exclude)
+            result = box._find(match, exclude)
+            assert ids(result) == ids(expected), (match, exclude)
+
+
+def test_estimates(box_class):
+    objs = make_objs(N)
+    box = box_class(objs, ["i", "big", "mixed", "some", "never"])
+    idx = box._indexes
+    cap = N * 10
+    args = [cap] if box_class is not FrozenDex else []
+    assert idx["big"].estimate({"==": 1}, *args) == N // 2
+    assert idx["big"].estimate({"in": [0, 1]}, *args) == N
+    assert idx["i"].estimate({"<": 10}, *args) == 10
+    assert idx["i"].estimate({"<": 10, "==": 3}, *args) == 1
+    assert idx["i"].estimate({}, *args) == 0
+    if box_class is not FrozenDex:
+        # counting stops after the cap
+        assert idx["big"].estimate({"in": [0, 1]}, 10) == N // 2
+        assert idx["big"].estimate({">=": 0}, 10) == N // 2
+        assert idx["i"].estimate({">=": 0}, 10) == 11
+
+
+def test_nan_mask():
+    box = FrozenDex(make_objs(N), ["i"])
+    hits = np.arange(10, dtype=box.dtype)
+    assert not box._indexes["i"].match_mask({"==": float("nan")}, hits).any()
+
+
+def test_ranks_published_when_built(monkeypatch):
+    box = FrozenDex(make_objs(N), ["i"])
+    index = box._indexes["i"]
+    arange = np.arange
+
+    def check_unpublished(*args, **kwargs):
+        # another thread reading now must not see a half-built map
+        assert index.obj_id_to_rank is None
+        return arange(*args, **kwargs)
+
+    monkeypatch.setattr("ducks.frozen.frozen_attr.np.arange", check_unpublished)
+    hits = np.arange(10, dtype=box.dtype)
+    assert index.match_mask({"<": 5}, hits).sum() == 5
+    assert index.obj_id_to_rank is not None
+
+
+def test_threaded_first_queries():
+    objs = make_objs(N)
+    expected = sorted(o["i"] for o in objs if o["big"] == 1 and o["i"] < N // 2)
+    for _ in range(5):
+        box = FrozenDex(objs, ["i", "big"])
+        query = {"big": 1, "i": {"<": N // 2}}
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: box[query], range(8)))
+        for result in results:
+            assert sorted(o["i"] for o in result) == expected
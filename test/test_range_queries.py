@@ -1,6 +1,11 @@
 import pytest
+from ducks import ANY
+from ducks import FrozenDex
 from ducks.constants import SIZE_THRESH
 
+from .conftest import brute_force
+from .conftest import ids
+
 
 @pytest.mark.parametrize(
     "expr, result",
@@ -86,3 +91,45 @@ def test_get_big(box_class, expr):
     found = list(sorted(found, key=lambda o: o["a"]))
     result = list(sorted(result, key=lambda o: o["a"]))
     assert found == result
+
+
+@pytest.mark.parametrize(
+    "expr",
+    [
+        {">": 100},
+        {">=": 100},
+        {"<": 2900},
+        {"<=": 2900},
+        {">": 50, "<=": 2950},
+        {">=": 0},
+        {">": 1000, "<": 2000},
+    ],
+)
+def test_wide_ranges(box_class, expr):
+    # Enough values that a range covering most of them is found by taking the ones outside it away from all IDs.
+    # Some values are shared, so their IDs are stored in arrays and sets.
+    objs = [{"a": i} for i in range(3000)]
+    objs += [{"a": i % 10} for i in range(SIZE_THRESH * 5)]
+    objs += [{"a": None} for _ in range(20)] + [{} for _ in range(20)]
+    box = box_class(objs, "a")
+    assert ids(box[{"a": expr}]) == ids(brute_force(objs, {"a": expr}))
+    assert sorted(map(id, box[{"a": {"==": ANY}}])) == sorted(
+        id(o) for o in objs if "a" in o
+    )
+    if box_class is FrozenDex:
+        return
+    # the set of all IDs is kept current as objects change
+    removed = objs[::7]
+    box.remove_many(removed)
+    objs = [o for i, o in enumerate(objs) if i % 7]
+    added = [{"a": i} for i in range(2500, 3500)] + [{"a": None}]
+    box.add_many(added)
+    objs += added
+    for o in objs[:10]:
+        box.remove(o)
+        o["a"] = -1
+        box.add(o)
+    assert ids(box[{"a": expr}]) == ids(brute_force(objs, {"a": expr}))
+    assert sorted(map(id, box[{"a": {"!=": ANY}}])) == sorted(
+        id(o) for o in objs if "a" not in o
+    )
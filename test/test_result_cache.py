@@ -0,0 +1,159 @@
+import pytest
+from ducks import ANY
+from ducks import ConcurrentDex
+from ducks import Dex
+from ducks import load
+from ducks import save
+from ducks.mutable.result_cache import _may_match
+
+from .conftest import AssertRaises
+from .conftest import Unhashable
+
+
+@pytest.fixture(params=[Dex, ConcurrentDex])
+def mutable_class(request):
+    return request.param
+
+
+def make_box(mutable_class, cache_size=1000):
+    objs = [{"a": i % 10, "b": i % 3} for i in range(30)]
+    return objs, mutable_class(objs, ["a", "b"], cache_size=cache_size)
+
+
+def cache(box):
+    return box.box._cache if isinstance(box, ConcurrentDex) else box._cache
+
+
+def ids(objs):
+    return sorted(map(id, objs))
+
+
+def test_cache_hit(mutable_class):
+    _, box = make_box(mutable_class)
+    first = box[{"a": 1}]
+    assert len(cache(box)) == 1
+    # same query written differently uses the same entry
+    second = box[{"a": {"eq": 1}}]
+    assert len(cache(box)) == 1
+    assert ids(first) == ids(second)
+    # returned lists can be changed without affecting the cache
+    second.clear()
+    assert len(box[{"a": 1}]) == 3
+
+
+def test_add_drops_only_affected(mutable_class):
+    _, box = make_box(mutable_class)
+    queries = [{"a": 1}, {"a": 2}, {"a": {">": 5}}, {"a": [1, 8]}, {"b": ANY}, {}]
+    for q in queries:
+        box[q]
+    box.add({"a": 2, "b": 0})
+    # {"a": 2}, {"b": ANY}, and {} now get the new object; the others are kept
+    assert len(cache(box)) == 3
+    assert len(box[{"a": 2}]) == 4
+    assert len(box[{"b": ANY}]) == 31
+    box.add({"a": 8, "c": 0})
+    assert len(box[{"a": [1, 8]}]) == 7
+    assert len(box[{"a": {">": 5}}]) == 13
+
+
+def test_remove_and_update(mutable_class):
+    objs, box = make_box(mutable_class)
+    box[{"a": 1}]
+    box[{"a": 2}]
+    box.remove(objs[1])
+    assert len(cache(box)) == 1
+    assert len(box[{"a": 1}]) == 2
+    objs[2]["a"] = 1
+    box.update(objs[2])
+    assert len(box[{"a": 1}]) == 3
+    assert len(box[{"a": 2}]) == 2
+
+
+def test_many(mutable_class):
+    objs, box = make_box(mutable_class)
+    box[{"a": 1}]
+    box[{"a": 3}]
+    box.add_many([{"a": 1}, {"a": 4}])
+    assert len(cache(box)) == 1
+    assert len(box[{"a": 1}]) == 4
+    assert len(cache(box)) == 2
+    box.remove_many(objs[3:5])
+    assert len(cache(box)) == 1
+    assert len(box[{"a": 3}]) == 2
+
+
+def test_exclude_and_none(mutable_class):
+    _, box = make_box(mutable_class)
+    assert len(box[{"a": {"!=": 1}, "b": 0}]) == 9
+    box.add({"a": 1, "b": 0})
+    # excluded, but the result is dropped anyway; still correct
+    assert len(box[{"a": {"!=": 1}, "b": 0}]) == 9
+    assert len(box[{"a": None}]) == 0
+    box.add({"a": None})
+    assert len(box[{"a": None}]) == 1
+    box.add({"a": 0, "b": None})
+    assert len(box[{"a": None}]) == 1
+    assert len(box[{"a": {"<": 1}}]) == 4
+
+
+def test_may_match():
+    # values that can't be compared to the query are assumed to match
+    assert _may_match({"a": "x"}, {"a": {"<": 3}})
+    assert _may_match({"a": 1}, {"a": {"is": 2}})
+    assert not _may_match({"a": 1}, {"a": {"<": 1}})
+    assert not _may_match({"a": 1}, {"a": {">=": 2, "<=": 5}})
+    assert _may_match({"a": 1}, {"a": {">": 0, "<=": 5}})
+
+
+def test_lru_bounded_by_size(mutable_class):
+    _, box = make_box(mutable_class, cache_size=10)
+    box[{"a": 1}]  # 3 objects
+    box[{"b": 0}]  # 10 objects; evicts the first
+    assert len(cache(box)) == 1
+    assert cache(box).size == 10
+    box[{"a": 2}]  # evicts {"b": 0}
+    box[{"a": 3}]
+    assert len(cache(box)) == 2
+    box[{}]  # too big to cache
+    assert len(cache(box)) == 2
+    box[{"a": 2}]
+    box[{"a": 4}]  # evicts {"a": 3}, the least recently used
+    assert cache(box).size == 9
+    cache(box).clear()
+    assert cache(box).size == 0
+
+
+def test_unhashable_query(mutable_class):
+    box = mutable_class([{"a": Unhashable(i)} for i in range(3)], "a", cache_size=10)
+    assert len(box[{"a": {"==": Unhashable(1)}}]) == 1
+    assert len(cache(box)) == 0
+    box.add_many([{"a": Unhashable(1)}, {"a": Unhashable(5)}])
+    assert len(box[{"a": {"==": Unhashable(1)}}]) == 2
+    box.remove_many(box[{"a": {"==": Unhashable(1)}}])
+    assert len(box) == 3
+
+
+def test_put_twice(mutable_class):
+    # two readers of a ConcurrentDex can both miss and put the same result
+    _, box = make_box(mutable_class)
+    objs = box[{"a": 1}]
+    key, entry = next(iter(cache(box).results.items()))
+    cache(box).put(key, entry.match, entry.obj_ids, objs)
+    assert len(cache(box)) == 1
+    assert cache(box).size == 3
+
+
+def test_no_cache(mutable_class):
+    _, box = make_box(mutable_class, cache_size=None)
+    assert cache(box) is None
+    with AssertRaises(ValueError):
+        mutable_class([], "a", cache_size=0)
+
+
+def test_pickled_cache_size(mutable_class, tmp_path):
+    _, box = make_box(mutable_class, cache_size=50)
+    box[{"a": 1}]
+    save(box, tmp_path / "box.pkl")
+    box2 = load(tmp_path / "box.pkl")
+    assert cache(box2).max_size == 50
+    assert len(cache(box2)) == 0
@@ -0,0 +1,181 @@
+import random
+
+import numpy as np
+import pytest
+from ducks import ANY
+from ducks import ConcurrentDex
+from ducks import Dex
+from ducks import load
+from ducks import save
+from ducks.mutable.mutable_attr import MutableAttrIndex
+from ducks.mutable.reverse_map import ReverseMap
+
+from .conftest import AssertRaises
+
+
+@pytest.fixture(params=[Dex, ConcurrentDex])
+def mutable_class(request):
+    return request.param
+
+
+def make_objs(n=500):
+    return [{"i": i, "t": i // 3, "tag": ["a", "b", None][i % 3]} for i in range(n)]
+
+
+def no_search(monkeypatch):
+    def fail(self, ptrs):
+        raise AssertionError("searched the index")
+
+    monkeypatch.setattr(MutableAttrIndex, "_remove_by_search", fail)
+
+
+def check(box, objs):
+    assert len(box) == len(objs)
+    for attr, vals in [("i", [0, 5]), ("t", [0, 100]), ("tag", ["a", "c"])]:
+        for val in vals + [None, ANY]:
+            expected = [o for o in objs if attr in o and (val is ANY or o[attr] == val)]
+            assert sorted(map(id, box[{attr: val}])) == sorted(map(id, expected))
+    expected = [o for o in objs if o.get("t") is not None and 10 <= o["t"] < 50]
+    assert sorted(map(id, box[{"t": {">=": 10, "<": 50}}])) == sorted(map(id, expected))
+
+
+def test_remove_changed(mutable_class, monkeypatch):
+    objs = make_objs()
+    box = mutable_class(objs, ["i", "t", "tag"], reverse_map=True)
+    no_search(monkeypatch)
+    for o in objs[:50]:
+        o["t"] = -1
+        o["tag"] = "z"
+        del o["i"]
+    box.remove(objs[0])
+    box.remove_many(objs[1:50])
+    check(box, objs[50:])
+    # added without the attribute, and removed once it has one
+    obj = {"i": -1}
+    box.add(obj)
+    obj["t"] = 3
+    box.remove(obj)
+    check(box, objs[50:])
+    with AssertRaises(KeyError):
+        box.update(obj)
+    with AssertRaises(KeyError):
+        box.update_many([objs[60], obj])
+
+
+def test_update(mutable_class, monkeypatch):
+    rng = random.Random(0)
+    objs = make_objs()
+    box = mutable_class(objs, ["i", "t", "tag"], reverse_map=True)
+    no_search(monkeypatch)
+    for o in rng.sample(objs, 100):
+        change = rng.randrange(4)
+        if change == 0:
+            o["t"] = rng.randrange(200)
+        elif change == 1:
+            o["tag"] = rng.choice(["a", "c", None])
+        elif change == 2:
+            o.pop("tag", None)
+        else:
+            o["i"] = o["i"]
+        box.update(o)
+    check(box, objs)
+    for o in objs[:100]:
+        o["t"] = -o["t"]
+    for o in objs[200:250]:
+        o["tag"] = "b"
+    box.update_many(objs[:300])
+    check(box, objs)
+
+
+def test_update_unchanged():
+    objs = make_objs()
+    box = Dex(objs, ["i", "t", "tag"], reverse_map=True)
+    index = box._indexes["t"]
+    objs[0]["tag"] = "c"
+    objs[1]["t"] = 1000
+    calls = []
+    index.remove = lambda ptr, obj: calls.append(ptr)
+    index.remove_many = lambda ptrs, objs: calls.extend(ptrs)
+    box.update(objs[0])
+    box.update(objs[1])
+    objs[2]["t"] = 1000
+    box.update_many(objs[:3])
+    # only the objects whose 't' changed are removed from the 't' index
+    assert calls == [id(objs[1]), id(objs[2])]
+
+
+def test_without_reverse_map(mutable_class):
+    objs = make_objs()
+    box = mutable_class(objs, ["i", "t", "tag"])
+    for o in objs[:20]:
+        o["t"] = -1
+    box.update_many(objs[:10])
+    box.update(objs[10])
+    box.remove_many(objs[11:20])
+    check(box, objs[:11] + objs[20:])
+
+
+def test_some_attributes():
+    box = Dex(make_objs(), ["i", "t", ("t", "tag")], reverse_map=["t"])
+    assert box._indexes["t"].reverse_map is not None
+    assert box._indexes["i"].reverse_map is None
+    assert box._indexes[("t", "tag")].reverse_map is None
+
+
+def test_cached_results_updated():
+    objs = make_objs()
+    box = Dex(objs, ["t", "tag"], cache_size=1000, reverse_map=True)
+    assert len(box[{"t": 1}]) == 3
+    assert len(box[{"t": 2}]) == 3
+    objs[3]["t"] = 2
+    box.update(objs[3])
+    assert len(box[{"t": 1}]) == 2
+    assert len(box[{"t": 2}]) == 4
+    objs[4]["t"] = 2
+    box.update_many([objs[4]])
+    assert len(box[{"t": 1}]) == 1
+    assert len(box[{"t": 2}]) == 5
+
+
+def test_pickling(mutable_class, tmp_path, monkeypatch):
+    box = mutable_class(make_objs(), ["i", "t", "tag"], reverse_map=["t", "tag"])
+    save(box, tmp_path / "box.pkl")
+    box2 = load(tmp_path / "box.pkl")
+    objs = list(box2)
+    for o in objs[:30]:
+        o["t"] = None
+        o["tag"] = "z"
+    no_search(monkeypatch)
+    box2.remove_many(objs[:30])
+    assert len(box2[{"t": ANY}]) == len(box2) == len(objs) - 30
+    assert len(box2._indexes["tag"].reverse_map) == len(objs) - 30
+
+
+def test_unhashable_values():
+    objs = [{"v": [i % 3]} for i in range(20)] + [{"v": np.arange(2)}]
+    box = Dex(objs[:20], "v", reverse_map=True)
+    for o in objs[:5]:
+        o["v"] = [7]
+    box.update_many(objs[:10])
+    assert len(box[{"v": [[7]]}]) == 5
+    box.remove_many(objs[5:15])
+    assert len(box) == 10
+    # arrays can't be compared with ==, so they count as changed
+    box = Dex([{"v": 1}], "v", reverse_map=True)
+    index = box._indexes["v"]
+    index.reverse_map.set_many([0], np.arange(2))
+    assert not index._is_unchanged(0, objs[20])
+
+
+def test_reverse_map():
+    rmap = ReverseMap()
+    rmap.set_many([10, 11, 12], "x")
+    rmap.set_many([13], None)
+    assert rmap.get(11) == ("x", True) and rmap.get(13) == (None, True)
+    assert rmap.get(99) == (None, False)
+    rmap.discard(11)
+    rmap.discard(99)
+    assert len(rmap) == 3 and rmap.get(11) == (None, False)
+    # the freed slot is reused
+    rmap.set_many([14], "y")
+    assert len(rmap.vals) == 4 and rmap.get(14) == ("y", True)
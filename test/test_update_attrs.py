@@ -0,0 +1,75 @@
+import pytest
+from ducks import ConcurrentDex
+from ducks import Dex
+from ducks.exceptions import AttributeNotFoundError
+from ducks.mutable.mutable_attr import MutableAttrIndex
+
+from .conftest import AssertRaises
+
+
+@pytest.fixture(params=[Dex, ConcurrentDex])
+def mutable_class(request):
+    return request.param
+
+
+def double(obj):
+    return obj["a"] * 2
+
+
+def make_objs():
+    return [{"a": i % 10, "b": i % 7, "c": i % 3} for i in range(200)]
+
+
+def ids(objs):
+    return sorted(map(id, objs))
+
+
+@pytest.mark.parametrize("reverse_map", [False, True])
+def test_update_attrs(mutable_class, reverse_map):
+    objs = make_objs()
+    box = mutable_class(
+        objs, ["a", "b", "c", double, ("b", "c")], reverse_map=reverse_map
+    )
+    for o in objs[:10]:
+        o["b"] = 100
+    box.update(objs[0], attrs=["b"])
+    box.update_many(objs[1:10], "b")
+    assert ids(box[{"b": 100}]) == ids(objs[:10])
+    # the composite index on ('b', 'c') is updated too
+    assert ids(box[{"b": 100, "c": 0}]) == ids(o for o in objs[:10] if o["c"] == 0)
+    assert ids(box.find({("b", "c"): (100, 1)})) == ids(
+        o for o in objs[:10] if o["c"] == 1
+    )
+    objs[20]["a"] = 50
+    box.update(objs[20], attrs=[double])
+    assert ids(box[{double: 100}]) == [id(objs[20])]
+    assert box[{"a": 50}] == []
+    box.update(objs[20])
+    assert ids(box[{"a": 50}]) == [id(objs[20])]
+
+
+def test_only_named_indexes_updated(monkeypatch):
+    objs = make_objs()
+    box = Dex(objs, ["a", "b", "c", ("a", "c")])
+    updated = []
+    monkeypatch.setattr(
+        MutableAttrIndex, "update", lambda self, ptr, obj: updated.append(self.attr)
+    )
+    box.update(objs[0], attrs=["c"])
+    assert updated == ["c", ("a", "c")]
+    updated.clear()
+    box.update(objs[0], attrs=[("a", "c")])
+    assert updated == [("a", "c")]
+
+
+def test_update_attrs_errors(mutable_class):
+    objs = make_objs()
+    box = mutable_class(objs, ["a", ("b", "c")])
+    with AssertRaises(AttributeNotFoundError):
+        box.update(objs[0], attrs=["d"])
+    with AssertRaises(AttributeNotFoundError):
+        box.update_many(objs, attrs=["a", "d"])
+    with AssertRaises(KeyError):
+        box.update({"a": 1}, attrs=["a"])
+    # a component of a composite is fine
+    box.update(objs[0], attrs=["c"])
@@ -0,0 +1,29 @@
+import pytest
+from ducks import FrozenDex
+
+from .conftest import AssertRaises
+
+
+@pytest.mark.parametrize("workers", [None, 1, 4])
+def test_workers(box_class, workers):
+    objs = [{"a": i % 7, "b": i % 3, "c": str(i % 5)} for i in range(1000)]
+    box = box_class(objs, ["a", "b", "c"], workers=workers)
+    found = box[{"a": 2, "b": 1, "c": {"!=": "0"}}]
+    expected = [o for o in objs if o["a"] == 2 and o["b"] == 1 and o["c"] != "0"]
+    assert len(found) == len(expected)
+    assert all(o["a"] == 2 and o["b"] == 1 and o["c"] != "0" for o in found)
+
+
+def test_workers_from_columns():
+    fd = FrozenDex.from_columns({"a": [1, 2, 1], "b": [3, 3, 4]}, workers=2)
+    assert list(fd[{"a": 1, "b": 3}]) == [0]
+
+
+def test_workers_unsortable(box_class):
+    with AssertRaises(TypeError):
+        box_class([{"a": 1}, {"a": "x"}], ["a", "b"], workers=2)
+
+
+def test_bad_workers(box_class):
+    with AssertRaises(ValueError):
+        box_class([{"a": 1}], ["a"], workers=0)